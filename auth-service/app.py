@@ -1,17 +1,101 @@
 from flask import Flask, request, redirect, render_template, session
-import requests
+import os
+import time
+from instrumentation import instrument_app
+from control_panel import (
+    ControlPanelClient,
+    ControlPanelUnavailable,
+    CircuitBreaker,
+    register_metrics
+)
 from database import (
     get_user_by_username,
     get_user_by_email,
     create_user,
     update_last_login,
-    get_all_users
+    get_all_users,
+    get_container_port,
+    update_password,
+    init_token_tables,
+    publish_token_key,
+    revoke_token,
+    revoke_subject,
+    get_token_keys,
+    get_token_denylist
+)
+from passwords import PasswordHasher
+from tokens import (
+    TokenSigner,
+    TokenVerifier,
+    InvalidToken,
+    request_token,
+    register_metrics as register_token_metrics,
+    TOKEN_COOKIE,
+    ADMIN_TOKEN_COOKIE,
+    USER_AUDIENCE,
+    ADMIN_AUDIENCE,
+    ADMIN_ROLE
 )
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = "auth-admin-secret"
 
-CONTROL_PANEL = "http://control-panel:5001"
+CONTROL_PANEL = os.getenv("CONTROL_PANEL_URL", "http://control-panel:5001")
+
+# Per-route latency, DB timers and GET /metrics (Prometheus)
+instrument_app(app, "auth-service")
+
+# Control-panel calls: one keep-alive session, timeouts, retries with jitter
+# and a circuit breaker, so a degraded control panel cannot hang logins
+control_panel = ControlPanelClient(
+    CONTROL_PANEL,
+    connect_timeout=float(os.getenv("CONTROL_PANEL_CONNECT_TIMEOUT", "1")),
+    read_timeout=float(os.getenv("CONTROL_PANEL_TIMEOUT", "3")),
+    retries=int(os.getenv("CONTROL_PANEL_RETRIES", "2")),
+    pool_size=int(os.getenv("CONTROL_PANEL_POOL_SIZE", "32")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("CONTROL_PANEL_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("CONTROL_PANEL_BREAKER_RESET", "30"))
+    ),
+    # Service-role token the control panel requires on its tenant-wide routes
+    token=lambda: tokens.service_token("auth-service", ADMIN_AUDIENCE)
+)
+register_metrics(control_panel)
+
+# scrypt on a process pool (PASSWORD_HASH_PROCESSES per web worker); raise
+# the cost with PASSWORD_SCRYPT_N, stored hashes are upgraded at the next
+# login (benchmarks/password_bench.py picks the parameters)
+passwords = PasswordHasher(
+    n=int(os.getenv("PASSWORD_SCRYPT_N", "16384")),
+    r=int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+    p=int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+    processes=int(os.getenv("PASSWORD_HASH_PROCESSES", "1")),
+    cache_ttl=float(os.getenv("PASSWORD_CACHE_TTL", "300"))
+)
+
+# Signed session tokens, checked by user-app and the control panel without
+# calling back here; each worker signs with its own rotating Ed25519 key
+TOKEN_TTL = int(os.getenv("TOKEN_TTL", "3600"))
+tokens = TokenSigner(publish_token_key, ttl=TOKEN_TTL, rotation=int(os.getenv("TOKEN_KEY_ROTATION", "86400")))
+token_verifier = TokenVerifier(get_token_keys, get_token_denylist,
+                               poll_interval=float(os.getenv("TOKEN_POLL_INTERVAL", "5")))
+register_token_metrics(token_verifier)
+
+def set_token_cookie(response, name, token, claims):
+    # Host-only cookie: sent to every localhost port (user containers, control panel)
+    response.set_cookie(name, token, expires=claims["exp"], httponly=True, samesite="Lax")
+    return response
+
+def revoke_request_token(response, name, audience):
+    """Deny the request's token (if valid) and clear its cookie"""
+    try:
+        claims = token_verifier.verify(request_token(request, name), audience)
+    except InvalidToken:
+        pass
+    else:
+        revoke_token(claims["jti"], claims["exp"] + token_verifier.leeway)
+    response.delete_cookie(name)
+    return response
 
 # ===============================
 # Note: Using shared DB via database.py; ensure admin user exists if needed elsewhere
@@ -33,18 +117,16 @@ def user_register():
         e = request.form["email"]
         p = request.form["password"]
         # Create in shared DB
-        res = create_user(u, e, p)
+        res = create_user(u, e, passwords.hash(p))
         if not res.get("success"):
             return render_template("register.html", error=res.get("error", "Registration failed"))
 
         # Provision container via control-panel
         try:
-            requests.post(
-                f"{CONTROL_PANEL}/api/provision",
-                json={"username":u,"email":e}
-            )
-        except Exception:
-            pass
+            control_panel.provision(u, e)
+        except ControlPanelUnavailable as exc:
+            # The user exists; logins show "being prepared" until an admin re-provisions
+            app.logger.warning("Could not queue provisioning for %s: %s", u, exc)
 
         return redirect("/user/login")
     return render_template("register.html")
@@ -58,21 +140,41 @@ def user_login():
         u = request.form["username"]
         p = request.form["password"]
         user = get_user_by_username(u)
-        if not user or user.get("password") != p:
+        if not user or not passwords.verify(p, user.get("password")):
             return render_template("login.html", error="Invalid login")
+        if passwords.needs_rehash(user["password"]):
+            try:
+                update_password(user["id"], passwords.hash(p))
+            except Exception:
+                app.logger.exception("Could not rehash the password of %s", u)
         try:
             update_last_login(user["id"])
         except Exception:
             pass
 
-        port = requests.get(
-            f"{CONTROL_PANEL}/api/user/{u}/port"
-        ).json()["port"]
-
-        return redirect(f"http://localhost:{port}")
+        try:
+            port = control_panel.user_port(u)
+        except ControlPanelUnavailable:
+            # Control panel down or circuit open: last port it recorded
+            port = get_container_port(u)
+            if not port:
+                return render_template("login.html", error="Service temporarily unavailable, try again in a moment")
+        if not port:
+            # Provisioning is asynchronous; the container may not be up yet
+            return render_template("login.html", error="Your workspace is still being prepared, try again in a moment")
+
+        token, claims = tokens.issue(u, USER_AUDIENCE)
+        return set_token_cookie(redirect(f"http://localhost:{port}"), TOKEN_COOKIE, token, claims)
 
     return render_template("login.html")
 
+# ===============================
+# USER LOGOUT
+# ===============================
+@app.route("/user/logout")
+def user_logout():
+    return revoke_request_token(redirect("/user/login"), TOKEN_COOKIE, USER_AUDIENCE)
+
 # ===============================
 # ADMIN LOGIN (AUTH-SERVICE)
 # ===============================
@@ -81,7 +183,9 @@ def admin_login():
     if request.method == "POST":
         if request.form["username"]=="admin" and request.form["password"]=="admin123":
             session["admin"] = True
-            return redirect("/admin/dashboard")
+            # Also signs the admin into the control panel
+            token, claims = tokens.issue("admin", ADMIN_AUDIENCE, role=ADMIN_ROLE)
+            return set_token_cookie(redirect("/admin/dashboard"), ADMIN_TOKEN_COOKIE, token, claims)
         return render_template("admin_login.html", error="Invalid admin")
 
     return render_template("admin_login.html")
@@ -111,9 +215,11 @@ def admin_delete_user(username):
 
     # delete container too
     try:
-        requests.delete(f"{CONTROL_PANEL}/api/user/{username}")
-    except:
-        pass
+        control_panel.delete_user(username)
+    except ControlPanelUnavailable as exc:
+        app.logger.warning("Could not delete the container of %s: %s", username, exc)
+    # Sign the user out everywhere
+    revoke_subject(username, time.time() + TOKEN_TTL + token_verifier.leeway)
 
     return redirect("/admin/dashboard")
 
@@ -123,9 +229,24 @@ def admin_delete_user(username):
 @app.route("/admin/logout")
 def admin_logout():
     session.clear()
-    return redirect("/admin/login")
+    return revoke_request_token(redirect("/admin/login"), ADMIN_TOKEN_COOKIE, ADMIN_AUDIENCE)
 
 # ===============================
 # RUN
 # ===============================
-app.run(host="0.0.0.0", port=5000)
+def create_app():
+    """App factory for gunicorn ("app:create_app()"); the hashing pool starts on first use"""
+    # On a fresh volume the control panel may not have migrated yet
+    init_token_tables()
+    tokens.start()
+    token_verifier.start()
+    return app
+
+def shutdown():
+    """Stop the password hashing processes and token polling (worker exit)"""
+    passwords.shutdown()
+    token_verifier.stop()
+
+if __name__ == "__main__":
+    # Development server; production runs gunicorn (see gunicorn.conf.py)
+    create_app().run(host="0.0.0.0", port=5000, threaded=True)
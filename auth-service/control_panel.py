@@ -0,0 +1,205 @@
+"""
+Auth Service - Control Panel Client
+Calls to the control-panel API over one keep-alive session, with
+per-call timeouts, retries with jitter and a circuit breaker
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import Callback, instrument_session, registry
+
+logger = logging.getLogger(__name__)
+
+
+class ControlPanelUnavailable(Exception):
+    """The control panel did not answer (or the circuit is open)"""
+
+
+class CircuitOpen(ControlPanelUnavailable):
+    pass
+
+
+def control_panel_endpoint(url):
+    # One series per control-panel route, not per user
+    return re.sub(r"^/api/user/[^/]+", "/api/user/<username>", urlsplit(url).path)
+
+
+# ============================================
+# CIRCUIT BREAKER
+# ============================================
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency for a while.
+
+    After failure_threshold consecutive failed calls the circuit opens and
+    calls fail immediately for reset_timeout seconds. Then one trial call
+    is let through (half-open): success closes the circuit, failure opens
+    it again. A trial that ends without an outcome is released, and one
+    never reported back stops blocking the circuit after reset_timeout.
+    State is per process.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+        self._rejected = 0
+        self._opened = 0
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_running = False
+            if self._state == HALF_OPEN and (
+                    not self._trial_running or now - self._trial_started >= self.reset_timeout):
+                self._trial_running = True
+                self._trial_started = now
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self):
+        """The allowed call ended without a success or failure to record"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Control panel recovered, closing the circuit")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning("Control panel failing, opening the circuit for %ss", self.reset_timeout)
+                    self._opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._opened,
+                "rejected_calls": self._rejected,
+            }
+
+
+# ============================================
+# CLIENT
+# ============================================
+
+class ControlPanelClient:
+    """The control-panel calls auth-service makes.
+
+    Every call has a (connect, read) timeout. Connection errors, timeouts
+    and 5xx answers are retried up to `retries` times after a random
+    ("full jitter") backoff, then count as one failure for the breaker
+    and raise ControlPanelUnavailable. Provisioning is retried safely
+    because each call carries one Idempotency-Key. token(), if given,
+    returns the bearer token sent with every call.
+    """
+
+    def __init__(self, base_url, connect_timeout=1.0, read_timeout=3.0, retries=2,
+                 backoff=0.1, pool_size=32, breaker=None, token=None):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        session = requests.Session()
+        # Enough kept-alive connections for every request thread of the worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self.session = instrument_session(session, endpoint=control_panel_endpoint)
+
+    def _request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpen("control panel circuit is open")
+        recorded = False
+        try:
+            if self.token is not None:
+                kwargs["headers"] = dict(kwargs.get("headers") or {}, Authorization=f"Bearer {self.token()}")
+            error = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+                try:
+                    response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if response.status_code < 500:
+                    recorded = True
+                    self.breaker.record_success()
+                    return response
+                error = f"HTTP {response.status_code}"
+            recorded = True
+            self.breaker.record_failure()
+            raise ControlPanelUnavailable(f"{method} {path}: {error}")
+        finally:
+            if not recorded:
+                # Unexpected error: a half-open trial must not stay taken
+                self.breaker.release()
+
+    def provision(self, username, email):
+        """Queue the user's container; returns the job (dict), or None if refused"""
+        response = self._request("POST", "/api/provision", json={"username": username, "email": email},
+                                 headers={"Idempotency-Key": uuid.uuid4().hex})
+        return response.json() if response.ok else None
+
+    def user_port(self, username):
+        """Host port of the user's container, or None if it is not up yet"""
+        response = self._request("GET", f"/api/user/{username}/port")
+        if not response.ok:
+            return None
+        return response.json().get("port")
+
+    def delete_user(self, username):
+        self._request("DELETE", f"/api/user/{username}")
+
+
+def register_metrics(client):
+    """Expose the circuit breaker on /metrics (summed over the workers)"""
+    registry.register(Callback(
+        "control_panel_circuit_open", "Workers whose control-panel circuit is open",
+        "gauge", lambda: {(): int(client.breaker.state == OPEN)}))
+    registry.register(Callback(
+        "control_panel_rejected_calls_total", "Calls refused while the circuit was open",
+        "counter", lambda: {(): client.breaker.stats()["rejected_calls"]}))
@@ -5,16 +5,21 @@ Shared database for authentication
 
 import sqlite3
 import os
+import time
 from datetime import datetime
 
+from db_pool import ConnectionPool
+from instrumentation import instrument_functions, register_pool
+from token_store import create_token_tables
+
 # Shared database file mounted via Docker volume at /data
-DB_PATH = os.path.join('/data', 'saas_control_panel.db')
+DB_PATH = os.getenv('DB_PATH', os.path.join('/data', 'saas_control_panel.db'))
+
+pool = ConnectionPool(DB_PATH)
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the calling thread's pooled database connection"""
+    return pool.acquire()
 
 def get_user_by_username(username):
     """Get user by username"""
@@ -22,7 +27,6 @@ def get_user_by_username(username):
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE username = ?', (username,))
     user = c.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_user_by_email(email):
@@ -31,21 +35,18 @@ def get_user_by_email(email):
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE email = ?', (email,))
     user = c.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def create_user(username, email, password):
     """Create a new user"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO users (username, email, password)
-            VALUES (?, ?, ?)
-        ''', (username, email, password))
-        conn.commit()
-        user_id = c.lastrowid
-        conn.close()
+        with pool.transaction() as conn:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO users (username, email, password)
+                VALUES (?, ?, ?)
+            ''', (username, email, password))
+            user_id = c.lastrowid
         return {'success': True, 'user_id': user_id}
     except sqlite3.IntegrityError as e:
         if 'username' in str(e):
@@ -57,17 +58,81 @@ def create_user(username, email, password):
 
 def update_last_login(user_id):
     """Update last login timestamp"""
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with pool.transaction() as conn:
+        conn.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
+
+def update_password(user_id, password_hash):
+    """Replace the stored password hash (new cost parameters)"""
+    with pool.transaction() as conn:
+        conn.execute('UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id))
 
 def get_all_users():
     """List all active users (id, username, email)"""
     conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, username, email FROM users WHERE is_active = 1')
-    users = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return users
+    return [dict(row) for row in c.fetchall()]
+
+def get_container_port(username):
+    """Host port recorded for the user's running container, or None
+
+    Last port the control panel wrote to the containers table, used
+    when the control panel itself cannot be reached.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT port, status FROM containers WHERE container_name = ?', (f'user-{username}',))
+    row = c.fetchone()
+    if not row or row['status'] != 'running' or not row['port']:
+        return None
+    return str(row['port'])
+
+def init_token_tables():
+    """Create the token tables if the control panel has not migrated the database yet"""
+    with pool.transaction() as conn:
+        create_token_tables(conn)
+
+def publish_token_key(kid, public_key, expires_at):
+    """Publish a token signing public key; drops expired keys and deny list rows"""
+    now = time.time()
+    with pool.transaction() as conn:
+        conn.execute('DELETE FROM token_keys WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM token_denylist WHERE expires_at <= ?', (now,))
+        conn.execute('''
+            INSERT INTO token_keys (kid, public_key, created_at, expires_at)
+            VALUES (?, ?, ?, ?)
+        ''', (kid, public_key, now, expires_at))
+
+def revoke_token(jti, expires_at):
+    """Deny one token until it would have expired"""
+    with pool.transaction() as conn:
+        conn.execute('''
+            INSERT INTO token_denylist (jti, revoked_at, expires_at)
+            VALUES (?, ?, ?)
+        ''', (jti, time.time(), expires_at))
+
+def revoke_subject(subject, expires_at):
+    """Deny every token issued to subject so far (until expires_at)"""
+    with pool.transaction() as conn:
+        conn.execute('''
+            INSERT INTO token_denylist (subject, revoked_at, expires_at)
+            VALUES (?, ?, ?)
+        ''', (subject, time.time(), expires_at))
+
+def get_token_keys():
+    """{kid: public key} of the token signing keys still in use"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT kid, public_key FROM token_keys WHERE expires_at > ?', (time.time(),))
+    return {row['kid']: row['public_key'] for row in c.fetchall()}
+
+def get_token_denylist():
+    """Revoked tokens and subjects whose tokens may still be unexpired"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT jti, subject, revoked_at FROM token_denylist WHERE expires_at > ?', (time.time(),))
+    return [dict(row) for row in c.fetchall()]
+
+# Time every query function (db_call_duration_seconds on /metrics)
+register_pool(pool, 'auth-service')
+instrument_functions(globals(), exclude=('get_db',))
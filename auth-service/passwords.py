@@ -0,0 +1,192 @@
+"""
+Auth Service - Password Hashing
+scrypt hashes that carry their own cost parameters, computed on a process
+pool, with a short-lived cache of successful verifications
+"""
+
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import Histogram, registry
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+PASSWORD_LATENCY = registry.register(Histogram(
+    "password_hash_duration_seconds", "Password hashing and verification, including the pool queue",
+    ("operation",)))
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def derive(password, salt, n, r, p):
+    """scrypt key of password (runs in the pool processes)"""
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * (n + p) + 2 ** 20, dklen=KEY_BYTES)
+
+
+def encode(salt, key, n, r, p):
+    """'scrypt$<n>$<r>$<p>$<salt>$<key>' (base64 without padding)"""
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(key)}"
+
+
+def parse(stored):
+    """(salt, key, n, r, p) of an encoded hash, or None for anything else"""
+    parts = (stored or "").split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        return _unb64(parts[4]), _unb64(parts[5]), int(parts[1]), int(parts[2]), int(parts[3])
+    except ValueError:
+        return None
+
+
+class PasswordHasher:
+    """Hash and verify passwords off the request threads.
+
+    scrypt is run on `processes` worker processes (0 runs it on the
+    calling thread), so a login burst costs CPU time in the pool but does
+    not hold the GIL of the web worker. Each hash stores its n/r/p: the
+    cost can be raised at any time, and needs_rehash() tells which stored
+    hashes (or legacy plaintext values) to replace at the next login.
+
+    Successful verifications are remembered for cache_ttl seconds under an
+    HMAC of (stored hash, password) with a key that never leaves the
+    process, so repeated logins skip scrypt and a changed password or hash
+    never matches an old entry. Failures are never cached.
+    """
+
+    def __init__(self, n=2 ** 14, r=8, p=1, processes=None, cache_ttl=300, cache_size=10000):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache_key = secrets.token_bytes(32)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._hashed = 0
+        self._verified = 0
+        self._cache_hits = 0
+        self._failures = 0
+
+    # ------------------------------------------
+    # POOL
+    # ------------------------------------------
+
+    def _derive(self, operation, password, salt, n, r, p):
+        start = time.perf_counter()
+        try:
+            if self.processes <= 0:
+                return derive(password, salt, n, r, p)
+            with self._lock:
+                if self._executor is None:
+                    # Created on first use, in the web worker; "spawn" because
+                    # forking a process that runs request threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+                executor = self._executor
+            return executor.submit(derive, password, salt, n, r, p).result()
+        finally:
+            PASSWORD_LATENCY.observe(time.perf_counter() - start, operation)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    # ------------------------------------------
+    # HASHING
+    # ------------------------------------------
+
+    def hash(self, password):
+        salt = secrets.token_bytes(SALT_BYTES)
+        key = self._derive("hash", password, salt, self.n, self.r, self.p)
+        with self._lock:
+            self._hashed += 1
+        return encode(salt, key, self.n, self.r, self.p)
+
+    def verify(self, password, stored):
+        """Whether password matches the stored hash (or legacy plaintext value)"""
+        if not stored or not password:
+            return False
+        cache_key = hmac.new(self._cache_key, f"{stored}\0{password}".encode(), hashlib.sha256).digest()
+        if self._cache_get(cache_key):
+            return True
+
+        parsed = parse(stored)
+        if parsed is None:
+            # Stored before hashing was introduced; replaced on this login
+            ok = hmac.compare_digest(stored.encode(), password.encode())
+        else:
+            salt, key, n, r, p = parsed
+            ok = hmac.compare_digest(self._derive("verify", password, salt, n, r, p), key)
+
+        with self._lock:
+            self._verified += 1
+            if not ok:
+                self._failures += 1
+        if ok and parsed is not None:
+            self._cache_put(cache_key)
+        return ok
+
+    def needs_rehash(self, stored):
+        parsed = parse(stored)
+        return parsed is None or parsed[2:] != (self.n, self.r, self.p)
+
+    # ------------------------------------------
+    # VERIFICATION CACHE
+    # ------------------------------------------
+
+    def _cache_get(self, key):
+        if self.cache_ttl <= 0:
+            return False
+        with self._lock:
+            expires_at = self._cache.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return False
+            self._cache.move_to_end(key)
+            self._cache_hits += 1
+            return True
+
+    def _cache_put(self, key):
+        if self.cache_ttl <= 0:
+            return
+        with self._lock:
+            self._cache[key] = time.monotonic() + self.cache_ttl
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "params": {"n": self.n, "r": self.r, "p": self.p},
+                "processes": self.processes,
+                "hashed": self._hashed,
+                "verified": self._verified,
+                "failures": self._failures,
+                "cache_hits": self._cache_hits,
+                "cached": len(self._cache),
+            }
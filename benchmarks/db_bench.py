@@ -0,0 +1,407 @@
+"""
+SaaS Control Panel - Database Benchmark
+Seeds a SQLite file at a chosen scale and times the public functions of
+control-panel/database.py, single-process and with N concurrent processes.
+
+    python benchmarks/db_bench.py --users 100000 --metrics 50000000 --db /tmp/bench.db
+    python benchmarks/db_bench.py --compare before.json after.json
+
+The seeded file is reused while its scale matches (--reseed forces a new
+one). Results are written as JSON tagged with the git commit.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "shared"), os.path.join(ROOT, "control-panel")]
+
+# Imported after DB_PATH is set (database.py reads it on import)
+D = None
+
+STATUSES = [("running", 70), ("stopped", 25), ("error", 5)]
+ACTIONS = ["container_created", "container_started", "container_stopped", "user_login", "user_registered"]
+
+
+# ============================================
+# SEEDING
+# ============================================
+
+def _ts(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _batches(rows, size=50000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(path, scale, rng):
+    """Fill a freshly initialised database; returns row counts and timings"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    timings = {}
+
+    def load(table, sql, rows):
+        start = time.perf_counter()
+        count = 0
+        for batch in _batches(rows):
+            conn.execute("BEGIN")
+            conn.executemany(sql, batch)
+            conn.execute("COMMIT")
+            count += len(batch)
+        timings[table] = {"rows": count, "seconds": round(time.perf_counter() - start, 2)}
+        print(f"  {table}: {count} rows in {timings[table]['seconds']}s", flush=True)
+
+    users, containers = scale["users"], scale["containers"]
+    statuses = [s for s, weight in STATUSES for _ in range(weight)]
+
+    load("users", "INSERT INTO users (username, email, password, created_at) VALUES (?, ?, ?, ?)", (
+        (f"bench{i}", f"bench{i}@example.com", "x", _ts(now - timedelta(seconds=rng.randrange(365 * 86400))))
+        for i in range(1, users + 1)
+    ))
+    load("containers", '''
+        INSERT INTO containers (user_id, container_id, container_name, port, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)''', (
+        ((i - 1) % users + 1, f"{i:012x}", f"user-bench{i}", 20000 + i % 40000,
+         rng.choice(statuses), _ts(now - timedelta(seconds=rng.randrange(365 * 86400))))
+        for i in range(1, containers + 1)
+    ))
+
+    activity_span = 90 * 86400
+    activity = scale["activity"]
+    load("activity_logs", '''
+        INSERT INTO activity_logs (user_id, container_id, action, details, timestamp)
+        VALUES (?, ?, ?, ?, ?)''', (
+        (rng.randrange(users) + 1, rng.randrange(containers) + 1, rng.choice(ACTIONS), "benchmark row",
+         _ts(now - timedelta(seconds=activity_span - i * activity_span // max(activity, 1))))
+        for i in range(activity)
+    ))
+
+    # Collector order: one sample per container per interval, oldest first
+    interval = scale["metric_interval"]
+    rounds = -(-scale["metrics"] // containers) if containers else 0
+    remaining = scale["metrics"]
+
+    def metric_rows():
+        for r in range(rounds):
+            stamp = _ts(now - timedelta(seconds=(rounds - r) * interval))
+            for cid in range(1, min(containers, remaining - r * containers) + 1):
+                yield (cid, rng.random() * 100, rng.random() * 100, rng.randrange(10**6), rng.randrange(10**6), stamp)
+
+    load("metrics", '''
+        INSERT OR REPLACE INTO metrics (container_id, cpu_percent, memory_percent, network_in, network_out, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)''', metric_rows())
+
+    start = time.perf_counter()
+    conn.execute("ANALYZE")
+    timings["analyze"] = {"seconds": round(time.perf_counter() - start, 2)}
+    conn.close()
+    return timings
+
+
+# ============================================
+# OPERATIONS
+# ============================================
+
+def _user(rng, ctx):
+    return rng.randrange(ctx["users"]) + 1
+
+
+def _container(rng, ctx):
+    return rng.randrange(ctx["containers"]) + 1
+
+
+def _drain(export, limit=10000):
+    _, rows = export
+    for i, _ in enumerate(rows):
+        if i + 1 >= limit:
+            break
+    rows.close()
+
+
+def _unique(ctx):
+    ctx["seq"] += 1
+    return f"b{os.getpid()}x{time.time_ns()}x{ctx['seq']}"
+
+
+# name -> (kind, function(rng, ctx)); writes run after every read
+OPERATIONS = {
+    "get_admin_stats": ("read", lambda rng, ctx: D.get_admin_stats()),
+    "get_admin_stats[aggregate]": ("read", lambda rng, ctx: D.get_admin_stats(mode="aggregate")),
+    "get_all_users": ("read", lambda rng, ctx: D.get_all_users()),
+    "get_all_containers": ("read", lambda rng, ctx: D.get_all_containers()),
+    "get_users_page": ("read", lambda rng, ctx: D.get_users_page(limit=50)),
+    "get_users_page[q]": ("read", lambda rng, ctx: D.get_users_page(limit=50, username_prefix=f"bench{_user(rng, ctx)}")),
+    "get_containers_page": ("read", lambda rng, ctx: D.get_containers_page(limit=50)),
+    "get_containers_page[status]": ("read", lambda rng, ctx: D.get_containers_page(limit=50, status="error")),
+    "get_activity_logs_page": ("read", lambda rng, ctx: D.get_activity_logs_page(limit=50)),
+    "get_user_by_username": ("read", lambda rng, ctx: D.get_user_by_username(f"bench{_user(rng, ctx)}")),
+    "get_user_by_id": ("read", lambda rng, ctx: D.get_user_by_id(_user(rng, ctx))),
+    "get_user_containers": ("read", lambda rng, ctx: D.get_user_containers(_user(rng, ctx))),
+    "get_container_by_name": ("read", lambda rng, ctx: D.get_container_by_name(f"user-bench{_container(rng, ctx)}")),
+    "get_container_ports[50]": ("read", lambda rng, ctx: D.get_container_ports(
+        [f"user-bench{_container(rng, ctx)}" for _ in range(50)])),
+    "get_container_names[running]": ("read", lambda rng, ctx: D.get_container_names(status="running")),
+    "get_user_activity_logs": ("read", lambda rng, ctx: D.get_user_activity_logs(_user(rng, ctx))),
+    "get_all_activity_logs": ("read", lambda rng, ctx: D.get_all_activity_logs()),
+    "get_activity_logs_after": ("read", lambda rng, ctx: D.get_activity_logs_after(ctx["last_log_id"] - 100)),
+    "get_container_metrics[1h]": ("read", lambda rng, ctx: D.get_container_metrics(_container(rng, ctx), hours=1)),
+    "get_container_metrics[7h]": ("read", lambda rng, ctx: D.get_container_metrics(_container(rng, ctx))),
+    "get_container_stats": ("read", lambda rng, ctx: D.get_container_stats(_container(rng, ctx))),
+    "get_container_series[24h/10m,p95]": ("read", lambda rng, ctx: D.get_container_series(
+        _container(rng, ctx), ctx["now"] - 86400, ctx["now"], 600, ("avg", "max", "p95"))),
+    "export_activity_logs[10k]": ("read", lambda rng, ctx: _drain(D.export_activity_logs())),
+    "export_metrics[container]": ("read", lambda rng, ctx: _drain(D.export_metrics(container_id=_container(rng, ctx)))),
+    "get_provisioning_job_counts": ("read", lambda rng, ctx: D.get_provisioning_job_counts()),
+    "store_metric": ("write", lambda rng, ctx: D.store_metric(_container(rng, ctx), rng.random() * 100, rng.random() * 100)),
+    "store_metrics[100]": ("write", lambda rng, ctx: D.store_metrics([
+        {"container_id": _container(rng, ctx), "cpu_percent": rng.random() * 100, "memory_percent": rng.random() * 100}
+        for _ in range(100)])),
+    "log_activity": ("write", lambda rng, ctx: D.log_activity(_user(rng, ctx), None, "benchmark", "log_activity")),
+    "update_last_login": ("write", lambda rng, ctx: D.update_last_login(_user(rng, ctx))),
+    "update_container_status": ("write", lambda rng, ctx: D.update_container_status(
+        _container(rng, ctx), rng.choice(["running", "stopped"]))),
+    "update_container_port": ("write", lambda rng, ctx: D.update_container_port(
+        f"user-bench{_container(rng, ctx)}", 20000 + rng.randrange(40000))),
+    "apply_container_action[10]": ("write", lambda rng, ctx: D.apply_container_action(
+        rng.choice(["start", "stop"]), [f"user-bench{_container(rng, ctx)}" for _ in range(10)])),
+    "create_user": ("write", lambda rng, ctx: D.create_user(_unique(ctx), f"{_unique(ctx)}@example.com", "x")),
+    "create_container+delete_container": ("write", lambda rng, ctx: D.delete_container(
+        D.create_container(_user(rng, ctx), _unique(ctx), f"user-{_unique(ctx)}", None)["container_id"])),
+}
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _summary(latencies, seconds):
+    ordered = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 4)
+    return {
+        "calls": len(ordered),
+        "ops_per_second": round(len(ordered) / seconds, 1) if seconds else None,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(_percentile(ordered, 0.50)),
+        "p95_ms": ms(_percentile(ordered, 0.95)),
+        "p99_ms": ms(_percentile(ordered, 0.99)),
+        "max_ms": ms(ordered[-1] if ordered else None),
+    }
+
+
+def _run(name, ctx, seed_value, iterations, max_seconds, start_at=None):
+    """Call one operation until iterations or max_seconds; returns (latencies, seconds, errors)"""
+    rng = random.Random(seed_value)
+    function = OPERATIONS[name][1]
+    if start_at:
+        time.sleep(max(0.0, start_at - time.time()))
+    latencies = []
+    errors = 0
+    begin = time.perf_counter()
+    deadline = begin + max_seconds
+    while len(latencies) < iterations and time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            function(rng, ctx)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - begin, errors
+
+
+# ============================================
+# WORKERS (concurrent runs)
+# ============================================
+
+_worker_ctx = None
+
+
+def _worker_init(ctx):
+    global D, _worker_ctx
+    import database
+    D = database
+    _worker_ctx = dict(ctx, seq=0)
+
+
+def _worker_run(args):
+    name, seed_value, iterations, max_seconds, start_at = args
+    return _run(name, _worker_ctx, seed_value, iterations, max_seconds, start_at)
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path, threshold):
+    """Print per-operation p50/throughput changes; returns the regressed names"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    regressed = []
+    for mode in ("single", "concurrent"):
+        for name, new in after.get(mode, {}).items():
+            old = before.get(mode, {}).get(name)
+            if not old or not old.get("p50_ms") or not new.get("p50_ms"):
+                continue
+            change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressed.append(f"{mode}:{name}")
+            print(f"{mode:10} {name:40} p50 {old['p50_ms']:>10} -> {new['p50_ms']:>10} ms ({change:+.1f}%){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="/tmp/saas_bench.db")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--containers", type=int, default=None, help="default: one per user")
+    parser.add_argument("--activity", type=int, default=1000000)
+    parser.add_argument("--metrics", type=int, default=5000000)
+    parser.add_argument("--metric-interval", type=int, default=10, help="seconds between seeded samples")
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=2000, help="max calls per operation")
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="time budget per operation")
+    parser.add_argument("--processes", type=int, default=4, help="concurrent processes (0: skip)")
+    parser.add_argument("--only", help="comma-separated operation names")
+    parser.add_argument("--audit-async", action="store_true", help="time log_activity as queued, not written")
+    parser.add_argument("--output", help="default: bench-<commit>-<time>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=20.0, help="p50 %% slowdown flagged by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    scale = {
+        "users": args.users,
+        "containers": args.containers if args.containers is not None else args.users,
+        "activity": args.activity,
+        "metrics": args.metrics,
+        "metric_interval": args.metric_interval,
+        "seed": args.seed,
+    }
+    meta_path = args.db + ".scale.json"
+    reuse = not args.reseed and os.path.exists(args.db) and os.path.exists(meta_path)
+    if reuse:
+        with open(meta_path) as f:
+            reuse = json.load(f) == scale
+    if not reuse:
+        os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+        for suffix in ("", "-wal", "-shm", ".scale.json"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    os.environ["DB_PATH"] = args.db
+    os.environ["AUDIT_SYNC"] = "0" if args.audit_async else "1"
+    global D
+    import database
+    D = database
+    D.init_db()
+
+    seeding = None
+    if not reuse:
+        print(f"Seeding {args.db}: {scale}", flush=True)
+        seeding = seed(args.db, scale, random.Random(args.seed))
+        with open(meta_path, "w") as f:
+            json.dump(scale, f)
+        D.rebuild_stats_counters()
+
+    names = list(OPERATIONS)
+    if args.only:
+        names = [n for n in args.only.split(",") if n in OPERATIONS]
+    # Reads first so writes do not change what they measure
+    names.sort(key=lambda n: OPERATIONS[n][0] == "write")
+
+    ctx = {
+        "users": scale["users"],
+        "containers": scale["containers"],
+        "last_log_id": D.get_last_activity_log_id() or 0,
+        "now": int(time.time()),
+    }
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": scale,
+            "schema_version": D.get_schema_version(),
+            "iterations": args.iterations,
+            "max_seconds": args.max_seconds,
+            "processes": args.processes,
+            "audit": "async" if args.audit_async else "sync",
+        },
+        "seeding": seeding,
+        "single": {},
+        "concurrent": {},
+    }
+
+    print("Single process", flush=True)
+    local_ctx = dict(ctx, seq=0)
+    for name in names:
+        latencies, seconds, errors = _run(name, local_ctx, args.seed, args.iterations, args.max_seconds)
+        results["single"][name] = dict(_summary(latencies, seconds), errors=errors)
+        print(f"  {name:40} {results['single'][name]}", flush=True)
+    D.flush_activity_logs()
+
+    if args.processes > 0:
+        print(f"{args.processes} processes", flush=True)
+        mp = multiprocessing.get_context("spawn")
+        with mp.Pool(args.processes, initializer=_worker_init, initargs=(ctx,)) as workers:
+            for name in names:
+                start_at = time.time() + 0.2
+                parts = workers.map(_worker_run, [
+                    (name, args.seed + i, args.iterations, args.max_seconds, start_at)
+                    for i in range(args.processes)
+                ])
+                latencies = [value for part in parts for value in part[0]]
+                seconds = max(part[1] for part in parts)
+                results["concurrent"][name] = dict(
+                    _summary(latencies, seconds), errors=sum(part[2] for part in parts)
+                )
+                print(f"  {name:40} {results['concurrent'][name]}", flush=True)
+
+    results["pool"] = D.get_pool_stats()
+    output = args.output or f"bench-{results['meta']['commit'] or 'nogit'}-{int(time.time())}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,636 @@
+"""
+SaaS Control Panel - Fake Docker Daemon
+In-memory stand-in for the Docker Engine API, enough for docker-py and the
+control panel: containers (create/start/stop/remove/rename/inspect/list),
+host ports, stats, exec and the events stream, with configurable latency
+and failure injection.
+
+    python benchmarks/fake_dockerd.py --port 2375 --latency-ms 20 --failure-rate 0.01
+    DOCKER_HOST=tcp://127.0.0.1:2375 python control-panel/app.py
+"""
+
+import argparse
+import copy
+import json
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_VERSION = "1.44"
+
+# Operations that latency and failures can be configured for
+OPERATIONS = ("list", "inspect", "create", "start", "stop", "remove", "rename", "stats", "exec", "events")
+
+
+class DockerError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _label_matches(labels, expression):
+    """Docker label filter: 'key' or 'key=value'"""
+    key, sep, value = expression.partition("=")
+    return key in labels and (not sep or labels[key] == value)
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+# ============================================
+# STATE
+# ============================================
+
+class FakeDocker:
+    """Containers, ports and events; thread-safe"""
+
+    def __init__(self, latency=None, jitter=0.5, failures=None, port_range=(32768, 60999), seed=None):
+        self.latency = latency or {}
+        self.jitter = jitter
+        self.failures = failures or {}
+        self.rng = random.Random(seed)
+        self._containers = {}
+        self._names = {}
+        self._execs = {}
+        self._free_ports = list(range(port_range[0], port_range[1] + 1))
+        self.rng.shuffle(self._free_ports)
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=10000)
+        self._subscribers = set()
+        self.requests = {op: 0 for op in OPERATIONS}
+        self.injected_failures = {op: 0 for op in OPERATIONS}
+
+    # ------------------------------------------
+    # SIMULATION
+    # ------------------------------------------
+
+    def simulate(self, op):
+        """Sleep the configured latency for op, then maybe fail it"""
+        with self._lock:
+            self.requests[op] += 1
+            delay = self.latency.get(op, 0.0)
+            if delay:
+                delay *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+            failed = self.rng.random() < self.failures.get(op, 0.0)
+            if failed:
+                self.injected_failures[op] += 1
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise DockerError(500, f"injected {op} failure")
+
+    # ------------------------------------------
+    # CONTAINERS
+    # ------------------------------------------
+
+    def _find(self, ref):
+        """Container by id, id prefix or name (caller holds the lock)"""
+        ref = ref.lstrip("/")
+        if ref in self._containers:
+            return self._containers[ref]
+        if ref in self._names:
+            return self._containers[self._names[ref]]
+        if len(ref) >= 4:
+            matches = [c for cid, c in self._containers.items() if cid.startswith(ref)]
+            if len(matches) == 1:
+                return matches[0]
+        raise DockerError(404, f"No such container: {ref}")
+
+    def _emit(self, action, container):
+        now = time.time()
+        event = {
+            "Type": "container",
+            "Action": action,
+            "status": action,
+            "id": container["Id"],
+            "from": container["Config"]["Image"],
+            "Actor": {
+                "ID": container["Id"],
+                "Attributes": dict(container["Config"].get("Labels") or {},
+                                   name=container["Name"].lstrip("/"),
+                                   image=container["Config"]["Image"]),
+            },
+            "scope": "local",
+            "time": int(now),
+            "timeNano": int(now * 1e9),
+        }
+        self._events.append(event)
+        for sub in list(self._subscribers):
+            try:
+                sub.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def create(self, name, config):
+        with self._lock:
+            name = name or f"fake_{uuid.uuid4().hex[:8]}"
+            if name in self._names:
+                raise DockerError(409, f'Conflict. The container name "/{name}" is already in use')
+            container_id = uuid.uuid4().hex + uuid.uuid4().hex
+            host_config = config.pop("HostConfig", None) or {}
+            container = {
+                "Id": container_id,
+                "Name": f"/{name}",
+                "Created": _now_iso(),
+                "Image": config.get("Image", ""),
+                "Config": dict(config, Labels=config.get("Labels") or {}),
+                "HostConfig": host_config,
+                "State": {"Status": "created", "Running": False, "ExitCode": 0,
+                          "StartedAt": "0001-01-01T00:00:00Z", "FinishedAt": "0001-01-01T00:00:00Z"},
+                "NetworkSettings": {"Ports": {}},
+                "Mounts": [],
+                "_ports": {},
+                "_cpu": 0,
+                "_system": 0,
+                "_net": 0,
+            }
+            self._containers[container_id] = container
+            self._names[name] = container_id
+            self._emit("create", container)
+            return container_id
+
+    def _bind_ports(self, container):
+        bindings = container["HostConfig"].get("PortBindings") or {}
+        for private, requested in bindings.items():
+            if private in container["_ports"]:
+                continue
+            host_port = (requested or [{}])[0].get("HostPort") or ""
+            if not host_port:
+                if not self._free_ports:
+                    raise DockerError(500, "no free host ports")
+                host_port = str(self._free_ports.pop())
+            container["_ports"][private] = host_port
+
+    def _release_ports(self, container):
+        for host_port in container["_ports"].values():
+            if host_port.isdigit():
+                self._free_ports.insert(0, int(host_port))
+        container["_ports"] = {}
+
+    def _publish_ports(self, container):
+        running = container["State"]["Running"]
+        container["NetworkSettings"]["Ports"] = {
+            private: [{"HostIp": "0.0.0.0", "HostPort": host_port}] if running else None
+            for private, host_port in container["_ports"].items()
+        }
+
+    def start(self, ref):
+        with self._lock:
+            container = self._find(ref)
+            if container["State"]["Running"]:
+                return False
+            self._bind_ports(container)
+            container["State"].update(Status="running", Running=True, StartedAt=_now_iso())
+            self._publish_ports(container)
+            self._emit("start", container)
+            return True
+
+    def stop(self, ref, action="stop"):
+        with self._lock:
+            container = self._find(ref)
+            if not container["State"]["Running"]:
+                return False
+            container["State"].update(Status="exited", Running=False, FinishedAt=_now_iso())
+            self._release_ports(container)
+            self._publish_ports(container)
+            self._emit(action if action == "kill" else "die", container)
+            if action == "stop":
+                self._emit("stop", container)
+            return True
+
+    def remove(self, ref, force=False):
+        with self._lock:
+            container = self._find(ref)
+            if container["State"]["Running"]:
+                if not force:
+                    raise DockerError(409, f"cannot remove running container {ref}: stop it or use force")
+                container["State"].update(Status="exited", Running=False)
+                self._release_ports(container)
+                self._emit("kill", container)
+                self._emit("die", container)
+            del self._containers[container["Id"]]
+            del self._names[container["Name"].lstrip("/")]
+            self._emit("destroy", container)
+
+    def rename(self, ref, new_name):
+        with self._lock:
+            container = self._find(ref)
+            if new_name in self._names:
+                raise DockerError(409, f'Conflict. The container name "/{new_name}" is already in use')
+            del self._names[container["Name"].lstrip("/")]
+            container["Name"] = f"/{new_name}"
+            self._names[new_name] = container["Id"]
+            self._emit("rename", container)
+
+    def inspect(self, ref):
+        with self._lock:
+            container = self._find(ref)
+            return copy.deepcopy({k: v for k, v in container.items() if not k.startswith("_")})
+
+    def list(self, all_=False, filters=None):
+        filters = filters or {}
+        with self._lock:
+            return [self._summary(c) for c in self._containers.values() if self._listed(c, all_, filters)]
+
+    @staticmethod
+    def _listed(c, all_, filters):
+        name = c["Name"].lstrip("/")
+        status = c["State"]["Status"]
+        if not all_ and status != "running":
+            return False
+        if filters.get("status") and status not in filters["status"]:
+            return False
+        if filters.get("name") and not any(re.search(p.lstrip("/"), name) for p in filters["name"]):
+            return False
+        labels = c["Config"].get("Labels") or {}
+        return all(_label_matches(labels, f) for f in filters.get("label", []))
+
+    @staticmethod
+    def _summary(c):
+        running = c["State"]["Running"]
+        return {
+            "Id": c["Id"],
+            "Names": [c["Name"]],
+            "Image": c["Config"].get("Image", ""),
+            "Created": int(time.time()),
+            "State": c["State"]["Status"],
+            "Status": "Up" if running else "Exited (0)",
+            "Labels": dict(c["Config"].get("Labels") or {}),
+            "Ports": [
+                {"IP": "0.0.0.0", "PrivatePort": int(private.split("/")[0]),
+                 "PublicPort": int(host_port), "Type": private.split("/")[1]}
+                for private, host_port in c["_ports"].items()
+            ] if running else [],
+        }
+
+    def stats(self, ref):
+        with self._lock:
+            c = self._find(ref)
+            if not c["State"]["Running"]:
+                return {"read": _now_iso(), "cpu_stats": {}, "precpu_stats": {}, "memory_stats": {}}
+            online = 2
+            previous = {"cpu_usage": {"total_usage": c["_cpu"]}, "system_cpu_usage": c["_system"],
+                        "online_cpus": online}
+            system_delta = 10 ** 10
+            c["_system"] += system_delta
+            c["_cpu"] += int(self.rng.random() * system_delta / online)
+            c["_net"] += self.rng.randrange(10 ** 5)
+            return {
+                "read": _now_iso(),
+                "name": c["Name"],
+                "id": c["Id"],
+                "cpu_stats": {"cpu_usage": {"total_usage": c["_cpu"]}, "system_cpu_usage": c["_system"],
+                              "online_cpus": online},
+                "precpu_stats": previous,
+                "memory_stats": {"usage": self.rng.randrange(50, 400) * 2 ** 20, "limit": 2 ** 30,
+                                 "stats": {"inactive_file": 0}},
+                "networks": {"eth0": {"rx_bytes": c["_net"], "tx_bytes": c["_net"] // 2}},
+            }
+
+    def exec_create(self, ref):
+        with self._lock:
+            container = self._find(ref)
+            if not container["State"]["Running"]:
+                raise DockerError(409, f"Container {container['Id']} is not running")
+            exec_id = uuid.uuid4().hex
+            self._execs[exec_id] = {"ID": exec_id, "Running": False, "ExitCode": 0,
+                                    "ContainerID": container["Id"]}
+            return exec_id
+
+    def exec_inspect(self, exec_id):
+        with self._lock:
+            if exec_id not in self._execs:
+                raise DockerError(404, f"No such exec instance: {exec_id}")
+            return dict(self._execs[exec_id])
+
+    # ------------------------------------------
+    # EVENTS
+    # ------------------------------------------
+
+    def subscribe(self, since=None):
+        sub = queue.Queue(maxsize=10000)
+        with self._lock:
+            if since is not None:
+                for event in self._events:
+                    if event["timeNano"] >= since * 1e9:
+                        sub.put_nowait(event)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def summary(self):
+        with self._lock:
+            running = sum(1 for c in self._containers.values() if c["State"]["Running"])
+            return {
+                "containers": len(self._containers),
+                "running": running,
+                "free_ports": len(self._free_ports),
+                "event_subscribers": len(self._subscribers),
+                "requests": dict(self.requests),
+                "injected_failures": dict(self.injected_failures),
+            }
+
+
+# ============================================
+# HTTP API
+# ============================================
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "fake-dockerd"
+
+    ROUTES = [
+        ("GET", r"/_ping", "ping"),
+        ("HEAD", r"/_ping", "ping"),
+        ("GET", r"/version", "version"),
+        ("GET", r"/info", "info"),
+        ("GET", r"/_fake/state", "state"),
+        ("GET", r"/containers/json", "list"),
+        ("POST", r"/containers/create", "create"),
+        ("GET", r"/containers/(?P<ref>[^/]+)/json", "inspect"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/start", "start"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/stop", "stop"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/kill", "kill"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/restart", "restart"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/rename", "rename"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/wait", "wait"),
+        ("DELETE", r"/containers/(?P<ref>[^/]+)", "remove"),
+        ("GET", r"/containers/(?P<ref>[^/]+)/stats", "stats"),
+        ("POST", r"/containers/(?P<ref>[^/]+)/exec", "exec_create"),
+        ("POST", r"/exec/(?P<ref>[^/]+)/start", "exec_start"),
+        ("GET", r"/exec/(?P<ref>[^/]+)/json", "exec_inspect"),
+        ("GET", r"/events", "events"),
+        ("POST", r"/images/create", "pull"),
+        ("GET", r"/images/(?P<ref>.+)/json", "image"),
+    ]
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # ------------------------------------------
+    # PLUMBING
+    # ------------------------------------------
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = re.sub(r"^/v[\d.]+", "", url.path)
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.body = json.loads(body) if body.strip() else {}
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                try:
+                    getattr(self, f"do_{name}")(**match.groupdict())
+                except DockerError as e:
+                    self._json(e.status, {"message": e.message})
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                return
+        self._json(404, {"message": f"page not found: {method} {path}"})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def _json(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _empty(self, status=204):
+        self.send_response(status)
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _flag(self, name):
+        return self.query.get(name, "").lower() in ("1", "true")
+
+    @property
+    def docker(self):
+        return self.server.docker
+
+    # ------------------------------------------
+    # ENDPOINTS
+    # ------------------------------------------
+
+    def do_ping(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(b"OK")
+
+    def do_version(self):
+        self._json(200, {"Version": "fake", "ApiVersion": API_VERSION, "MinAPIVersion": "1.24",
+                         "Os": "linux", "Arch": "amd64"})
+
+    def do_info(self):
+        summary = self.docker.summary()
+        self._json(200, {"Containers": summary["containers"], "ContainersRunning": summary["running"],
+                         "ServerVersion": "fake", "OperatingSystem": "fake-dockerd"})
+
+    def do_state(self):
+        self._json(200, self.docker.summary())
+
+    def do_list(self):
+        self.docker.simulate("list")
+        filters = json.loads(self.query.get("filters") or "{}")
+        filters = {k: list(v) if isinstance(v, list) else [k2 for k2, on in v.items() if on]
+                   for k, v in filters.items()}
+        self._json(200, self.docker.list(all_=self._flag("all"), filters=filters))
+
+    def do_create(self):
+        self.docker.simulate("create")
+        container_id = self.docker.create(self.query.get("name"), self.body)
+        self._json(201, {"Id": container_id, "Warnings": []})
+
+    def do_inspect(self, ref):
+        self.docker.simulate("inspect")
+        self._json(200, self.docker.inspect(ref))
+
+    def do_start(self, ref):
+        self.docker.simulate("start")
+        self._empty(204 if self.docker.start(ref) else 304)
+
+    def do_stop(self, ref):
+        self.docker.simulate("stop")
+        self._empty(204 if self.docker.stop(ref) else 304)
+
+    def do_kill(self, ref):
+        self.docker.simulate("stop")
+        if not self.docker.stop(ref, action="kill"):
+            raise DockerError(409, f"Container {ref} is not running")
+        self._empty()
+
+    def do_restart(self, ref):
+        self.docker.simulate("stop")
+        self.docker.stop(ref)
+        self.docker.simulate("start")
+        self.docker.start(ref)
+        self._empty()
+
+    def do_rename(self, ref):
+        self.docker.simulate("rename")
+        self.docker.rename(ref, self.query.get("name", ""))
+        self._empty()
+
+    def do_wait(self, ref):
+        self.docker.inspect(ref)
+        self._json(200, {"StatusCode": 0})
+
+    def do_remove(self, ref):
+        self.docker.simulate("remove")
+        self.docker.remove(ref, force=self._flag("force"))
+        self._empty()
+
+    def do_stats(self, ref):
+        self.docker.simulate("stats")
+        self._json(200, self.docker.stats(ref))
+
+    def do_exec_create(self, ref):
+        self.docker.simulate("exec")
+        self._json(201, {"Id": self.docker.exec_create(ref)})
+
+    def do_exec_start(self, ref):
+        self.docker.exec_inspect(ref)
+        # Raw stream with no output, then EOF (docker-py reads until close)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def do_exec_inspect(self, ref):
+        self._json(200, self.docker.exec_inspect(ref))
+
+    def do_pull(self):
+        self._json(200, {"status": f"Image is up to date for {self.query.get('fromImage', '')}"})
+
+    def do_image(self, ref):
+        self._json(200, {"Id": "sha256:" + uuid.uuid5(uuid.NAMESPACE_DNS, ref).hex * 2, "RepoTags": [ref]})
+
+    def do_events(self):
+        self.docker.simulate("events")
+        since = float(self.query["since"]) if self.query.get("since") else None
+        until = float(self.query["until"]) if self.query.get("until") else None
+        filters = json.loads(self.query.get("filters") or "{}")
+        types = filters.get("type")
+        sub = self.docker.subscribe(since)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while until is None or time.time() < until:
+                try:
+                    event = sub.get(timeout=1)
+                except queue.Empty:
+                    if self.server.stopping.is_set():
+                        break
+                    continue
+                if types and event["Type"] not in types:
+                    continue
+                line = (json.dumps(event) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            self.docker.unsubscribe(sub)
+            self.close_connection = True
+
+
+class FakeDockerServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, docker, verbose=False):
+        super().__init__(address, Handler)
+        self.docker = docker
+        self.verbose = verbose
+        self.stopping = threading.Event()
+
+    def shutdown(self):
+        self.stopping.set()
+        super().shutdown()
+
+
+def _per_op(values, default):
+    """'create=200,start=50' (ms or ratio) on top of a default for every op"""
+    result = {op: default for op in OPERATIONS}
+    for item in filter(None, (values or "").split(",")):
+        op, _, value = item.partition("=")
+        if op not in OPERATIONS:
+            raise SystemExit(f"unknown operation {op!r}; one of {', '.join(OPERATIONS)}")
+        result[op] = float(value)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2375)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency of every operation")
+    parser.add_argument("--latency", help="per operation, e.g. create=300,start=150,stop=100 (ms)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="+/- fraction applied to each latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="share of create/start/stop/remove/rename/exec calls that fail")
+    parser.add_argument("--fail", help="per operation failure share, e.g. create=0.05,inspect=0.01")
+    parser.add_argument("--port-range", default="32768-60999")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    latency = {op: ms / 1000 for op, ms in _per_op(args.latency, args.latency_ms).items()}
+    failures = {op: 0.0 for op in OPERATIONS}
+    for op in ("create", "start", "stop", "remove", "rename", "exec"):
+        failures[op] = args.failure_rate
+    failures.update({op: rate for op, rate in _per_op(args.fail, 0.0).items() if rate})
+    low, high = (int(p) for p in args.port_range.split("-"))
+
+    docker = FakeDocker(latency=latency, jitter=args.jitter, failures=failures,
+                        port_range=(low, high), seed=args.seed)
+    server = FakeDockerServer((args.host, args.port), docker, verbose=args.verbose)
+    print(f"fake dockerd on tcp://{args.host}:{args.port} (DOCKER_HOST=tcp://{args.host}:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
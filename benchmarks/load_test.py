@@ -0,0 +1,273 @@
+"""
+SaaS Control Panel - Load Test
+Open-loop load generator for the registration and login flows. Requests
+are sent at the target rates whatever the response times, and latency is
+measured from each request's scheduled send time, so a slow server shows
+up as latency instead of as a lower request rate.
+
+    # auth-service register/login (which call /api/provision and /api/user/<u>/port)
+    python benchmarks/load_test.py --flow auth --register-rate 20 --login-rate 100 --duration 60
+    # the control-panel endpoints directly
+    python benchmarks/load_test.py --flow direct --register-rate 50 --login-rate 200
+
+Run it against services whose DOCKER_HOST points at benchmarks/fake_dockerd.py
+to load-test without a Docker host.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+# ============================================
+# RESULTS
+# ============================================
+
+class EndpointStats:
+    """Latencies and outcomes of one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds, outcome):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def summary(self, duration):
+        with self._lock:
+            ordered = sorted(self.latencies)
+            outcomes = dict(self.outcomes)
+
+        def pct(q):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+        total = len(ordered)
+        errors = sum(n for outcome, n in outcomes.items() if outcome not in ("ok", "not_ready"))
+        return {
+            "requests": total,
+            "rate": round(total / duration, 2) if duration else None,
+            "outcomes": outcomes,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2) if ordered else None,
+        }
+
+
+# ============================================
+# FLOWS
+# ============================================
+
+_local = threading.local()
+
+
+def _session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _status(response):
+    return "ok" if response.ok else f"http_{response.status_code}"
+
+
+class AuthFlow:
+    """Browser-style form posts to auth-service"""
+
+    endpoints = ("POST /user/register", "POST /user/login")
+
+    def __init__(self, args):
+        self.url = args.auth_url.rstrip("/")
+        self.timeout = args.timeout
+
+    def register(self, username):
+        r = _session().post(f"{self.url}/user/register", timeout=self.timeout, allow_redirects=False,
+                            data={"username": username, "email": f"{username}@example.com", "password": "pw"})
+        # Success redirects to the login page; failures re-render the form
+        if r.status_code == 302:
+            return "ok"
+        return "rejected" if r.status_code == 200 else _status(r)
+
+    def login(self, username):
+        r = _session().post(f"{self.url}/user/login", timeout=self.timeout, allow_redirects=False,
+                            data={"username": username, "password": "pw"})
+        if r.status_code == 302:
+            return "ok"
+        if r.status_code == 200 and "still being prepared" in r.text:
+            return "not_ready"
+        return "rejected" if r.status_code == 200 else _status(r)
+
+
+class DirectFlow:
+    """The control-panel calls auth-service makes, without auth-service"""
+
+    endpoints = ("POST /api/provision", "GET /api/user/<u>/port")
+
+    def __init__(self, args):
+        self.url = args.control_panel_url.rstrip("/")
+        self.timeout = args.timeout
+
+    def register(self, username):
+        r = _session().post(f"{self.url}/api/provision", timeout=self.timeout,
+                            json={"username": username, "email": f"{username}@example.com"})
+        return _status(r)
+
+    def login(self, username):
+        r = _session().get(f"{self.url}/api/user/{username}/port", timeout=self.timeout)
+        if r.status_code == 404:
+            return "not_ready"
+        return _status(r)
+
+
+# ============================================
+# DRIVER
+# ============================================
+
+class LoadTest:
+    def __init__(self, flow, args):
+        self.flow = flow
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.prefix = args.prefix or f"lt{os.getpid()}x{int(time.time()) % 100000}"
+        self.stats = {name: EndpointStats() for name in flow.endpoints}
+        self.registered = []
+        self._registered_lock = threading.Lock()
+        self._seq = 0
+        self.executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="load")
+        self.overloaded = 0
+
+    def _username(self):
+        with self._registered_lock:
+            self._seq += 1
+            return f"{self.prefix}_{self._seq}"
+
+    def _call(self, endpoint, function, username, scheduled, measured=True):
+        try:
+            outcome = function(username)
+        except requests.Timeout:
+            outcome = "timeout"
+        except requests.RequestException:
+            outcome = "connection_error"
+        if measured:
+            self.stats[endpoint].record(time.perf_counter() - scheduled, outcome)
+        return outcome
+
+    def _register(self, scheduled, measured=True):
+        username = self._username()
+        if self._call(self.flow.endpoints[0], self.flow.register, username, scheduled, measured) == "ok":
+            with self._registered_lock:
+                self.registered.append(username)
+
+    def _login(self, scheduled):
+        with self._registered_lock:
+            if not self.registered:
+                return
+            username = self.rng.choice(self.registered)
+        self._call(self.flow.endpoints[1], self.flow.login, username, scheduled)
+
+    def _schedule(self, rate, task, deadline, stop):
+        """Submit task at `rate` per second until deadline (constant or Poisson gaps)"""
+        if rate <= 0:
+            return
+        rng = random.Random(self.rng.random())
+        next_at = time.perf_counter()
+        while next_at < deadline and not stop.is_set():
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if self.executor._work_queue.qsize() > self.args.concurrency * 10:
+                # The generator itself cannot keep up; count it rather than queue forever
+                self.overloaded += 1
+            else:
+                self.executor.submit(task, next_at)
+            next_at += rng.expovariate(rate) if self.args.poisson else 1.0 / rate
+
+    def run(self):
+        if self.args.seed_users:
+            print(f"Registering {self.args.seed_users} users before the measured run", flush=True)
+            futures = [self.executor.submit(self._register, time.perf_counter(), False)
+                       for _ in range(self.args.seed_users)]
+            for future in futures:
+                future.result()
+            if self.args.settle:
+                time.sleep(self.args.settle)
+
+        stop = threading.Event()
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        schedulers = [
+            threading.Thread(target=self._schedule, args=(self.args.register_rate, self._register, deadline, stop)),
+            threading.Thread(target=self._schedule, args=(self.args.login_rate, self._login, deadline, stop)),
+        ]
+        for thread in schedulers:
+            thread.start()
+        try:
+            for thread in schedulers:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in schedulers:
+                thread.join()
+        self.executor.shutdown(wait=True)
+        duration = time.perf_counter() - started
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "output"},
+            "duration_seconds": round(duration, 2),
+            "registered_users": len(self.registered),
+            "generator_overloaded": self.overloaded,
+            "endpoints": {name: stats.summary(duration) for name, stats in self.stats.items()},
+        }
+
+
+def print_report(report):
+    print(f"\n{report['duration_seconds']}s, {report['registered_users']} users registered"
+          + (f", {report['generator_overloaded']} requests not sent (generator overloaded)"
+             if report["generator_overloaded"] else ""))
+    print(f"{'endpoint':28} {'requests':>8} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}  outcomes")
+    for name, s in report["endpoints"].items():
+        print(f"{name:28} {s['requests']:>8} {s['rate'] or 0:>8} {s['error_rate'] * 100:>6.2f}% "
+              f"{s['p50_ms'] or '-':>9} {s['p95_ms'] or '-':>9} {s['p99_ms'] or '-':>9} {s['max_ms'] or '-':>9}  "
+              f"{s['outcomes']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flow", choices=("auth", "direct"), default="auth")
+    parser.add_argument("--auth-url", default="http://localhost:5000")
+    parser.add_argument("--control-panel-url", default="http://localhost:5001")
+    parser.add_argument("--register-rate", type=float, default=5.0, help="registrations per second")
+    parser.add_argument("--login-rate", type=float, default=20.0, help="logins per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--seed-users", type=int, default=0, help="users registered before measuring")
+    parser.add_argument("--settle", type=float, default=0.0, help="seconds to wait after seeding users")
+    parser.add_argument("--concurrency", type=int, default=64, help="max requests in flight")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--poisson", action="store_true", help="exponential gaps instead of a constant rate")
+    parser.add_argument("--prefix", help="username prefix (default: unique per run)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    flow = AuthFlow(args) if args.flow == "auth" else DirectFlow(args)
+    report = LoadTest(flow, args).run()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
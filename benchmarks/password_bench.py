@@ -0,0 +1,124 @@
+"""
+SaaS Control Panel - Password Hashing Benchmark
+Times scrypt at increasing costs on one core, picks the highest cost that
+still allows the target number of logins per second per core, then checks
+the throughput of auth-service's PasswordHasher pool at that cost.
+
+    python benchmarks/password_bench.py --target-per-core 20
+    python benchmarks/password_bench.py --target-per-core 10 --processes 8 --output pw.json
+
+Run it on the hardware (and CPU quota) auth-service runs on, then set the
+printed PASSWORD_SCRYPT_* values; existing hashes are upgraded at login.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "shared"), os.path.join(ROOT, "auth-service")]
+
+from passwords import PasswordHasher, derive
+
+
+def time_cost(n, r, p, min_seconds, min_runs):
+    """Median seconds of one scrypt on this thread"""
+    salt = os.urandom(16)
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_runs or time.perf_counter() - started < min_seconds:
+        t = time.perf_counter()
+        derive("correct horse battery staple", salt, n, r, p)
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples)
+
+
+def pool_throughput(n, r, p, processes, seconds):
+    """Verifications per second through PasswordHasher with `processes` processes"""
+    hasher = PasswordHasher(n=n, r=r, p=p, processes=processes, cache_ttl=0)
+    stored = hasher.hash("correct horse battery staple")
+    deadline = time.perf_counter() + seconds
+    counts = []
+
+    def login():
+        # One thread per in-flight login, like the web worker's request threads
+        done = 0
+        while time.perf_counter() < deadline:
+            hasher.verify("correct horse battery staple", stored)
+            done += 1
+        counts.append(done)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=login) for _ in range(max(processes, 1) * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-per-core", type=float, default=20.0, help="logins per second per core")
+    parser.add_argument("--r", type=int, default=8)
+    parser.add_argument("--p", type=int, default=1)
+    parser.add_argument("--min-log2n", type=int, default=12)
+    parser.add_argument("--max-log2n", type=int, default=18)
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="time budget per cost")
+    parser.add_argument("--min-runs", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="pool size to check (0: skip)")
+    parser.add_argument("--pool-seconds", type=float, default=5.0)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'memory MiB':>10} {'ms/hash':>9} {'logins/s/core':>14}")
+    costs = []
+    for log2n in range(args.min_log2n, args.max_log2n + 1):
+        n = 2 ** log2n
+        seconds = time_cost(n, args.r, args.p, args.min_seconds, args.min_runs)
+        cost = {
+            "n": n,
+            "memory_mib": round(128 * args.r * n / 2 ** 20, 1),
+            "ms": round(seconds * 1000, 2),
+            "per_core": round(1 / seconds, 1),
+        }
+        costs.append(cost)
+        print(f"{n:>8} {cost['memory_mib']:>10} {cost['ms']:>9} {cost['per_core']:>14}", flush=True)
+        if cost["per_core"] < args.target_per_core / 4:
+            break
+
+    fitting = [c for c in costs if c["per_core"] >= args.target_per_core]
+    if not fitting:
+        print(f"\nNo cost reaches {args.target_per_core} logins/s per core; lower --min-log2n")
+        sys.exit(1)
+    chosen = fitting[-1]
+    print(f"\nHighest cost for {args.target_per_core} logins/s per core: n={chosen['n']} "
+          f"({chosen['ms']} ms per login on one core)")
+
+    pool = None
+    if args.processes > 0:
+        rate = pool_throughput(chosen["n"], args.r, args.p, args.processes, args.pool_seconds)
+        pool = {
+            "processes": args.processes,
+            "logins_per_second": round(rate, 1),
+            "per_process": round(rate / args.processes, 1),
+            "scaling": round(rate / (args.processes * chosen["per_core"]), 2),
+        }
+        print(f"PasswordHasher pool, {args.processes} processes: {pool['logins_per_second']} logins/s "
+              f"({pool['per_process']} per process, {pool['scaling']:.0%} of linear)")
+
+    print(f"\nPASSWORD_SCRYPT_N={chosen['n']} PASSWORD_SCRYPT_R={args.r} PASSWORD_SCRYPT_P={args.p}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "cpus": os.cpu_count(), "costs": costs,
+                       "chosen": chosen, "pool": pool}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,62 @@
 from flask import (
-    Flask, request, redirect,
+    Flask, Response, request, redirect,
     render_template, session, url_for
 )
 import docker
 import os
+import json
+import time
 from database import (
     get_admin_stats,
-    get_all_users,
-    get_all_containers,
     get_all_activity_logs,
-    get_user_by_username,
+    get_users_page,
+    get_containers_page,
+    get_activity_logs_page,
+    InvalidCursor,
+    export_activity_logs,
+    export_metrics,
+    get_container_series,
+    get_container_names,
+    CONTAINER_ACTIONS,
     get_container_by_name,
-    create_user as db_create_user,
-    create_container as db_create_container,
     update_container_status as db_update_container_status,
     delete_container as db_delete_container,
     delete_all_users as db_delete_all_users,
     log_activity,
+    flush_activity_logs,
     init_db,
-    DB_PATH
+    close_db,
+    get_pool_stats,
+    get_schema_version,
+    get_audit_stats,
+    ACTIVE_JOB_STATUSES,
+    DB_PATH,
+    get_token_keys,
+    get_token_denylist,
+    revoke_token
+)
+from provisioning import provision_user, provision_users, teardown_users, ready_times, USER_IMAGE
+from warm_pool import WarmPool
+from jobs import ProvisioningQueue
+from metrics_pipeline import MetricsCompactor
+from collector import MetricsCollector
+from inventory import ContainerInventory
+from port_resolver import PortResolver
+from exports import FORMATS, parse_time, stream_export
+from metric_store import parse_duration, series_window
+from batch_actions import run_container_batch
+from live_feed import ChangeHub
+from leader import LeaderLock
+from instrumentation import instrument_app, instrument_docker
+from tokens import (
+    TokenVerifier,
+    InvalidToken,
+    request_token,
+    register_metrics as register_token_metrics,
+    ADMIN_TOKEN_COOKIE,
+    ADMIN_AUDIENCE,
+    ADMIN_ROLE,
+    SERVICE_ROLE
 )
 
 # ===============================
@@ -31,7 +69,42 @@ app = Flask(
 )
 app.secret_key = "super-secret-admin-key"
 
-client = docker.from_env()
+# Per-route latency, DB/Docker timers and GET /metrics (Prometheus)
+instrument_app(app, "control-panel")
+
+# Docker clients and background services, opened once per worker
+# process by create_app() (see STARTUP)
+client = None
+inventory = None
+port_resolver = None
+live_feed = None
+compactor = None
+collector = None
+warm_pool = None
+provisioning_queue = None
+leader = None
+
+# Admin tokens signed by auth-service, checked locally against the polled
+# public keys and deny list (started by create_app())
+token_verifier = TokenVerifier(get_token_keys, get_token_denylist,
+                               poll_interval=float(os.getenv("TOKEN_POLL_INTERVAL", "5")))
+register_token_metrics(token_verifier)
+
+def admin_token_claims(req, allow_service=False):
+    """Claims of the request's admin token (Flask or aiohttp request), or None
+
+    allow_service also accepts auth-service's service token.
+    """
+    try:
+        claims = token_verifier.verify(request_token(req, ADMIN_TOKEN_COOKIE), ADMIN_AUDIENCE)
+    except InvalidToken:
+        return None
+    roles = (ADMIN_ROLE, SERVICE_ROLE) if allow_service else (ADMIN_ROLE,)
+    return claims if claims.get("role") in roles else None
+
+def is_admin(allow_service=False):
+    """Signed in here (session) or through auth-service (admin or service token)"""
+    return bool(session.get("admin")) or admin_token_claims(request, allow_service) is not None
 
 # ===============================
 # AUTH ADMIN
@@ -57,113 +130,229 @@ def login():
 @app.route("/logout")
 def logout():
     session.clear()
-    return redirect("/login")
+    response = redirect("/login")
+    claims = admin_token_claims(request)
+    if claims:
+        revoke_token(claims["jti"], claims["exp"] + token_verifier.leeway)
+    response.delete_cookie(ADMIN_TOKEN_COOKIE)
+    return response
 
 # ===============================
 # ADMIN DASHBOARD
 # ===============================
 @app.route("/admin/dashboard")
 def admin_dashboard():
-    if not session.get("admin"):
+    if not is_admin():
         return redirect("/login")
 
-    containers_data = []
-
-    for c in client.containers.list(all=True):
-        ports = c.attrs["NetworkSettings"]["Ports"]
-        port = "-"
-        if ports and ports.get("80/tcp"):
-            port = ports["80/tcp"][0]["HostPort"]
-
-        containers_data.append({
-            "name": c.name,
-            "status": c.status,
-            "port": port
-        })
+    containers_page = get_containers_page(limit=50)
+    containers_data = [
+        {
+            "name": c["container_name"],
+            "status": c["status"],
+            "port": c["port"] or "-"
+        }
+        for c in with_live_state(containers_page["items"])
+    ]
 
     stats = get_admin_stats() or {}
     recent_logs = get_all_activity_logs(limit=10) or []
-    users = get_all_users() or []
+    users_page = get_users_page(limit=50)
     return render_template(
         "dashboard_admin.html",
         containers=containers_data,
+        containers_next_cursor=containers_page["next_cursor"],
         stats=stats,
         logs=recent_logs,
-        users=users
+        users=users_page["items"]
     )
 
+def with_live_state(rows):
+    """Overlay live Docker status and port from the inventory on containers rows"""
+    for row in rows:
+        live = inventory.get(row["container_name"])
+        if live:
+            row["status"] = live["status"]
+            row["port"] = live["port"]
+    return rows
+
 # ===============================
 # ADMIN API ENDPOINTS (DB-BACKED)
 # ===============================
 @app.route("/api/admin/stats")
 def api_admin_stats():
-    if not session.get("admin"):
+    if not is_admin():
         return {"error": "unauthorized"}, 401
     return get_admin_stats()
 
+# List endpoints are keyset-paginated: ?limit=&cursor= (next_cursor in the
+# response), newest first, with ?q= as a username prefix filter.
 @app.route("/api/admin/users")
 def api_admin_users():
-    if not session.get("admin"):
+    if not is_admin():
         return {"error": "unauthorized"}, 401
-    return {"users": get_all_users()}
+    try:
+        page = get_users_page(
+            limit=request.args.get("limit", 50),
+            cursor=request.args.get("cursor"),
+            username_prefix=request.args.get("q")
+        )
+    except InvalidCursor:
+        return {"error": "invalid cursor"}, 400
+    return {"users": page["items"], "next_cursor": page["next_cursor"]}
 
 @app.route("/api/admin/containers")
 def api_admin_containers():
-    if not session.get("admin"):
+    if not is_admin():
         return {"error": "unauthorized"}, 401
-    return {"containers": get_all_containers()}
+    try:
+        page = get_containers_page(
+            limit=request.args.get("limit", 50),
+            cursor=request.args.get("cursor"),
+            status=request.args.get("status"),
+            username_prefix=request.args.get("q")
+        )
+    except InvalidCursor:
+        return {"error": "invalid cursor"}, 400
+    return {"containers": with_live_state(page["items"]), "next_cursor": page["next_cursor"]}
 
 @app.route("/api/admin/activity-logs")
 def api_admin_activity_logs():
-    if not session.get("admin"):
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    try:
+        page = get_activity_logs_page(
+            limit=request.args.get("limit", 50),
+            cursor=request.args.get("cursor"),
+            action=request.args.get("action"),
+            username_prefix=request.args.get("q")
+        )
+    except InvalidCursor:
+        return {"error": "invalid cursor"}, 400
+    return {"logs": page["items"], "next_cursor": page["next_cursor"]}
+
+# ===============================
+# EXPORTS (STREAMED)
+# ===============================
+# ?format=ndjson|csv&since=&until= (ISO-8601, until exclusive)&gzip=1
+def export_response(name, query):
+    """Run query(since, until) and stream the rows as a download"""
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in FORMATS:
+        return {"error": f"format must be one of {', '.join(FORMATS)}"}, 400
+    try:
+        since = parse_time(request.args.get("since"))
+        until = parse_time(request.args.get("until"))
+        columns, rows = query(since, until)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    mimetype, extension = FORMATS[fmt]
+    compress = request.args.get("gzip") == "1"
+    filename = f"{name}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.{extension}"
+    if compress:
+        mimetype = "application/gzip"
+        filename += ".gz"
+    return Response(
+        stream_export(columns, rows, fmt, compress),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.route("/api/admin/export/activity-logs")
+def api_admin_export_activity_logs():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    # Include rows still queued in the audit writer
+    flush_activity_logs()
+    action = request.args.get("action")
+    return export_response(
+        "activity-logs",
+        lambda since, until: export_activity_logs(since, until, action=action)
+    )
+
+@app.route("/api/admin/export/metrics")
+def api_admin_export_metrics():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    container_id = request.args.get("container_id", type=int)
+    resolution = request.args.get("resolution", "raw")
+    return export_response(
+        f"metrics-{resolution}",
+        lambda since, until: export_metrics(since, until, container_id=container_id, resolution=resolution)
+    )
+
+@app.route("/api/admin/containers/<int:container_id>/metrics/series")
+def api_admin_container_series(container_id):
+    """Bucketed CPU/memory columns (?range=24h&step=10m&aggregates=avg,max,p95)"""
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    try:
+        window = parse_duration(request.args.get("range", "24h"))
+        step = request.args.get("step")
+        since, until, step = series_window(window, parse_duration(step) if step else None)
+    except ValueError:
+        return {"error": "range and step must be durations like 90, 15m, 24h or 7d"}, 400
+    aggregates = tuple(a for a in request.args.get("aggregates", "avg,max").split(",") if a)
+    try:
+        return get_container_series(container_id, since, until, step, aggregates)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+@app.route("/api/admin/events")
+def api_admin_events():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    last_event_id = request.headers.get("Last-Event-ID")
+    # Holds one of the worker's WEB_THREADS threads while the client is connected
+    return Response(
+        live_feed.stream(last_event_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/api/admin/live-feed")
+def api_admin_live_feed():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    return live_feed.stats()
+
+@app.route("/api/admin/collector")
+def api_admin_collector():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    return {**collector.stats(), "leader": leader.stats()}
+
+@app.route("/api/admin/inventory")
+def api_admin_inventory():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    return {"inventory": inventory.stats(), "ports": port_resolver.stats()}
+
+@app.route("/api/admin/db-stats")
+def api_admin_db_stats():
+    if not is_admin():
         return {"error": "unauthorized"}, 401
-    return {"logs": get_all_activity_logs()}
+    return {
+        "schema_version": get_schema_version(),
+        "pool": get_pool_stats(),
+        "audit": get_audit_stats(),
+        "metrics_compactor": compactor.stats(),
+        "leader": leader.stats()
+    }
 
 # ===============================
 # CREATE CONTAINER (MANUAL)
 # ===============================
 @app.route("/create", methods=["POST"])
 def create_container():
-    if not session.get("admin"):
+    if not is_admin():
         return redirect("/login")
 
     u = request.form["username"]
 
     try:
-        # Ensure user exists in DB
-        user = get_user_by_username(u)
-        if not user:
-            res = db_create_user(u, "manual@local", "")
-            if not res.get("success"):
-                return redirect("/admin/dashboard")
-            user_id = res["user_id"]
-            user = get_user_by_username(u)
-        else:
-            user_id = user["id"]
-
-        # Create container
-        cont = client.containers.run(
-            "user-app",
-            name=f"user-{u}",
-            detach=True,
-            ports={"80/tcp": None},
-            environment={
-                "USERNAME": u,
-                "EMAIL": user.get("email", "manual@local")
-            }
-        )
-        cont.reload()
-        ports = cont.attrs.get("NetworkSettings", {}).get("Ports", {})
-        port = None
-        if ports and ports.get("80/tcp"):
-            port = int(ports["80/tcp"][0]["HostPort"]) if ports["80/tcp"][0].get("HostPort") else None
-
-        # Persist to DB
-        res = db_create_container(user_id, cont.id, cont.name, port or 0)
-        if res.get('success'):
-            container_pk = res['container_id']
-            db_update_container_status(container_pk, 'running')
-            log_activity(user_id, container_pk, 'container_created', f'Container {cont.name} created')
+        provision_user(client, u, "manual@local", action_detail="created", warm_pool=warm_pool)
     except Exception:
         pass
 
@@ -172,60 +361,91 @@ def create_container():
 # ===============================
 # API – PROVISION USER (FROM AUTH)
 # ===============================
+def run_provisioning_job(job, progress):
+    return provision_user(
+        client, job["username"], job.get("email") or "",
+        progress=progress, warm_pool=warm_pool
+    )
+
 @app.route("/api/provision", methods=["POST"])
 def api_provision():
     u = request.json["username"]
     e = request.json.get("email", "")
+    job_id = request.headers.get("Idempotency-Key") or request.json.get("job_id")
+
+    job, created = provisioning_queue.submit(u, e, job_id=job_id)
+    body = {
+        "status": "accepted",
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "status_url": f"/api/jobs/{job['id']}"
+    }
+    if not created and job["status"] not in ACTIVE_JOB_STATUSES:
+        return body, 200
+    return body, 202
+
+# Bulk onboarding/teardown: one DB transaction per phase, Docker calls in parallel
+BULK_MAX_USERS = int(os.getenv("BULK_MAX_USERS", "5000"))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "16"))
+
+@app.route("/api/provision/bulk", methods=["POST"])
+def api_provision_bulk():
+    if not is_admin(allow_service=True):
+        return {"error": "unauthorized"}, 401
+    users = (request.json or {}).get("users")
+    if (not isinstance(users, list) or len(users) > BULK_MAX_USERS
+            or not all(isinstance(u, dict) and isinstance(u.get("username"), str) for u in users)):
+        return {"error": f"users must be a list of at most {BULK_MAX_USERS} {{username, email}} objects"}, 400
+    return provision_users(client, users, workers=BULK_WORKERS, warm_pool=warm_pool)
+
+@app.route("/api/jobs/<job_id>")
+def api_job_status(job_id):
+    if not is_admin(allow_service=True):
+        return {"error": "unauthorized"}, 401
+    job = provisioning_queue.get(job_id)
+    if not job:
+        return {"error": "not found"}, 404
+    return job
+
+@app.route("/api/admin/jobs")
+def api_admin_jobs():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    return provisioning_queue.stats()
 
-    try:
-        # Ensure user exists in DB
-        user = get_user_by_username(u)
-        if not user:
-            res = db_create_user(u, e or "", "")
-            if not res.get("success"):
-                return {"status": "error", "error": res.get("error")}, 400
-            user_id = res["user_id"]
-            user = get_user_by_username(u)
-        else:
-            user_id = user["id"]
-
-        # Create container
-        cont = client.containers.run(
-            "user-app",
-            name=f"user-{u}",
-            detach=True,
-            ports={"80/tcp": None},
-            environment={
-                "USERNAME": u,
-                "EMAIL": user.get("email", e or "")
-            }
-        )
-        cont.reload()
-        ports = cont.attrs.get("NetworkSettings", {}).get("Ports", {})
-        port = None
-        if ports and ports.get("80/tcp"):
-            port = int(ports["80/tcp"][0]["HostPort"]) if ports["80/tcp"][0].get("HostPort") else None
-
-        # Persist to DB
-        res = db_create_container(user_id, cont.id, cont.name, port or 0)
-        if res.get('success'):
-            container_pk = res['container_id']
-            db_update_container_status(container_pk, 'running')
-            log_activity(user_id, container_pk, 'container_created', f'Container {cont.name} provisioned')
-    except Exception:
-        pass
-
-    return {"status": "ok"}
+@app.route("/api/admin/warm-pool")
+def api_admin_warm_pool():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    return {"pool": warm_pool.stats(), "time_to_ready": ready_times.summary()}
 
 # ===============================
 # API – GET USER PORT
 # ===============================
+def resolve_host_port(name):
+    """HostPort of a container, from the inventory or Docker as a fallback"""
+    port = inventory.get_port(name)
+    if port is None:
+        c = client.containers.get(name)
+        port = c.attrs["NetworkSettings"]["Ports"]["80/tcp"][0]["HostPort"]
+    return port
+
 @app.route("/api/user/<username>/port")
 def get_user_port(username):
-    c = client.containers.get(f"user-{username}")
-    port = c.attrs["NetworkSettings"]["Ports"]["80/tcp"][0]["HostPort"]
+    port = port_resolver.resolve(username)
+    if port is None:
+        return {"error": "not found"}, 404
     return {"port": port}
 
+@app.route("/api/users/ports", methods=["POST"])
+def get_user_ports():
+    if not is_admin(allow_service=True):
+        return {"error": "unauthorized"}, 401
+    usernames = (request.json or {}).get("usernames") or []
+    if not isinstance(usernames, list) or len(usernames) > 1000:
+        return {"error": "usernames must be a list of at most 1000 names"}, 400
+    return {"ports": port_resolver.resolve_many(usernames)}
+
 # ===============================
 # API – DELETE USER CONTAINER
 # ===============================
@@ -235,23 +455,33 @@ def delete_user_container(username):
         client.containers.get(f"user-{username}").remove(force=True)
     except Exception:
         pass
+    port_resolver.forget(f"user-{username}")
     return {"status": "deleted"}
 
+@app.route("/api/users/bulk", methods=["DELETE"])
+def api_delete_users_bulk():
+    if not is_admin(allow_service=True):
+        return {"error": "unauthorized"}, 401
+    usernames = (request.json or {}).get("usernames")
+    if (not isinstance(usernames, list) or len(usernames) > BULK_MAX_USERS
+            or not all(isinstance(u, str) for u in usernames)):
+        return {"error": f"usernames must be a list of at most {BULK_MAX_USERS} names"}, 400
+    return teardown_users(client, usernames, workers=BULK_WORKERS)
+
 # ===============================
 # ADMIN ACTIONS
 # ===============================
 @app.route("/open/<name>")
 def open_container(name):
-    if not session.get("admin"):
+    if not is_admin():
         return redirect("/login")
 
-    c = client.containers.get(name)
-    port = c.attrs["NetworkSettings"]["Ports"]["80/tcp"][0]["HostPort"]
+    port = resolve_host_port(name)
     return redirect(f"http://localhost:{port}")
 
 @app.route("/start/<name>")
 def start_container(name):
-    if not session.get("admin"):
+    if not is_admin():
         return redirect("/login")
 
     cont = client.containers.get(name)
@@ -267,7 +497,7 @@ def start_container(name):
 
 @app.route("/stop/<name>")
 def stop_container(name):
-    if not session.get("admin"):
+    if not is_admin():
         return redirect("/login")
 
     cont = client.containers.get(name)
@@ -283,7 +513,7 @@ def stop_container(name):
 
 @app.route("/delete/<name>")
 def delete_container(name):
-    if not session.get("admin"):
+    if not is_admin():
         return redirect("/login")
 
     cont = client.containers.get(name)
@@ -297,19 +527,58 @@ def delete_container(name):
     cont.remove(force=True)
     return redirect("/admin/dashboard")
 
+# Batch start/stop/delete: {"action", "names": [...]} or {"action", "filter": {"status", "q"}},
+# optional "parallelism" and "stop_timeout"; progress is streamed as NDJSON
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", "16"))
+BATCH_STOP_TIMEOUT = int(os.getenv("BATCH_STOP_TIMEOUT", "10"))
+
+@app.route("/api/admin/containers/batch", methods=["POST"])
+def api_admin_containers_batch():
+    if not is_admin():
+        return {"error": "unauthorized"}, 401
+    body = request.json or {}
+    action = body.get("action")
+    if action not in CONTAINER_ACTIONS:
+        return {"error": f"action must be one of {', '.join(CONTAINER_ACTIONS)}"}, 400
+
+    if "names" in body:
+        names = body["names"]
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            return {"error": "names must be a list of container names"}, 400
+    elif isinstance(body.get("filter"), dict):
+        names = get_container_names(status=body["filter"].get("status"),
+                                    username_prefix=body["filter"].get("q"))
+    else:
+        return {"error": "names or filter is required"}, 400
+
+    try:
+        parallelism = min(max(int(body.get("parallelism", BATCH_PARALLELISM)), 1), 64)
+        stop_timeout = min(max(int(body.get("stop_timeout", BATCH_STOP_TIMEOUT)), 0), 300)
+    except (TypeError, ValueError):
+        return {"error": "parallelism and stop_timeout must be integers"}, 400
+
+    events = run_container_batch(client, action, names, parallelism=parallelism, stop_timeout=stop_timeout)
+    return Response(
+        (json.dumps(event) + "\n" for event in events),
+        mimetype="application/x-ndjson"
+    )
+
 # ===============================
 # RESET DATABASE
 # ===============================
 @app.route("/api/admin/reset-database", methods=["POST"])
 def reset_database():
     """Supprimer et réinitialiser la base de données"""
-    if not session.get("admin"):
+    if not is_admin():
         return {"error": "unauthorized"}, 401
     
     try:
-        # Supprimer le fichier de base de données
-        if os.path.exists(DB_PATH):
-            os.remove(DB_PATH)
+        # Fermer les connexions du pool puis supprimer le fichier (et le journal WAL)
+        flush_activity_logs()
+        close_db()
+        for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
         
         # Réinitialiser avec une nouvelle base vide
         init_db()
@@ -321,7 +590,7 @@ def reset_database():
 @app.route("/api/admin/delete-all-users", methods=["POST"])
 def delete_all_users():
     """Supprimer tous les utilisateurs de la base de données"""
-    if not session.get("admin"):
+    if not is_admin():
         return {"error": "unauthorized"}, 401
     
     result = db_delete_all_users()
@@ -330,8 +599,108 @@ def delete_all_users():
     else:
         return result, 500
 
+# ===============================
+# STARTUP
+# ===============================
+def start_leader_services():
+    """Background services that must run in a single process"""
+    # Roll raw metric samples into 1m/1h/1d rollups and enforce retention
+    if os.getenv("METRICS_COMPACTOR", "1") == "1":
+        compactor.start()
+    # Sample docker stats of every running user container into the metrics table
+    if os.getenv("COLLECTOR_ENABLED", "1") == "1":
+        collector.start()
+    # Only the leader refills the warm pool; every worker can claim from it
+    warm_pool.start()
+
+def create_app():
+    """App factory, called once per worker process
+
+    gunicorn runs it in each worker ("app:create_app()", no preload) so
+    the schema check, Docker clients and threads never cross a fork.
+    """
+    global client, inventory, port_resolver, live_feed, compactor
+    global collector, warm_pool, provisioning_queue, leader
+    if client is not None:
+        return app
+
+    init_db()
+    token_verifier.start()
+    client = instrument_docker(docker.from_env())
+
+    # Name -> container cache kept current from the Docker events stream
+    inventory = ContainerInventory(
+        client,
+        resync_interval=int(os.getenv("INVENTORY_RESYNC_INTERVAL", "300"))
+    )
+
+    # User port lookups: LRU/TTL cache -> containers table -> Docker
+    port_resolver = PortResolver(
+        client,
+        max_entries=int(os.getenv("PORT_CACHE_SIZE", "10000")),
+        ttl=int(os.getenv("PORT_CACHE_TTL", "60")),
+        inventory=inventory
+    )
+    inventory.subscribe(port_resolver.on_container_event)
+
+    # Dashboard changes (containers, stats, activity) pushed to SSE clients
+    live_feed = ChangeHub(poll_interval=float(os.getenv("LIVE_FEED_INTERVAL", "2")))
+    inventory.subscribe(live_feed.on_container_event)
+    live_feed.start()
+
+    inventory.start()
+
+    compactor = MetricsCompactor(
+        interval=int(os.getenv("METRICS_COMPACT_INTERVAL", "60")),
+        lag=int(os.getenv("METRICS_COMPACT_LAG", "30"))
+    )
+
+    collector_workers = int(os.getenv("COLLECTOR_WORKERS", "32"))
+    collector = MetricsCollector(
+        instrument_docker(docker.from_env(max_pool_size=collector_workers)),
+        interval=float(os.getenv("COLLECTOR_INTERVAL", "10")),
+        max_workers=collector_workers,
+        one_shot=os.getenv("COLLECTOR_ONE_SHOT", "1") == "1"
+    )
+
+    # Generic running containers claimed by provisioning (WARM_POOL_SIZE=0 disables)
+    warm_pool = WarmPool(
+        client,
+        USER_IMAGE,
+        target_size=int(os.getenv("WARM_POOL_SIZE", "0")),
+        refill_interval=float(os.getenv("WARM_POOL_REFILL_INTERVAL", "5"))
+    )
+
+    # Jobs are claimed from the database, so every worker runs a queue
+    provisioning_queue = ProvisioningQueue(
+        run_provisioning_job,
+        workers=int(os.getenv("PROVISION_WORKERS", "4")),
+        poll_interval=float(os.getenv("PROVISION_POLL_INTERVAL", "1.0"))
+    )
+    provisioning_queue.start()
+
+    leader = LeaderLock(
+        os.getenv("LEADER_LOCK_FILE", DB_PATH + ".leader"),
+        poll_interval=float(os.getenv("LEADER_POLL_INTERVAL", "5"))
+    )
+    leader.start(start_leader_services)
+    return app
+
+def shutdown():
+    """Stop the background services and flush the audit queue (worker exit)"""
+    if client is None:
+        return
+    for service in (leader, provisioning_queue, warm_pool, collector, compactor, live_feed, inventory,
+                    token_verifier):
+        try:
+            service.stop()
+        except Exception:
+            app.logger.exception("Could not stop %s", type(service).__name__)
+    flush_activity_logs()
+
 # ===============================
 # RUN
 # ===============================
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001)
+    # Development server; production runs gunicorn (see gunicorn.conf.py)
+    create_app().run(host="0.0.0.0", port=5001, threaded=True)
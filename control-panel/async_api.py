@@ -0,0 +1,631 @@
+"""
+SaaS Control Panel - Async API
+The endpoints auth-service calls at signup and login (provisioning, job
+status, port lookups, container deletion) and the admin lifecycle actions,
+served by one asyncio event loop per process instead of a thread per
+request. Docker calls go through aiohttp (docker_async.py); SQLite calls
+run on a small thread pool, each thread with its own pooled connection.
+
+    python async_api.py                      # development, port 5002
+    gunicorn --bind 0.0.0.0:5002 --worker-class aiohttp.GunicornWebWorker "async_api:create_app()"
+
+The dashboard and the leader-only services (collector, compactor, warm
+pool refill) stay in the Flask app; both share the database, the job
+queue and the Docker daemon.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from itsdangerous import BadSignature
+
+from app import app as flask_app, admin_token_claims, token_verifier
+from database import (
+    CONTAINER_ACTIONS,
+    ACTIVE_JOB_STATUSES,
+    apply_container_action,
+    get_container_names,
+    create_provisioning_job,
+    get_provisioning_job,
+    claim_provisioning_job,
+    update_provisioning_job,
+    requeue_stale_jobs,
+    flush_activity_logs,
+    init_db
+)
+from docker_async import AsyncDocker, DockerError, NotFound, container_config
+from instrumentation import (
+    METRICS_DIR, METRICS_TOKEN, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, registry
+)
+from port_resolver import PortResolver, CONTAINER_PREFIX
+from provisioning import (
+    USER_IMAGE,
+    container_name_for,
+    ensure_user,
+    host_port,
+    ready_times,
+    record_user_container,
+    user_container_options
+)
+from warm_pool import WARM_LABEL, WARM_PREFIX, RECONFIGURE_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+routes = web.RouteTableDef()
+
+# Set by on_startup, in the worker process
+docker = None
+executor = None
+port_resolver = None
+provisioner = None
+
+# Claim from the warm pool refilled by the Flask app's leader (0 = never)
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "0"))
+
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", "16"))
+BATCH_STOP_TIMEOUT = int(os.getenv("BATCH_STOP_TIMEOUT", "10"))
+# No thread per container here, so a batch can keep many more calls in flight
+BATCH_MAX_PARALLELISM = int(os.getenv("ASYNC_BATCH_MAX_PARALLELISM", "256"))
+
+
+async def db(fn, *args, **kwargs):
+    """Run a (blocking) database function on the database threads"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, lambda: fn(*args, **kwargs))
+
+
+# ===============================
+# AUTH ADMIN
+# ===============================
+def is_admin(request, allow_service=False):
+    """Same session cookie or admin (or service) token as the Flask dashboard"""
+    if admin_token_claims(request, allow_service) is not None:
+        return True
+    cookie = request.cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if not cookie:
+        return False
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return False
+    return bool(data.get("admin"))
+
+
+def unauthorized():
+    return web.json_response({"error": "unauthorized"}, status=401)
+
+
+# ===============================
+# PROVISIONING
+# ===============================
+class AsyncProvisioner:
+    """Run provisioning jobs as coroutines on the event loop.
+
+    Same queue as jobs.ProvisioningQueue (jobs are claimed from the
+    provisioning_jobs table), but a job waiting on Docker holds a
+    coroutine rather than a thread, so up to `concurrency` jobs run at
+    once. Jobs follow provisioning.provision_user() step by step. Stale
+    running jobs are requeued at start and whenever a claim finds nothing,
+    at most every stale_after / 2 seconds.
+    """
+
+    def __init__(self, concurrency=200, poll_interval=1.0, stale_after=300):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._slots = None
+        self._wakeup = None
+        self._task = None
+        self._jobs = set()
+        self._succeeded = 0
+        self._failed = 0
+        self._warm_claims = 0
+        self._total_seconds = 0.0
+        self._next_requeue = 0.0
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        if self.concurrency <= 0 or self._task is not None:
+            return
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._jobs] if t is not None]
+        for task in tasks:
+            task.cancel()
+        # Cancelled jobs stay "running"; a live provisioner requeues them once stale
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _requeue_stale(self):
+        """Requeue stale running jobs, at most every stale_after / 2 seconds"""
+        now = time.monotonic()
+        if now < self._next_requeue:
+            return 0
+        self._next_requeue = now + self.stale_after / 2
+        try:
+            requeued = await db(requeue_stale_jobs, self.stale_after)
+        except Exception:
+            logger.exception("Could not requeue stale provisioning jobs")
+            return 0
+        if requeued:
+            logger.warning("Requeued %d stale provisioning jobs", requeued)
+        return requeued
+
+    async def _run(self):
+        await self._requeue_stale()
+        while True:
+            await self._slots.acquire()
+            # Cleared before the claim, so a submit() during the claim is not missed
+            self._wakeup.clear()
+            try:
+                job = await db(claim_provisioning_job)
+            except Exception:
+                logger.exception("Could not claim a provisioning job")
+                job = None
+            if job is None:
+                self._slots.release()
+                if await self._requeue_stale():
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._run_job(job))
+            self._jobs.add(task)
+            task.add_done_callback(self._jobs.discard)
+
+    async def _run_job(self, job):
+        job_id = job["id"]
+        started = time.perf_counter()
+
+        async def progress(percent, step):
+            await db(update_provisioning_job, job_id, progress=percent, step=step)
+
+        try:
+            result = await self.provision(job["username"], job.get("email") or "", progress)
+            await db(update_provisioning_job, job_id, status="succeeded", progress=100, result=result)
+            self._succeeded += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Provisioning job %s failed", job_id)
+            await db(update_provisioning_job, job_id, status="failed", error=str(e))
+            self._failed += 1
+        finally:
+            self._total_seconds += time.perf_counter() - started
+            self._slots.release()
+
+    # ------------------------------------------
+    # STEPS
+    # ------------------------------------------
+
+    async def provision(self, username, email, progress):
+        """Async provisioning.provision_user()"""
+        started = time.perf_counter()
+
+        await progress(10, "user")
+        user = await db(ensure_user, username, email)
+
+        await progress(30, "container")
+        name = container_name_for(username)
+        path = await self._start_container(name, username, user.get("email") or email or "")
+
+        await progress(70, "inspect")
+        attrs = await docker.inspect(name)
+        port = host_port(attrs)
+
+        await progress(90, "record")
+        await db(record_user_container, user, name, attrs["Id"], port)
+        # Logins polling before the container was up cached "no port"
+        port_resolver.invalidate(name)
+
+        if path != "existing":
+            ready_times.observe(path, time.perf_counter() - started)
+
+        await progress(100, "done")
+        return {"container_name": name, "container_id": attrs["Id"], "port": port, "path": path}
+
+    async def _start_container(self, name, username, email):
+        """Same paths as provisioning.start_user_container(): 'existing', 'warm' or 'cold'"""
+        try:
+            attrs = await docker.inspect(name)
+            if not attrs["State"].get("Running"):
+                await docker.start(name)
+            return "existing"
+        except NotFound:
+            pass
+        if await self._claim_warm(name, username, email):
+            return "warm"
+        await docker.create(name, container_config(
+            USER_IMAGE, user_container_options({"USERNAME": username, "EMAIL": email})
+        ))
+        await docker.start(name)
+        return "cold"
+
+    async def _claim_warm(self, name, username, email):
+        """warm_pool.WarmPool.claim() against the pool the Flask leader refills"""
+        if WARM_POOL_SIZE <= 0:
+            return False
+        listed = await docker.list(filters={"label": [f"{WARM_LABEL}=1"], "status": ["running"]})
+        candidates = [
+            n.lstrip("/") for entry in listed for n in entry.get("Names") or []
+            if n.lstrip("/").startswith(WARM_PREFIX)
+        ]
+        # Concurrent claims try the containers in different orders
+        random.shuffle(candidates)
+        for candidate in candidates:
+            try:
+                await docker.rename(candidate, name)
+            except DockerError:
+                # Claimed by another job or process; try the next one
+                continue
+            try:
+                exit_code, output = await docker.exec_run(
+                    name, ["python", "-c", RECONFIGURE_SCRIPT, username, email or ""]
+                )
+                if exit_code != 0:
+                    raise RuntimeError(output.decode(errors="replace") or "reconfigure failed")
+            except Exception:
+                logger.exception("Could not reconfigure %s for %s", candidate, username)
+                try:
+                    await docker.remove(name, force=True)
+                except DockerError:
+                    pass
+                continue
+            self._warm_claims += 1
+            return True
+        return False
+
+    def stats(self):
+        done = self._succeeded + self._failed
+        return {
+            "concurrency": self.concurrency,
+            "running_jobs": len(self._jobs),
+            "succeeded": self._succeeded,
+            "failed": self._failed,
+            "warm_claims": self._warm_claims,
+            "avg_job_seconds": round(self._total_seconds / done, 4) if done else 0.0,
+        }
+
+
+@routes.post("/api/provision")
+async def api_provision(request):
+    body = await request.json()
+    job_id = request.headers.get("Idempotency-Key") or body.get("job_id") or uuid.uuid4().hex
+    job, created = await db(create_provisioning_job, job_id, body["username"], body.get("email", ""))
+    if created:
+        provisioner.wake()
+    response = {
+        "status": "accepted",
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "status_url": f"/api/jobs/{job['id']}"
+    }
+    if not created and job["status"] not in ACTIVE_JOB_STATUSES:
+        return web.json_response(response, status=200)
+    return web.json_response(response, status=202)
+
+
+@routes.get("/api/jobs/{job_id}")
+async def api_job_status(request):
+    if not is_admin(request, allow_service=True):
+        return unauthorized()
+    job = await db(get_provisioning_job, request.match_info["job_id"])
+    if not job:
+        return web.json_response({"error": "not found"}, status=404)
+    return web.json_response(job)
+
+
+@routes.get("/api/admin/async")
+async def api_admin_async(request):
+    if not is_admin(request):
+        return unauthorized()
+    return web.json_response({
+        "pid": os.getpid(),
+        "provisioning": provisioner.stats(),
+        "port_resolver": port_resolver.stats(),
+        "time_to_ready": ready_times.summary(),
+    })
+
+
+# ===============================
+# PORT LOOKUPS
+# ===============================
+async def resolve_ports(usernames):
+    """PortResolver.resolve_many() with the Docker fallbacks run concurrently"""
+    result, stale = await db(port_resolver.lookup, usernames)
+
+    async def from_docker(username):
+        name = CONTAINER_PREFIX + username
+        try:
+            attrs = await docker.inspect(name)
+        except DockerError:
+            attrs = {}
+        result[username] = await db(port_resolver.remember, name, attrs)
+
+    await asyncio.gather(*(from_docker(u) for u in stale))
+    return result
+
+
+@routes.get("/api/user/{username}/port")
+async def get_user_port(request):
+    username = request.match_info["username"]
+    port = (await resolve_ports([username]))[username]
+    if port is None:
+        return web.json_response({"error": "not found"}, status=404)
+    return web.json_response({"port": port})
+
+
+@routes.post("/api/users/ports")
+async def get_user_ports(request):
+    if not is_admin(request, allow_service=True):
+        return unauthorized()
+    usernames = (await request.json() or {}).get("usernames") or []
+    if not isinstance(usernames, list) or len(usernames) > 1000:
+        return web.json_response({"error": "usernames must be a list of at most 1000 names"}, status=400)
+    return web.json_response({"ports": await resolve_ports(usernames)})
+
+
+async def watch_container_events():
+    """Keep cached ports current: Docker hands out a new host port on every start"""
+    filters = {"type": ["container"], "event": ["start", "die", "destroy", "rename"]}
+    while True:
+        try:
+            async for event in docker.events(filters):
+                name = ((event.get("Actor") or {}).get("Attributes") or {}).get("name", "")
+                if not name.startswith(CONTAINER_PREFIX):
+                    continue
+                port_resolver.invalidate(name)
+                if event.get("Action") == "start":
+                    try:
+                        attrs = await docker.inspect(name)
+                    except DockerError:
+                        continue
+                    await db(port_resolver.remember, name, attrs)
+                elif event.get("Action") in ("die", "destroy"):
+                    await db(port_resolver.forget, name)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Docker event stream failed; reconnecting")
+        await asyncio.sleep(1)
+
+
+# ===============================
+# CONTAINER LIFECYCLE
+# ===============================
+async def container_action(action, name, stop_timeout):
+    """Docker call for one container; same results as batch_actions._operation()"""
+    if action == "start":
+        await docker.start(name)
+        return "started"
+    if action == "stop":
+        await docker.stop(name, timeout=stop_timeout)
+        return "stopped"
+    try:
+        await docker.remove(name, force=True)
+    except NotFound:
+        # Already gone from Docker; still drop the stale row
+        return "absent"
+    return "deleted"
+
+
+@routes.delete("/api/user/{username}")
+async def delete_user_container(request):
+    name = container_name_for(request.match_info["username"])
+    try:
+        await docker.remove(name, force=True)
+    except DockerError:
+        pass
+    await db(port_resolver.forget, name)
+    return web.json_response({"status": "deleted"})
+
+
+@routes.post("/api/admin/containers/{name}/{action}")
+async def api_admin_container_action(request):
+    if not is_admin(request):
+        return unauthorized()
+    name, action = request.match_info["name"], request.match_info["action"]
+    if action not in CONTAINER_ACTIONS:
+        return web.json_response({"error": f"action must be one of {', '.join(CONTAINER_ACTIONS)}"}, status=400)
+    try:
+        result = await container_action(action, name, BATCH_STOP_TIMEOUT)
+    except NotFound:
+        return web.json_response({"error": "not found"}, status=404)
+    except DockerError as e:
+        return web.json_response({"error": e.message}, status=502)
+    await db(apply_container_action, action, [name])
+    port_resolver.invalidate(name)
+    return web.json_response({"name": name, "result": result})
+
+
+@routes.post("/api/admin/containers/batch")
+async def api_admin_containers_batch(request):
+    """Async batch_actions.run_container_batch(), same request and NDJSON events"""
+    if not is_admin(request):
+        return unauthorized()
+    body = await request.json() or {}
+    action = body.get("action")
+    if action not in CONTAINER_ACTIONS:
+        return web.json_response({"error": f"action must be one of {', '.join(CONTAINER_ACTIONS)}"}, status=400)
+
+    if "names" in body:
+        names = body["names"]
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            return web.json_response({"error": "names must be a list of container names"}, status=400)
+    elif isinstance(body.get("filter"), dict):
+        names = await db(get_container_names, status=body["filter"].get("status"),
+                         username_prefix=body["filter"].get("q"))
+    else:
+        return web.json_response({"error": "names or filter is required"}, status=400)
+
+    try:
+        parallelism = min(max(int(body.get("parallelism", BATCH_PARALLELISM)), 1), BATCH_MAX_PARALLELISM)
+        stop_timeout = min(max(int(body.get("stop_timeout", BATCH_STOP_TIMEOUT)), 0), 300)
+    except (TypeError, ValueError):
+        return web.json_response({"error": "parallelism and stop_timeout must be integers"}, status=400)
+
+    names = list(dict.fromkeys(names))
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(parallelism)
+    pending = []
+    done = failed = 0
+
+    async def run(name):
+        async with slots:
+            try:
+                return name, await container_action(action, name, stop_timeout), None
+            except Exception as e:
+                return name, None, e
+
+    tasks = [asyncio.create_task(run(name)) for name in names]
+    reported = set()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            name, result, error = await next_done
+            reported.add(name)
+            done += 1
+            event = {"type": "progress", "name": name, "done": done, "total": len(names)}
+            if error is None:
+                event.update(status="ok", result=result)
+                pending.append(name)
+                port_resolver.invalidate(name)
+            else:
+                failed += 1
+                event.update(status="error", error=str(error))
+            if len(pending) >= 50:
+                await db(apply_container_action, action, list(pending))
+                pending.clear()
+            await response.write((json.dumps(event) + "\n").encode())
+    finally:
+        # Client gone: queued containers are cancelled, finished ones still recorded
+        for task in tasks:
+            task.cancel()
+        for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(outcome, tuple) and outcome[0] not in reported and outcome[2] is None:
+                pending.append(outcome[0])
+        if pending:
+            await db(apply_container_action, action, list(pending))
+
+    seconds = time.perf_counter() - started
+    await response.write((json.dumps({
+        "type": "summary",
+        "action": action,
+        "total": len(names),
+        "succeeded": done - failed,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "per_second": round(done / seconds, 2) if seconds else 0.0,
+    }) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+# ===============================
+# METRICS
+# ===============================
+@web.middleware
+async def instrument(request, handler):
+    """http_request_duration_seconds, as instrument_app() does for Flask"""
+    start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.add(1)
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        REQUESTS_IN_FLIGHT.add(-1)
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "<unmatched>"
+        if route != "/metrics":
+            REQUEST_LATENCY.observe(time.perf_counter() - start, request.method, route, str(status))
+
+
+@routes.get("/metrics")
+async def prometheus_metrics(request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return unauthorized()
+    text = await db(registry.render)
+    return web.Response(body=text.encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+# ===============================
+# STARTUP
+# ===============================
+async def on_startup(aio_app):
+    global docker, executor, port_resolver, provisioner
+    executor = ThreadPoolExecutor(max_workers=int(os.getenv("ASYNC_DB_THREADS", "8")),
+                                  thread_name_prefix="db")
+    await db(init_db)
+    await db(token_verifier.start)
+    if METRICS_DIR and registry._flusher is None:
+        registry.start_flusher()
+
+    docker = AsyncDocker(max_connections=int(os.getenv("ASYNC_DOCKER_CONNECTIONS", "1000")))
+
+    # Same cache tiers as the Flask app; Docker lookups are done here
+    port_resolver = PortResolver(
+        None,
+        max_entries=int(os.getenv("PORT_CACHE_SIZE", "10000")),
+        ttl=int(os.getenv("PORT_CACHE_TTL", "60"))
+    )
+    aio_app["background"] = [asyncio.create_task(watch_container_events())]
+
+    provisioner = AsyncProvisioner(
+        concurrency=int(os.getenv("ASYNC_PROVISION_CONCURRENCY", "200")),
+        poll_interval=float(os.getenv("PROVISION_POLL_INTERVAL", "1.0"))
+    )
+    provisioner.start()
+
+
+async def on_cleanup(aio_app):
+    token_verifier.stop()
+    await provisioner.stop()
+    for task in aio_app.get("background", []):
+        task.cancel()
+    await asyncio.gather(*aio_app.get("background", []), return_exceptions=True)
+    await docker.close()
+    await db(flush_activity_logs)
+    executor.shutdown(wait=True)
+
+
+def create_app():
+    """aiohttp app factory (one event loop per worker process)"""
+    aio_app = web.Application(middlewares=[instrument])
+    aio_app.add_routes(routes)
+    aio_app.on_startup.append(on_startup)
+    aio_app.on_cleanup.append(on_cleanup)
+    return aio_app
+
+
+# ===============================
+# RUN
+# ===============================
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(), port=int(os.getenv("ASYNC_API_PORT", "5002")))
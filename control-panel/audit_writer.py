@@ -0,0 +1,201 @@
+"""
+SaaS Control Panel - Audit Writer
+Background queue that batches activity_logs inserts into single transactions
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = '''
+    INSERT INTO activity_logs (user_id, container_id, action, details, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+
+def _utc_timestamp():
+    """Same format as SQLite CURRENT_TIMESTAMP, taken when the event happens"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class AuditWriter:
+    """Buffer activity_logs rows and flush them with executemany.
+
+    A batch is written when it reaches batch_size rows or when
+    flush_interval seconds have passed since its first row. In synchronous
+    mode rows are written immediately on the caller's thread (for tests).
+    If the queue is full the caller writes its row itself rather than
+    dropping it, and so does every caller once the writer is closed.
+    """
+
+    def __init__(self, pool, batch_size=200, flush_interval=0.5,
+                 max_queue=10000, synchronous=False):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Guards _closed and enqueuing, so no row lands behind the stop marker
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._written = 0
+        self._batches = 0
+        self._failed = 0
+        self._overflow = 0
+
+    # ------------------------------------------
+    # PUBLIC API
+    # ------------------------------------------
+
+    def write(self, user_id, container_id, action, details):
+        """Record one activity row"""
+        self.write_many([(user_id, container_id, action, details)])
+
+    def write_many(self, rows):
+        """Record several (user_id, container_id, action, details) rows"""
+        stamped = [tuple(row) + (_utc_timestamp(),) for row in rows]
+        if not stamped:
+            return
+        if self.synchronous:
+            self._insert(stamped)
+            return
+
+        overflow = []
+        with self._lock:
+            if self._closed:
+                overflow = stamped
+            else:
+                self._ensure_started()
+                for row in stamped:
+                    try:
+                        self._queue.put_nowait(row)
+                    except queue.Full:
+                        overflow.append(row)
+        if overflow:
+            if not self._closed:
+                with self._stats_lock:
+                    self._overflow += len(overflow)
+            self._insert(overflow)
+
+    def flush(self):
+        """Block until every queued row has been written"""
+        if self._closed:
+            # close() drained the queue; later rows are written inline
+            return
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Drain the queue and stop the background thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            running = self._thread is not None and self._pid == os.getpid()
+            if running:
+                # Blocks only while the queue is full; the writer is emptying it
+                self._queue.put(_STOP)
+        if running:
+            self._thread.join()
+
+    def stats(self):
+        """Snapshot of writer counters"""
+        with self._stats_lock:
+            return {
+                'mode': 'sync' if self.synchronous else 'async',
+                'queued': self._queue.qsize(),
+                'written': self._written,
+                'batches': self._batches,
+                'failed': self._failed,
+                'overflow_writes': self._overflow,
+            }
+
+    # ------------------------------------------
+    # INTERNALS
+    # ------------------------------------------
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == pid:
+                return
+            if self._pid != pid:
+                # Rows queued before a fork belong to the parent process
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._run, name='audit-writer', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _insert(self, rows):
+        try:
+            with self.pool.transaction() as conn:
+                conn.executemany(INSERT_SQL, rows)
+        except sqlite3.Error:
+            logger.exception('Failed to write %d activity log rows', len(rows))
+            with self._stats_lock:
+                self._failed += len(rows)
+            return
+        with self._stats_lock:
+            self._written += len(rows)
+            self._batches += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._insert(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        """Write whatever is still queued after the stop marker"""
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        rows = [item for item in items if item is not _STOP]
+        if rows:
+            self._insert(rows)
+        for _ in items:
+            self._queue.task_done()
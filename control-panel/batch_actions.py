@@ -0,0 +1,96 @@
+"""
+SaaS Control Panel - Batch Container Actions
+Start, stop or delete many containers concurrently, reporting progress as
+each one finishes
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import docker
+
+from database import CONTAINER_ACTIONS, apply_container_action
+
+
+def _operation(client, action, stop_timeout):
+    """Docker call for one container; returns a short result string"""
+    if action == "start":
+        def run(name):
+            client.api.start(name)
+            return "started"
+    elif action == "stop":
+        def run(name):
+            client.api.stop(name, timeout=stop_timeout)
+            return "stopped"
+    else:
+        def run(name):
+            try:
+                client.api.remove_container(name, force=True)
+            except docker.errors.NotFound:
+                # Already gone from Docker; still drop the stale row
+                return "absent"
+            return "deleted"
+    return run
+
+
+def run_container_batch(client, action, names, parallelism=16, stop_timeout=10, flush_every=50):
+    """Run action on every named container, yielding progress as it goes
+
+    Yields one {'type': 'progress', ...} dict per container in completion
+    order, then a {'type': 'summary', ...} dict. Successful containers are
+    recorded in `containers`/`activity_logs` every flush_every completions
+    in one transaction. If the consumer goes away (client disconnect),
+    queued containers are cancelled, running ones finish and are recorded.
+    """
+    if action not in CONTAINER_ACTIONS:
+        raise ValueError(f"unknown action {action!r}")
+    names = list(dict.fromkeys(names))
+    operation = _operation(client, action, stop_timeout)
+    started = time.perf_counter()
+    done = 0
+    failed = 0
+    pending = []
+    recorded = set()
+
+    def flush():
+        if pending:
+            apply_container_action(action, pending)
+            recorded.update(pending)
+            pending.clear()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(names) or 1)),
+                                  thread_name_prefix=f"batch-{action}")
+    futures = {}
+    try:
+        futures = {executor.submit(operation, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            done += 1
+            event = {"type": "progress", "name": name, "done": done, "total": len(names)}
+            try:
+                event.update(status="ok", result=future.result())
+                pending.append(name)
+            except Exception as e:
+                failed += 1
+                event.update(status="error", error=str(e))
+            if len(pending) >= flush_every:
+                flush()
+            yield event
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future, name in futures.items():
+            if (name not in recorded and name not in pending and future.done()
+                    and not future.cancelled() and future.exception() is None):
+                pending.append(name)
+        flush()
+
+    seconds = time.perf_counter() - started
+    yield {
+        "type": "summary",
+        "action": action,
+        "total": len(names),
+        "succeeded": done - failed,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "per_second": round(done / seconds, 2) if seconds else 0.0,
+    }
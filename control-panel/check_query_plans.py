@@ -0,0 +1,20 @@
+"""
+SaaS Control Panel - Query Plan Check
+Fails (exit 1) when a hot query no longer uses its index, e.g. in CI:
+    DB_PATH=/tmp/plans.db python check_query_plans.py
+"""
+
+import json
+import sys
+
+from database import check_query_plans, get_schema_version, init_db
+
+
+if __name__ == "__main__":
+    init_db()
+    failures = check_query_plans()
+    for failure in failures:
+        print(json.dumps(failure, indent=2))
+    print(f"schema version {get_schema_version()}: "
+          f"{'OK' if not failures else f'{len(failures)} query plan regression(s)'}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,248 @@
+"""
+SaaS Control Panel - Metrics Collector
+Samples docker stats for every running user-* container on a fixed
+interval and writes them through store_metrics()
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from database import get_container_pk_map, store_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _utc_timestamp():
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def _cpu_percent(current, previous):
+    """CPU usage between two stats snapshots, as docker stats computes it"""
+    cpu = current.get('cpu_stats') or {}
+    prev = previous or {}
+    cpu_delta = cpu.get('cpu_usage', {}).get('total_usage', 0) - \
+        prev.get('cpu_usage', {}).get('total_usage', 0)
+    system_delta = cpu.get('system_cpu_usage', 0) - prev.get('system_cpu_usage', 0)
+    if not prev or cpu_delta <= 0 or system_delta <= 0:
+        return 0.0
+    online = cpu.get('online_cpus') or len(cpu.get('cpu_usage', {}).get('percpu_usage') or []) or 1
+    return round(cpu_delta / system_delta * online * 100.0, 2)
+
+
+def _memory_percent(stats):
+    memory = stats.get('memory_stats') or {}
+    limit = memory.get('limit') or 0
+    if not limit:
+        return 0.0
+    detail = memory.get('stats') or {}
+    # Page cache is not counted as used memory (cgroup v2 / v1 keys)
+    cache = detail.get('inactive_file', detail.get('total_inactive_file', detail.get('cache', 0)))
+    used = max(memory.get('usage', 0) - cache, 0)
+    return round(used / limit * 100.0, 2)
+
+
+def _network_totals(stats):
+    rx = tx = 0
+    for iface in (stats.get('networks') or {}).values():
+        rx += iface.get('rx_bytes', 0)
+        tx += iface.get('tx_bytes', 0)
+    return rx, tx
+
+
+class MetricsCollector:
+    """Sample every running user-* container once per interval.
+
+    Stats calls run in a bounded thread pool. With one_shot enabled the
+    daemon answers immediately instead of waiting a second for a second
+    sample, and CPU usage is computed against the previous cycle's
+    snapshot. The collector protects itself when it falls behind:
+    a container whose previous sample is still in flight is skipped,
+    samples that miss the cycle deadline are dropped, and ticks missed by
+    an overlong cycle are skipped rather than queued up.
+    """
+
+    def __init__(self, client, interval=10, max_workers=32, one_shot=True,
+                 name_prefix='user-'):
+        self.client = client
+        self.interval = interval
+        self.max_workers = max_workers
+        self.one_shot = one_shot
+        self.name_prefix = name_prefix
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._previous_cpu = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._cycles = 0
+        self._skipped_cycles = 0
+        self._samples = 0
+        self._dropped = 0
+        self._errors = 0
+        self._last_cycle = {}
+        self._total_cycle_seconds = 0.0
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='stats-sampler'
+        )
+        self._thread = threading.Thread(target=self._run, name='metrics-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.collect_once()
+            except Exception:
+                logger.exception('Metrics collection cycle failed')
+                with self._lock:
+                    self._errors += 1
+
+            next_tick += self.interval
+            now = time.monotonic()
+            if now > next_tick:
+                # Fell behind: skip the ticks we missed instead of bunching up
+                missed = int((now - next_tick) // self.interval) + 1
+                with self._lock:
+                    self._skipped_cycles += missed
+                next_tick += missed * self.interval
+            self._stop.wait(max(next_tick - time.monotonic(), 0))
+
+    # ------------------------------------------
+    # COLLECTION
+    # ------------------------------------------
+
+    def discover(self):
+        """Docker ids of running user containers, mapped to their containers.id"""
+        listed = self.client.api.containers(filters={'name': self.name_prefix, 'status': 'running'})
+        pk_map = get_container_pk_map()
+        found = {}
+        for entry in listed:
+            names = [n.lstrip('/') for n in entry.get('Names') or []]
+            if not any(n.startswith(self.name_prefix) for n in names):
+                continue
+            pk = pk_map.get(entry['Id'])
+            if pk is not None:
+                found[entry['Id']] = pk
+        return found
+
+    def _sample(self, docker_id):
+        try:
+            if self.one_shot:
+                return self.client.api.stats(docker_id, stream=False, one_shot=True)
+            return self.client.api.stats(docker_id, stream=False)
+        finally:
+            with self._lock:
+                self._in_flight.discard(docker_id)
+
+    def collect_once(self):
+        """Run one sampling cycle; returns the number of samples written"""
+        started = time.monotonic()
+        cpu_started = time.process_time()
+        deadline = self.interval * 0.9
+
+        targets = self.discover()
+        futures = {}
+        dropped = 0
+        for docker_id in targets:
+            with self._lock:
+                if docker_id in self._in_flight:
+                    dropped += 1
+                    continue
+                self._in_flight.add(docker_id)
+            futures[self._executor.submit(self._sample, docker_id)] = docker_id
+
+        done, pending = wait(futures, timeout=max(deadline - (time.monotonic() - started), 0))
+        for future in pending:
+            if future.cancel():
+                with self._lock:
+                    self._in_flight.discard(futures[future])
+        dropped += len(pending)
+
+        batch = []
+        errors = 0
+        timestamp = _utc_timestamp()
+        for future in done:
+            docker_id = futures[future]
+            try:
+                stats = future.result()
+            except Exception:
+                errors += 1
+                continue
+            cpu_stats = stats.get('cpu_stats') or {}
+            previous = self._previous_cpu.get(docker_id)
+            if not self.one_shot:
+                previous = stats.get('precpu_stats')
+            self._previous_cpu[docker_id] = cpu_stats
+            rx, tx = _network_totals(stats)
+            batch.append({
+                'container_id': targets[docker_id],
+                'cpu_percent': _cpu_percent(stats, previous),
+                'memory_percent': _memory_percent(stats),
+                'network_in': rx,
+                'network_out': tx,
+                'timestamp': timestamp,
+            })
+
+        # Forget containers that went away
+        for docker_id in list(self._previous_cpu):
+            if docker_id not in targets:
+                del self._previous_cpu[docker_id]
+
+        written = store_metrics(batch)
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._cycles += 1
+            self._samples += written
+            self._dropped += dropped
+            self._errors += errors
+            self._total_cycle_seconds += elapsed
+            self._last_cycle = {
+                'containers': len(targets),
+                'samples': written,
+                'dropped': dropped,
+                'errors': errors,
+                'seconds': round(elapsed, 4),
+                'process_cpu_seconds': round(time.process_time() - cpu_started, 4),
+                'at': timestamp,
+            }
+        return written
+
+    # ------------------------------------------
+    # STATISTICS
+    # ------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'interval_seconds': self.interval,
+                'max_workers': self.max_workers,
+                'one_shot': self.one_shot,
+                'cycles': self._cycles,
+                'skipped_cycles': self._skipped_cycles,
+                'samples_written': self._samples,
+                'dropped_samples': self._dropped,
+                'errors': self._errors,
+                'in_flight': len(self._in_flight),
+                'avg_cycle_seconds': round(self._total_cycle_seconds / self._cycles, 4) if self._cycles else 0.0,
+                'last_cycle': dict(self._last_cycle),
+            }
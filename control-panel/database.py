@@ -5,24 +5,99 @@ SQLite database for users, containers, activity logs, and metrics
 
 import sqlite3
 import os
+import base64
+import time
 from datetime import datetime, timedelta
 import json
 
+from db_pool import ConnectionPool
+from metric_store import (
+    METRIC_RESOLUTIONS,
+    rollup_watermarks,
+    pick_metric_resolution,
+    metric_source,
+    metric_series,
+    utc_timestamp as _utc_timestamp
+)
+from audit_writer import AuditWriter
+from token_store import create_token_tables
+from instrumentation import instrument_functions, register_pool
+
 # Use a shared Docker volume for the database so multiple services can access it
 # The volume will be mounted at /data in the containers
-DB_PATH = os.path.join('/data', 'saas_control_panel.db')
+DB_PATH = os.getenv('DB_PATH', os.path.join('/data', 'saas_control_panel.db'))
+
+pool = ConnectionPool(DB_PATH)
+
+# Activity rows are batched by a background writer; AUDIT_SYNC=1 writes inline (tests)
+audit = AuditWriter(
+    pool,
+    batch_size=int(os.getenv('AUDIT_BATCH_SIZE', '200')),
+    flush_interval=float(os.getenv('AUDIT_FLUSH_INTERVAL', '0.5')),
+    synchronous=os.getenv('AUDIT_SYNC', '0') == '1'
+)
+
+# Admin statistics mode: 'counters' reads the materialized stats_counters
+# table (constant time), 'aggregate' computes everything in one pass
+STATS_MODE = os.getenv('STATS_MODE', 'counters')
+
+def _counter_delta(name, expression):
+    return f"UPDATE stats_counters SET value = value + ({expression}) WHERE name = '{name}';"
+
+def _container_deltas(row, sign):
+    """Counter updates for adding (sign '+') or removing (sign '-') a containers row"""
+    running = f"({row}.status = 'running')"
+    return '\n'.join([
+        _counter_delta('containers', f"{sign}1"),
+        _counter_delta('running_containers', f"{sign}{running}"),
+        _counter_delta('failed_containers', f"{sign}({row}.status = 'error')"),
+        _counter_delta(
+            'running_created_julianday_sum',
+            f"{sign}(CASE WHEN {running} THEN julianday({row}.created_at) ELSE 0 END)"
+        ),
+    ])
+
+STATS_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users BEGIN
+        {_counter_delta('active_users', "COALESCE(NEW.is_active, 0) != 0")}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users BEGIN
+        {_counter_delta('active_users', "-(COALESCE(OLD.is_active, 0) != 0)")}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_stats_users_update AFTER UPDATE OF is_active ON users BEGIN
+        {_counter_delta('active_users', "(COALESCE(NEW.is_active, 0) != 0) - (COALESCE(OLD.is_active, 0) != 0)")}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_stats_containers_insert AFTER INSERT ON containers BEGIN
+        {_container_deltas('NEW', '+')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_stats_containers_delete AFTER DELETE ON containers BEGIN
+        {_container_deltas('OLD', '-')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_stats_containers_update
+    AFTER UPDATE OF status, created_at ON containers BEGIN
+        {_container_deltas('OLD', '-')}
+        {_container_deltas('NEW', '+')}
+    END''',
+]
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the calling thread's pooled database connection"""
+    return pool.acquire()
 
-def init_db():
-    """Initialize database with tables"""
-    conn = get_db()
-    c = conn.cursor()
-    
+def close_db():
+    """Close all pooled connections (e.g. before removing the database file)"""
+    pool.close_all()
+
+def get_pool_stats():
+    """Connection pool counters (hits, misses, lock waits)"""
+    return pool.stats()
+
+def get_audit_stats():
+    """Audit writer counters (queued, written, batches)"""
+    return audit.stats()
+
+def _create_baseline(c):
+    """Schema version 0: the tables as they were before versioned migrations"""
     # Users table
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -35,7 +110,7 @@ def init_db():
             is_active BOOLEAN DEFAULT 1
         )
     ''')
-    
+
     # Containers table
     c.execute('''
         CREATE TABLE IF NOT EXISTS containers (
@@ -51,7 +126,7 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id)
         )
     ''')
-    
+
     # Activity logs table
     c.execute('''
         CREATE TABLE IF NOT EXISTS activity_logs (
@@ -65,7 +140,7 @@ def init_db():
             FOREIGN KEY (container_id) REFERENCES containers(id)
         )
     ''')
-    
+
     # Metrics table (for performance tracking)
     c.execute('''
         CREATE TABLE IF NOT EXISTS metrics (
@@ -79,16 +154,315 @@ def init_db():
             FOREIGN KEY (container_id) REFERENCES containers(id)
         )
     ''')
-    
+
+    # Metric rollups (one row per container per bucket)
+    for _, table, fmt, _ in METRIC_RESOLUTIONS:
+        if fmt is None:
+            continue
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                container_id INTEGER NOT NULL,
+                bucket TIMESTAMP NOT NULL,
+                samples INTEGER NOT NULL,
+                cpu_avg REAL,
+                cpu_max REAL,
+                cpu_min REAL,
+                memory_avg REAL,
+                memory_max REAL,
+                memory_min REAL,
+                network_in INTEGER,
+                network_out INTEGER,
+                PRIMARY KEY (container_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+
+    # Rollup watermarks: everything before compacted_until is in the rollup
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS metrics_rollup_state (
+            resolution TEXT PRIMARY KEY,
+            compacted_until TIMESTAMP NOT NULL
+        )
+    ''')
+
+    # Materialized admin statistics, maintained by the triggers below
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    for statement in STATS_TRIGGERS:
+        c.execute(statement)
+    c.execute('SELECT COUNT(*) FROM stats_counters')
+    if c.fetchone()[0] == 0:
+        _rebuild_stats_counters(c)
+
+    # Provisioning jobs (the table is the queue shared by every worker)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS provisioning_jobs (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            email TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress INTEGER NOT NULL DEFAULT 0,
+            step TEXT,
+            error TEXT,
+            result TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
     # Create indexes for better performance
+    c.execute('CREATE INDEX IF NOT EXISTS idx_provisioning_jobs_status ON provisioning_jobs(status, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_provisioning_jobs_username ON provisioning_jobs(username, status)')
+    for _, table, fmt, _ in METRIC_RESOLUTIONS:
+        if fmt is not None:
+            c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_containers_user_id ON containers(user_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_activity_logs_user_id ON activity_logs(user_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_metrics_container_id ON metrics(container_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics(timestamp)')
-    
-    conn.commit()
-    conn.close()
+
+    # Keyset pagination: (sort key, id) with optional leading filter column
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_containers_created ON containers(created_at, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_containers_status_created ON containers(status, created_at, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp ON activity_logs(timestamp, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_activity_logs_action_timestamp ON activity_logs(action, timestamp, id)')
+
+# ============================================
+# SCHEMA MIGRATIONS
+# ============================================
+
+def _migration_hot_path_indexes(c):
+    """Composite/covering indexes for the per-user, per-name and stats queries"""
+    # users.username already has the UNIQUE autoindex
+    c.execute('DROP INDEX IF EXISTS idx_users_username')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active)')
+    # get_user_activity_logs / user-app activity: user_id then newest first
+    c.execute('DROP INDEX IF EXISTS idx_activity_logs_user_id')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_activity_logs_user_timestamp ON activity_logs(user_id, timestamp, id)')
+    # get_user_containers: user_id ordered by created_at
+    c.execute('DROP INDEX IF EXISTS idx_containers_user_id')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_containers_user_created ON containers(user_id, created_at)')
+    # get_container_by_name, and covering for port lookups (name -> port, status)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_containers_name ON containers(container_name, port, status)')
+
+def _migration_metrics_without_rowid(c):
+    """Store raw metrics clustered by (container_id, timestamp)
+
+    A container's samples for a time range become one contiguous b-tree
+    range. Samples that collide on the key keep the latest row.
+    """
+    c.execute('''
+        CREATE TABLE metrics_v2 (
+            container_id INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            cpu_percent REAL,
+            memory_percent REAL,
+            network_in INTEGER,
+            network_out INTEGER,
+            PRIMARY KEY (container_id, timestamp),
+            FOREIGN KEY (container_id) REFERENCES containers(id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        INSERT OR REPLACE INTO metrics_v2
+            (container_id, timestamp, cpu_percent, memory_percent, network_in, network_out)
+        SELECT container_id, timestamp, cpu_percent, memory_percent, network_in, network_out
+        FROM metrics
+        WHERE timestamp IS NOT NULL
+        ORDER BY id
+    ''')
+    c.execute('DROP TABLE metrics')
+    c.execute('ALTER TABLE metrics_v2 RENAME TO metrics')
+    # Compaction and retention scan every container by time
+    c.execute('CREATE INDEX idx_metrics_timestamp ON metrics(timestamp)')
+
+def _migration_token_tables(c):
+    """Public signing keys and deny list of auth-service tokens
+
+    Only public keys are stored: user containers can read this file.
+    auth-service may have created them already (shared/token_store.py).
+    """
+    create_token_tables(c)
+
+# Applied in order; PRAGMA user_version is the number already applied.
+# Append new steps, never edit or reorder released ones.
+MIGRATIONS = [
+    _migration_hot_path_indexes,
+    _migration_metrics_without_rowid,
+    _migration_token_tables,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn=None):
+    return (conn or get_db()).execute('PRAGMA user_version').fetchone()[0]
+
+def init_db():
+    """Create the baseline schema if needed and apply pending migrations
+
+    Each migration runs in its own write transaction together with the
+    user_version bump, so concurrent starters apply every step once.
+    """
+    with pool.transaction() as conn:
+        if get_schema_version(conn) == 0:
+            _create_baseline(conn.cursor())
+    while True:
+        with pool.transaction() as conn:
+            version = get_schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                break
+            MIGRATIONS[version](conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+
+# Hot query functions and what their plans must contain. check_query_plans()
+# calls each one, captures the SQL it actually runs and plans that, so a
+# changed query is checked as it is. A temp b-tree (sort) fails the check
+# unless the entry allows it (rollup reads GROUP BY bucket).
+# (name, call, expected plan fragments, temp b-tree allowed)
+QUERY_PLAN_EXPECTATIONS = [
+    ('get_user_activity_logs', lambda: get_user_activity_logs(1),
+     ('idx_activity_logs_user_timestamp',), False),
+    ('get_all_activity_logs', lambda: get_all_activity_logs(100),
+     ('idx_activity_logs_timestamp',), False),
+    ('get_container_by_name', lambda: get_container_by_name('user-x'),
+     ('idx_containers_name',), False),
+    ('get_container_ports', lambda: get_container_ports(['user-x', 'user-y']),
+     ('COVERING INDEX idx_containers_name',), False),
+    ('get_user_containers', lambda: get_user_containers(1),
+     ('idx_containers_user_created',), False),
+    ('get_containers_page', lambda: get_containers_page(),
+     ('idx_containers_created',), False),
+    ('get_container_metrics (raw)', lambda: get_container_metrics(1, hours=0.5),
+     ('metrics USING PRIMARY KEY (container_id=? AND timestamp>?)',), False),
+    ('get_container_metrics (1m rollup)', lambda: get_container_metrics(1, hours=24),
+     ('metrics_1m USING PRIMARY KEY', 'metrics USING PRIMARY KEY'), True),
+    ('get_container_metrics (1h rollup)', lambda: get_container_metrics(1, hours=24 * 30),
+     ('metrics_1h USING PRIMARY KEY', 'metrics_1m USING PRIMARY KEY', 'metrics USING PRIMARY KEY'), True),
+    ('get_container_metrics (1d rollup)', lambda: get_container_metrics(1, hours=24 * 365),
+     ('metrics_1d USING PRIMARY KEY', 'metrics_1h USING PRIMARY KEY',
+      'metrics_1m USING PRIMARY KEY', 'metrics USING PRIMARY KEY'), True),
+    ('get_admin_stats (counters)', lambda: get_admin_stats('counters'),
+     ('SCAN stats_counters',), False),
+    ('get_admin_stats (aggregate)', lambda: get_admin_stats('aggregate'),
+     ('COVERING INDEX idx_containers_status_created', 'COVERING INDEX idx_users_active'), False),
+    ('get_token_denylist', lambda: get_token_denylist(),
+     ('idx_token_denylist_expires',), False),
+]
+
+def _planned_queries(conn, call, planner):
+    """EXPLAIN QUERY PLAN lines, from planner, of every SELECT that call() runs on conn"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    plan = []
+    for statement in statements:
+        if statement.lstrip()[:6].upper() == 'SELECT':
+            plan.extend(row[3] for row in planner.execute(f'EXPLAIN QUERY PLAN {statement}'))
+    return plan
+
+def check_query_plans():
+    """Plan every hot query as its function runs it; returns the ones that regressed
+
+    Runs in a transaction that is rolled back: rollup watermarks are added
+    for the levels not compacted yet, so the rollup UNION segments are
+    planned too. Plans come from an uncached connection: SQLite does not
+    re-prepare a cached EXPLAIN after an index is dropped or created.
+    """
+    conn = get_db()
+    planner = sqlite3.connect(pool.db_path, uri=pool.uri, cached_statements=0)
+    failures = []
+    conn.execute('BEGIN')
+    try:
+        for name, _, fmt, _ in METRIC_RESOLUTIONS:
+            if fmt is not None:
+                conn.execute('INSERT OR IGNORE INTO metrics_rollup_state (resolution, compacted_until) VALUES (?, ?)',
+                             (name, '1970-01-01 00:00:00'))
+        for name, call, expected, sort_allowed in QUERY_PLAN_EXPECTATIONS:
+            plan = _planned_queries(conn, call, planner)
+            text = '\n'.join(plan)
+            if (not plan or any(fragment not in text for fragment in expected)
+                    or (not sort_allowed and 'TEMP B-TREE' in text)):
+                failures.append({'query': name, 'expected': list(expected), 'plan': plan})
+    finally:
+        conn.rollback()
+        planner.close()
+    return failures
+
+# ============================================
+# PAGINATION
+# ============================================
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that could not be decoded"""
+
+def encode_cursor(*values):
+    """Opaque cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(values, list) or len(values) != 2:
+        raise InvalidCursor('malformed cursor')
+    return values
+
+def page_size(limit):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def _prefix_range(prefix):
+    """[low, high) bounds matching every string that starts with prefix (index friendly)"""
+    return prefix, prefix + '\U0010ffff'
+
+def _keyset_page(c, select, where, params, order_columns, limit, cursor):
+    """Run a newest-first keyset query and return {'items', 'next_cursor'}"""
+    limit = page_size(limit)
+    where = list(where)
+    params = list(params)
+    if cursor:
+        where.append(f'({", ".join(order_columns)}) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    sql = select
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ' + ', '.join(f'{col} DESC' for col in order_columns) + ' LIMIT ?'
+    params.append(limit + 1)
+
+    c.execute(sql, params)
+    rows = [dict(row) for row in c.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(*(last[col.split('.')[-1]] for col in order_columns))
+    return {'items': rows, 'next_cursor': next_cursor}
+
+def _chunks(values, size=500):
+    """Slices of values that stay under SQLite's bound-parameter limit"""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
 
 # ============================================
 # USER OPERATIONS
@@ -97,15 +471,13 @@ def init_db():
 def create_user(username, email, password):
     """Create a new user"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO users (username, email, password)
-            VALUES (?, ?, ?)
-        ''', (username, email, password))
-        conn.commit()
-        user_id = c.lastrowid
-        conn.close()
+        with pool.transaction() as conn:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO users (username, email, password)
+                VALUES (?, ?, ?)
+            ''', (username, email, password))
+            user_id = c.lastrowid
         return {'success': True, 'user_id': user_id}
     except sqlite3.IntegrityError:
         return {'success': False, 'error': 'Username or email already exists'}
@@ -118,7 +490,6 @@ def get_user_by_username(username):
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE username = ?', (username,))
     user = c.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_user_by_id(user_id):
@@ -127,7 +498,6 @@ def get_user_by_id(user_id):
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE id = ?', (user_id,))
     user = c.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_all_users():
@@ -135,17 +505,77 @@ def get_all_users():
     conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, username, email, created_at FROM users WHERE is_active = 1')
-    users = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return users
+    return [dict(row) for row in c.fetchall()]
+
+def get_users_page(limit=DEFAULT_PAGE_SIZE, cursor=None, username_prefix=None):
+    """One page of active users, newest first, keyset-paginated on (created_at, id)"""
+    where = ['is_active = 1']
+    params = []
+    if username_prefix:
+        where.append('username >= ? AND username < ?')
+        params.extend(_prefix_range(username_prefix))
+    conn = get_db()
+    return _keyset_page(
+        conn.cursor(),
+        'SELECT id, username, email, created_at, last_login FROM users',
+        where, params, ('created_at', 'id'), limit, cursor
+    )
+
+def ensure_users(users):
+    """Create missing users in one transaction
+
+    users is a list of (username, email). Returns username -> user row,
+    or None when the user could not be created (email already taken).
+    """
+    rows = {}
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        c.executemany('''
+            INSERT OR IGNORE INTO users (username, email, password)
+            VALUES (?, ?, '')
+        ''', users)
+        for chunk in _chunks(username for username, _ in users):
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'SELECT * FROM users WHERE username IN ({placeholders})', chunk)
+            rows.update((row['username'], dict(row)) for row in c.fetchall())
+    return {username: rows.get(username) for username, _ in users}
+
+def delete_users(usernames):
+    """Delete users, their containers rows and metrics in one transaction
+
+    Activity logs are kept as the audit trail. Returns the usernames that
+    existed.
+    """
+    deleted = []
+    log_rows = []
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        for chunk in _chunks(usernames):
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'SELECT id, username FROM users WHERE username IN ({placeholders})', chunk)
+            users = c.fetchall()
+            if not users:
+                continue
+            user_ids = [row['id'] for row in users]
+            user_placeholders = ','.join('?' * len(user_ids))
+            c.execute(f'SELECT id FROM containers WHERE user_id IN ({user_placeholders})', user_ids)
+            container_ids = [row['id'] for row in c.fetchall()]
+            if container_ids:
+                container_placeholders = ','.join('?' * len(container_ids))
+                for _, table, _, _ in METRIC_RESOLUTIONS:
+                    c.execute(f'DELETE FROM {table} WHERE container_id IN ({container_placeholders})', container_ids)
+                c.execute(f'DELETE FROM containers WHERE id IN ({container_placeholders})', container_ids)
+            c.execute(f'DELETE FROM users WHERE id IN ({user_placeholders})', user_ids)
+            for row in users:
+                deleted.append(row['username'])
+                log_rows.append((row['id'], None, 'user_deleted', f"User {row['username']} deleted"))
+    audit.write_many(log_rows)
+    return deleted
 
 def update_last_login(user_id):
     """Update last login timestamp"""
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with pool.transaction() as conn:
+        conn.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
 
 # ============================================
 # CONTAINER OPERATIONS
@@ -154,23 +584,54 @@ def update_last_login(user_id):
 def create_container(user_id, container_id, container_name, port):
     """Create container record in database"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO containers (user_id, container_id, container_name, port, status)
-            VALUES (?, ?, ?, ?, 'created')
-        ''', (user_id, container_id, container_name, port))
-        conn.commit()
-        container_pk = c.lastrowid
-        conn.close()
-        
+        with pool.transaction() as conn:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO containers (user_id, container_id, container_name, port, status)
+                VALUES (?, ?, ?, ?, 'created')
+            ''', (user_id, container_id, container_name, port))
+            container_pk = c.lastrowid
+
         # Log activity
         log_activity(user_id, container_pk, 'container_created', f'Created container {container_name}')
-        
+
         return {'success': True, 'container_id': container_pk}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def record_containers(records, action_detail='provisioned'):
+    """Insert or refresh containers rows for running containers in one transaction
+
+    records are dicts with user_id, container_id, container_name and port.
+    Existing rows (matched by name) get the new port and are marked
+    running. Returns container_name -> containers.id.
+    """
+    ids = {}
+    log_rows = []
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        for chunk in _chunks(r['container_name'] for r in records):
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'SELECT id, container_name FROM containers WHERE container_name IN ({placeholders})', chunk)
+            ids.update((row['container_name'], row['id']) for row in c.fetchall())
+        for r in records:
+            name = r['container_name']
+            if name in ids:
+                c.execute('''
+                    UPDATE containers
+                    SET port = COALESCE(?, port), status = 'running', last_started = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (r['port'], ids[name]))
+                continue
+            c.execute('''
+                INSERT INTO containers (user_id, container_id, container_name, port, status, last_started)
+                VALUES (?, ?, ?, ?, 'running', CURRENT_TIMESTAMP)
+            ''', (r['user_id'], r['container_id'], name, r['port'] or 0))
+            ids[name] = c.lastrowid
+            log_rows.append((r['user_id'], c.lastrowid, 'container_created', f'Container {name} {action_detail}'))
+    audit.write_many(log_rows)
+    return ids
+
 def get_user_containers(user_id):
     """Get all containers for a user"""
     conn = get_db()
@@ -182,9 +643,7 @@ def get_user_containers(user_id):
         WHERE user_id = ?
         ORDER BY created_at DESC
     ''', (user_id,))
-    containers = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return containers
+    return [dict(row) for row in c.fetchall()]
 
 def get_all_containers():
     """Get all containers (for admin)"""
@@ -197,9 +656,29 @@ def get_all_containers():
         JOIN users u ON c.user_id = u.id
         ORDER BY c.created_at DESC
     ''')
-    containers = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return containers
+    return [dict(row) for row in c.fetchall()]
+
+def get_containers_page(limit=DEFAULT_PAGE_SIZE, cursor=None, status=None, username_prefix=None):
+    """One page of containers, newest first, keyset-paginated on (created_at, id)"""
+    where = []
+    params = []
+    if status:
+        where.append('c.status = ?')
+        params.append(status)
+    if username_prefix:
+        where.append('u.username >= ? AND u.username < ?')
+        params.extend(_prefix_range(username_prefix))
+    conn = get_db()
+    return _keyset_page(
+        conn.cursor(),
+        '''
+        SELECT c.id, c.container_id, c.container_name, c.port, c.status,
+               c.created_at, c.last_started, u.username, u.id as user_id
+        FROM containers c
+        JOIN users u ON c.user_id = u.id
+        ''',
+        where, params, ('c.created_at', 'c.id'), limit, cursor
+    )
 
 def get_container_by_name(container_name):
     """Get a single container record by its stored name"""
@@ -213,46 +692,171 @@ def get_container_by_name(container_name):
         WHERE c.container_name = ?
     ''', (container_name,))
     row = c.fetchone()
-    conn.close()
     return dict(row) if row else None
 
-def update_container_status(container_id, status):
-    """Update container status"""
+def get_container_pk_map():
+    """Map of Docker container id -> containers.id for every known container"""
     conn = get_db()
     c = conn.cursor()
-    
-    if status == 'running':
-        c.execute('UPDATE containers SET status = ?, last_started = CURRENT_TIMESTAMP WHERE id = ?', 
-                 (status, container_id))
-    elif status == 'stopped':
-        c.execute('UPDATE containers SET status = ?, last_stopped = CURRENT_TIMESTAMP WHERE id = ?', 
-                 (status, container_id))
-    else:
-        c.execute('UPDATE containers SET status = ? WHERE id = ?', (status, container_id))
-    
-    conn.commit()
-    conn.close()
+    c.execute('SELECT id, container_id FROM containers')
+    return {row['container_id']: row['id'] for row in c.fetchall()}
 
-def delete_container(container_id):
-    """Delete container record"""
+def get_container_ports(container_names):
+    """Map of container_name -> {'port', 'status'} for the given names"""
+    ports = {}
+    conn = get_db()
+    c = conn.cursor()
+    for chunk in _chunks(container_names):
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f'''
+            SELECT container_name, port, status
+            FROM containers
+            WHERE container_name IN ({placeholders})
+        ''', chunk)
+        for row in c.fetchall():
+            ports[row['container_name']] = {'port': row['port'], 'status': row['status']}
+    return ports
+
+def update_container_port(container_name, port):
+    """Store the current host port of a container"""
+    with pool.transaction() as conn:
+        conn.execute('UPDATE containers SET port = ? WHERE container_name = ? AND port IS NOT ?',
+                     (port, container_name, port))
+
+def update_container_state(container_name, port):
+    """Store what Docker reports: running on host port, or stopped (port None)
+
+    A stopped container's host port is released, so it is cleared and the
+    row no longer counts as running for port lookups.
+    """
+    with pool.transaction() as conn:
+        if port is not None:
+            conn.execute('''
+                UPDATE containers
+                SET port = ?, status = 'running',
+                    last_started = CASE WHEN status = 'running' THEN last_started ELSE CURRENT_TIMESTAMP END
+                WHERE container_name = ? AND (status IS NOT 'running' OR port IS NOT ?)
+            ''', (port, container_name, port))
+        else:
+            conn.execute('''
+                UPDATE containers
+                SET port = NULL, status = 'stopped', last_stopped = CURRENT_TIMESTAMP
+                WHERE container_name = ? AND status = 'running'
+            ''', (container_name,))
+
+def reconcile_container_states(running, name_prefix):
+    """Align the rows named name_prefix* with a full Docker listing
+
+    running maps the containers running now to their host port; rows
+    still marked running for any other container are marked stopped.
+    Returns the names whose row may have changed.
+    """
+    changed = []
+    with pool.transaction() as conn:
+        marked = {row['container_name']: row['port'] for row in conn.execute('''
+            SELECT container_name, port FROM containers
+            WHERE status = 'running' AND container_name LIKE ?
+        ''', (name_prefix + '%',))}
+        for name in sorted(marked.keys() - running.keys()):
+            update_container_state(name, None)
+            changed.append(name)
+        for name, port in running.items():
+            if marked.get(name) != port:
+                update_container_state(name, port)
+                changed.append(name)
+    return changed
+
+# Batch lifecycle actions: action -> (new status or None to delete the row, activity action, past tense)
+CONTAINER_ACTIONS = {
+    'start': ('running', 'container_started', 'started'),
+    'stop': ('stopped', 'container_stopped', 'stopped'),
+    'delete': (None, 'container_deleted', 'deleted'),
+}
+
+def get_container_names(status=None, username_prefix=None):
+    """Names of the containers matching a dashboard filter"""
+    where = []
+    params = []
+    if status:
+        where.append('c.status = ?')
+        params.append(status)
+    if username_prefix:
+        where.append('u.username >= ? AND u.username < ?')
+        params.extend(_prefix_range(username_prefix))
     conn = get_db()
     c = conn.cursor()
-    c.execute('DELETE FROM containers WHERE id = ?', (container_id,))
-    conn.commit()
-    conn.close()
+    c.execute(f'''
+        SELECT c.container_name
+        FROM containers c
+        JOIN users u ON c.user_id = u.id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY c.container_name
+    ''', params)
+    return [row[0] for row in c.fetchall()]
+
+def apply_container_action(action, container_names):
+    """Record a batch start/stop/delete in one transaction and log it; returns rows touched"""
+    status, activity, done = CONTAINER_ACTIONS[action]
+    log_rows = []
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        for chunk in _chunks(container_names):
+            placeholders = ','.join('?' * len(chunk))
+            c.execute(f'SELECT id, user_id, container_name FROM containers WHERE container_name IN ({placeholders})', chunk)
+            rows = c.fetchall()
+            if not rows:
+                continue
+            ids = [row['id'] for row in rows]
+            id_placeholders = ','.join('?' * len(ids))
+            if status is None:
+                c.execute(f'DELETE FROM containers WHERE id IN ({id_placeholders})', ids)
+            else:
+                stamp = 'last_started' if status == 'running' else 'last_stopped'
+                c.execute(f'UPDATE containers SET status = ?, {stamp} = CURRENT_TIMESTAMP WHERE id IN ({id_placeholders})',
+                          [status] + ids)
+            log_rows.extend(
+                (row['user_id'], row['id'], activity, f"{row['container_name']} {done}")
+                for row in rows
+            )
+    audit.write_many(log_rows)
+    return len(log_rows)
+
+def update_container_status(container_id, status):
+    """Update container status"""
+    with pool.transaction() as conn:
+        c = conn.cursor()
+
+        if status == 'running':
+            c.execute('UPDATE containers SET status = ?, last_started = CURRENT_TIMESTAMP WHERE id = ?', 
+                     (status, container_id))
+        elif status == 'stopped':
+            c.execute('UPDATE containers SET status = ?, last_stopped = CURRENT_TIMESTAMP WHERE id = ?', 
+                     (status, container_id))
+        else:
+            c.execute('UPDATE containers SET status = ? WHERE id = ?', (status, container_id))
+
+def delete_container(container_id):
+    """Delete container record"""
+    with pool.transaction() as conn:
+        conn.execute('DELETE FROM containers WHERE id = ?', (container_id,))
 
 def delete_all_users():
     """Delete all users and their associated data"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        # Delete in order due to foreign keys
-        c.execute('DELETE FROM metrics')
-        c.execute('DELETE FROM activity_logs')
-        c.execute('DELETE FROM containers')
-        c.execute('DELETE FROM users')
-        conn.commit()
-        conn.close()
+        # Write out pending audit rows first so none land after the wipe
+        audit.flush()
+        with pool.transaction() as conn:
+            c = conn.cursor()
+            # Delete in order due to foreign keys
+            c.execute('DELETE FROM metrics')
+            for _, table, fmt, _ in METRIC_RESOLUTIONS:
+                if fmt is not None:
+                    c.execute(f'DELETE FROM {table}')
+            c.execute('DELETE FROM metrics_rollup_state')
+            c.execute('DELETE FROM provisioning_jobs')
+            c.execute('DELETE FROM activity_logs')
+            c.execute('DELETE FROM containers')
+            c.execute('DELETE FROM users')
         return {'success': True, 'message': 'All users deleted'}
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -262,15 +866,12 @@ def delete_all_users():
 # ============================================
 
 def log_activity(user_id, container_id, action, details):
-    """Log an activity"""
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO activity_logs (user_id, container_id, action, details)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, container_id, action, details))
-    conn.commit()
-    conn.close()
+    """Log an activity (queued and written in batches by the audit writer)"""
+    audit.write(user_id, container_id, action, details)
+
+def flush_activity_logs():
+    """Block until every queued activity row is written"""
+    audit.flush()
 
 def get_user_activity_logs(user_id, limit=50):
     """Get activity logs for a user"""
@@ -283,9 +884,7 @@ def get_user_activity_logs(user_id, limit=50):
         ORDER BY timestamp DESC
         LIMIT ?
     ''', (user_id, limit))
-    logs = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return logs
+    return [dict(row) for row in c.fetchall()]
 
 def get_all_activity_logs(limit=100):
     """Get all activity logs (for admin)"""
@@ -298,9 +897,49 @@ def get_all_activity_logs(limit=100):
         ORDER BY al.timestamp DESC
         LIMIT ?
     ''', (limit,))
-    logs = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return logs
+    return [dict(row) for row in c.fetchall()]
+
+def get_last_activity_log_id():
+    """Highest activity log id, 0 if there are none"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT MAX(id) FROM activity_logs')
+    return c.fetchone()[0] or 0
+
+def get_activity_logs_after(after_id, limit=100):
+    """Activity logs with id > after_id, oldest first (live feed tail)"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''
+        SELECT al.id, u.username, al.action, al.details, al.timestamp
+        FROM activity_logs al
+        LEFT JOIN users u ON al.user_id = u.id
+        WHERE al.id > ?
+        ORDER BY al.id
+        LIMIT ?
+    ''', (after_id, limit))
+    return [dict(row) for row in c.fetchall()]
+
+def get_activity_logs_page(limit=DEFAULT_PAGE_SIZE, cursor=None, action=None, username_prefix=None):
+    """One page of activity logs, newest first, keyset-paginated on (timestamp, id)"""
+    where = []
+    params = []
+    if action:
+        where.append('al.action = ?')
+        params.append(action)
+    if username_prefix:
+        where.append('u.username >= ? AND u.username < ?')
+        params.extend(_prefix_range(username_prefix))
+    conn = get_db()
+    return _keyset_page(
+        conn.cursor(),
+        '''
+        SELECT al.id, u.username, al.action, al.details, al.timestamp
+        FROM activity_logs al
+        LEFT JOIN users u ON al.user_id = u.id
+        ''',
+        where, params, ('al.timestamp', 'al.id'), limit, cursor
+    )
 
 # ============================================
 # METRICS OPERATIONS
@@ -308,95 +947,407 @@ def get_all_activity_logs(limit=100):
 
 def store_metric(container_id, cpu_percent, memory_percent, network_in=0, network_out=0):
     """Store container metric"""
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO metrics (container_id, cpu_percent, memory_percent, network_in, network_out)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (container_id, cpu_percent, memory_percent, network_in, network_out))
-    conn.commit()
-    conn.close()
+    store_metrics([{
+        'container_id': container_id,
+        'cpu_percent': cpu_percent,
+        'memory_percent': memory_percent,
+        'network_in': network_in,
+        'network_out': network_out,
+    }])
+
+def store_metrics(batch):
+    """Store many container metrics in one transaction
+
+    Each item is a dict with container_id, cpu_percent, memory_percent and
+    optionally network_in, network_out and timestamp (UTC, defaults to now).
+    A second sample for the same container and second replaces the first.
+    Returns the number of rows written.
+    """
+    now = _utc_timestamp()
+    rows = [(
+        m['container_id'],
+        m.get('cpu_percent'),
+        m.get('memory_percent'),
+        m.get('network_in', 0),
+        m.get('network_out', 0),
+        m.get('timestamp') or now,
+    ) for m in batch]
+    if not rows:
+        return 0
+
+    with pool.transaction() as conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO metrics (container_id, cpu_percent, memory_percent, network_in, network_out, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+    return len(rows)
+
+def get_rollup_watermarks(conn=None):
+    """Map of resolution -> compacted_until for every compacted rollup"""
+    return rollup_watermarks(conn or get_db())
 
 def get_container_metrics(container_id, hours=7):
-    """Get metrics for a container (last N hours)"""
+    """Get metrics for a container (last N hours)
+
+    Reads from the coarsest resolution that still gives a useful number of
+    points for the window; bucketed rows carry per-bucket averages.
+    """
+    window = int(hours * 3600)
+    since = _utc_timestamp(window)
+    resolution = pick_metric_resolution(window)
+    name, table, fmt, _ = resolution
     conn = get_db()
     c = conn.cursor()
-    
-    since = datetime.now() - timedelta(hours=hours)
-    c.execute('''
-        SELECT cpu_percent, memory_percent, network_in, network_out, timestamp
-        FROM metrics
-        WHERE container_id = ? AND timestamp > ?
+
+    if fmt is None:
+        c.execute('''
+            SELECT cpu_percent, memory_percent, network_in, network_out, timestamp
+            FROM metrics
+            WHERE container_id = ? AND timestamp > ?
+            ORDER BY timestamp ASC
+        ''', (container_id, since))
+        return [dict(row) for row in c.fetchall()]
+
+    source, params = metric_source(resolution, container_id, since, get_rollup_watermarks(conn))
+    c.execute(f'''
+        SELECT
+            SUM(cpu_avg * samples) / SUM(CASE WHEN cpu_avg IS NOT NULL THEN samples END) AS cpu_percent,
+            SUM(memory_avg * samples) / SUM(CASE WHEN memory_avg IS NOT NULL THEN samples END) AS memory_percent,
+            MAX(network_in) AS network_in,
+            MAX(network_out) AS network_out,
+            strftime('{fmt}', ts) AS timestamp
+        FROM ({source})
+        GROUP BY strftime('{fmt}', ts)
         ORDER BY timestamp ASC
-    ''', (container_id, since.isoformat()))
-    
-    metrics = [dict(row) for row in c.fetchall()]
-    conn.close()
-    return metrics
+    ''', params)
+    return [dict(row) for row in c.fetchall()]
 
-def get_container_stats(container_id):
+def get_container_stats(container_id, days=7):
     """Get aggregated stats for a container"""
+    window = int(days * 86400)
+    # Hourly buckets keep the window edge error under one hour for a week
+    resolution = pick_metric_resolution(window, min_points=24)
     conn = get_db()
     c = conn.cursor()
-    
-    c.execute('''
+
+    source, params = metric_source(
+        resolution, container_id, _utc_timestamp(window), get_rollup_watermarks(conn)
+    )
+    c.execute(f'''
         SELECT 
-            AVG(cpu_percent) as avg_cpu,
-            MAX(cpu_percent) as max_cpu,
-            AVG(memory_percent) as avg_memory,
-            MAX(memory_percent) as max_memory
-        FROM metrics
-        WHERE container_id = ? AND timestamp > datetime('now', '-7 days')
-    ''', (container_id,))
+            SUM(cpu_avg * samples) / SUM(CASE WHEN cpu_avg IS NOT NULL THEN samples END) as avg_cpu,
+            MAX(cpu_max) as max_cpu,
+            SUM(memory_avg * samples) / SUM(CASE WHEN memory_avg IS NOT NULL THEN samples END) as avg_memory,
+            MAX(memory_max) as max_memory
+        FROM ({source})
+    ''', params)
     
-    stats = dict(c.fetchone() or {})
-    conn.close()
-    return stats
+    return dict(c.fetchone() or {})
+
+def get_container_series(container_id, since, until, step, aggregates=('avg', 'max')):
+    """Bucketed CPU/memory columns for charts (see metric_store.metric_series)"""
+    conn = get_db()
+    return metric_series(conn, container_id, since, until, step, aggregates,
+                         watermarks=get_rollup_watermarks(conn))
 
 # ============================================
-# STATISTICS
+# EXPORTS
 # ============================================
 
-def get_admin_stats():
-    """Get admin dashboard statistics"""
+EXPORT_BATCH_SIZE = 1000
+
+def _export_cursor(query, params, batch_size=EXPORT_BATCH_SIZE):
+    """Run query now and return (columns, row iterator) reading fetchmany batches
+
+    The statement keeps one read snapshot until the iterator is exhausted
+    or closed, so an export is consistent even while rows are written.
+    """
+    c = get_db().cursor()
+    c.execute(query, params)
+    columns = [d[0] for d in c.description]
+
+    def rows():
+        try:
+            while True:
+                batch = c.fetchmany(batch_size)
+                if not batch:
+                    return
+                for row in batch:
+                    yield tuple(row)
+        finally:
+            c.close()
+
+    return columns, rows()
+
+def _time_range(column, since, until):
+    where = []
+    params = []
+    if since:
+        where.append(f'{column} >= ?')
+        params.append(since)
+    if until:
+        where.append(f'{column} < ?')
+        params.append(until)
+    return where, params
+
+def export_activity_logs(since=None, until=None, action=None, batch_size=EXPORT_BATCH_SIZE):
+    """(columns, rows) of activity logs in [since, until), oldest first"""
+    where, params = _time_range('al.timestamp', since, until)
+    if action:
+        where.insert(0, 'al.action = ?')
+        params.insert(0, action)
+    return _export_cursor(f'''
+        SELECT al.id, al.timestamp, al.user_id, u.username,
+               al.container_id, c.container_name, al.action, al.details
+        FROM activity_logs al
+        LEFT JOIN users u ON al.user_id = u.id
+        LEFT JOIN containers c ON al.container_id = c.id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY al.timestamp, al.id
+    ''', params, batch_size)
+
+def export_metrics(since=None, until=None, container_id=None, resolution='raw', batch_size=EXPORT_BATCH_SIZE):
+    """(columns, rows) of metrics at one resolution in [since, until), oldest first"""
+    tables = {name: table for name, table, _, _ in METRIC_RESOLUTIONS}
+    if resolution not in tables:
+        raise ValueError(f'unknown resolution {resolution!r}')
+    table = tables[resolution]
+    time_column = 'm.timestamp' if resolution == 'raw' else 'm.bucket'
+    where, params = _time_range(time_column, since, until)
+    if container_id is not None:
+        where.insert(0, 'm.container_id = ?')
+        params.insert(0, container_id)
+    if resolution == 'raw':
+        select = '''m.timestamp, m.container_id, c.container_name,
+               m.cpu_percent, m.memory_percent, m.network_in, m.network_out'''
+        order = 'm.timestamp, m.container_id'
+    else:
+        select = '''m.bucket, m.container_id, c.container_name, m.samples,
+               m.cpu_avg, m.cpu_max, m.cpu_min,
+               m.memory_avg, m.memory_max, m.memory_min,
+               m.network_in, m.network_out'''
+        order = 'm.bucket, m.container_id'
+    return _export_cursor(f'''
+        SELECT {select}
+        FROM {table} m
+        LEFT JOIN containers c ON m.container_id = c.id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {order}
+    ''', params, batch_size)
+
+# ============================================
+# PROVISIONING JOBS
+# ============================================
+
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+def _job_dict(row):
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job.get('result') else None
+    return job
+
+def create_provisioning_job(job_id, username, email):
+    """Insert a queued job unless one with this id (or an active one for the user) exists
+
+    Returns (job, created).
+    """
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        c.execute('SELECT * FROM provisioning_jobs WHERE id = ?', (job_id,))
+        row = c.fetchone()
+        if row is None:
+            c.execute('''
+                SELECT * FROM provisioning_jobs
+                WHERE username = ? AND status IN (?, ?)
+                ORDER BY created_at LIMIT 1
+            ''', (username,) + ACTIVE_JOB_STATUSES)
+            row = c.fetchone()
+        if row is not None:
+            return _job_dict(row), False
+
+        c.execute('''
+            INSERT INTO provisioning_jobs (id, username, email)
+            VALUES (?, ?, ?)
+        ''', (job_id, username, email))
+        c.execute('SELECT * FROM provisioning_jobs WHERE id = ?', (job_id,))
+        return _job_dict(c.fetchone()), True
+
+def get_provisioning_job(job_id):
+    """Get a provisioning job by id"""
     conn = get_db()
     c = conn.cursor()
-    
-    # Total users
-    c.execute('SELECT COUNT(*) as count FROM users WHERE is_active = 1')
-    total_users = c.fetchone()['count']
-    
-    # Total containers
-    c.execute('SELECT COUNT(*) as count FROM containers')
-    total_containers = c.fetchone()['count']
-    
-    # Running containers
-    c.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'running'")
-    running_containers = c.fetchone()['count']
-    
-    # Failed containers
-    c.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'error'")
-    failed_containers = c.fetchone()['count']
-    
-    # Average uptime
+    c.execute('SELECT * FROM provisioning_jobs WHERE id = ?', (job_id,))
+    row = c.fetchone()
+    return _job_dict(row) if row else None
+
+def claim_provisioning_job():
+    """Atomically move the oldest queued job to running and return it (or None)"""
+    with pool.transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT id FROM provisioning_jobs
+            WHERE status = 'queued'
+            ORDER BY created_at
+            LIMIT 1
+        ''')
+        row = c.fetchone()
+        if row is None:
+            return None
+        c.execute('''
+            UPDATE provisioning_jobs
+            SET status = 'running', attempts = attempts + 1,
+                started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (row['id'],))
+        c.execute('SELECT * FROM provisioning_jobs WHERE id = ?', (row['id'],))
+        return _job_dict(c.fetchone())
+
+def update_provisioning_job(job_id, status=None, progress=None, step=None, error=None, result=None):
+    """Record progress or the outcome of a job"""
+    fields = ['updated_at = CURRENT_TIMESTAMP']
+    params = []
+    if status is not None:
+        fields.append('status = ?')
+        params.append(status)
+        if status in ('succeeded', 'failed'):
+            fields.append('finished_at = CURRENT_TIMESTAMP')
+    if progress is not None:
+        fields.append('progress = ?')
+        params.append(progress)
+    if step is not None:
+        fields.append('step = ?')
+        params.append(step)
+    if error is not None:
+        fields.append('error = ?')
+        params.append(error)
+    if result is not None:
+        fields.append('result = ?')
+        params.append(json.dumps(result))
+    params.append(job_id)
+    with pool.transaction() as conn:
+        conn.execute(f'UPDATE provisioning_jobs SET {", ".join(fields)} WHERE id = ?', params)
+
+def requeue_stale_jobs(stale_seconds):
+    """Put running jobs with no progress for stale_seconds back in the queue"""
+    with pool.transaction() as conn:
+        cur = conn.execute('''
+            UPDATE provisioning_jobs
+            SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND updated_at < datetime('now', ?)
+        ''', (f'-{int(stale_seconds)} seconds',))
+        return cur.rowcount
+
+def get_provisioning_job_counts():
+    """Number of jobs per status"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT status, COUNT(*) AS count FROM provisioning_jobs GROUP BY status')
+    return {row['status']: row['count'] for row in c.fetchall()}
+
+# ============================================
+# TOKENS
+# ============================================
+
+def get_token_keys():
+    """{kid: public key} of the token signing keys still in use"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT kid, public_key FROM token_keys WHERE expires_at > ?', (time.time(),))
+    return {row['kid']: row['public_key'] for row in c.fetchall()}
+
+def get_token_denylist():
+    """Revoked tokens and subjects whose tokens may still be unexpired"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT jti, subject, revoked_at FROM token_denylist WHERE expires_at > ?', (time.time(),))
+    return [dict(row) for row in c.fetchall()]
+
+def revoke_token(jti, expires_at):
+    """Deny one token until it would have expired (admin logout here)"""
+    with pool.transaction() as conn:
+        conn.execute('''
+            INSERT INTO token_denylist (jti, revoked_at, expires_at)
+            VALUES (?, ?, ?)
+        ''', (jti, time.time(), expires_at))
+
+# ============================================
+# STATISTICS
+# ============================================
+
+def _rebuild_stats_counters(c):
+    """Recompute every counter from the base tables with one aggregate pass"""
     c.execute('''
-        SELECT 
-            AVG(CAST((julianday('now') - julianday(created_at)) AS FLOAT)) as avg_days_active
+        SELECT
+            (SELECT COUNT(*) FROM users WHERE COALESCE(is_active, 0) != 0) AS active_users,
+            COUNT(*) AS containers,
+            COALESCE(SUM(status = 'running'), 0) AS running_containers,
+            COALESCE(SUM(status = 'error'), 0) AS failed_containers,
+            COALESCE(SUM(CASE WHEN status = 'running' THEN julianday(created_at) END), 0)
+                AS running_created_julianday_sum
         FROM containers
-        WHERE status = 'running'
     ''')
-    result = c.fetchone()
-    avg_uptime_days = result['avg_days_active'] or 0
-    
-    conn.close()
-    
+    row = c.fetchone()
+    c.executemany(
+        'INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)',
+        [(name, row[name]) for name in row.keys()]
+    )
+
+def rebuild_stats_counters():
+    """Resynchronise the materialized counters with the base tables"""
+    with pool.transaction() as conn:
+        _rebuild_stats_counters(conn.cursor())
+
+def _admin_stats_aggregate(c):
+    c.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM users WHERE is_active = 1) AS total_users,
+            COUNT(*) AS total_containers,
+            COALESCE(SUM(status = 'running'), 0) AS running_containers,
+            COALESCE(SUM(status = 'error'), 0) AS failed_containers,
+            AVG(CASE WHEN status = 'running'
+                THEN julianday('now') - julianday(created_at) END) AS avg_days_active
+        FROM containers
+    ''')
+    return dict(c.fetchone())
+
+def _admin_stats_counters(c):
+    c.execute("SELECT name, value FROM stats_counters")
+    counters = {row['name']: row['value'] for row in c.fetchall()}
+    running = int(counters.get('running_containers', 0))
+    avg_days_active = None
+    if running:
+        c.execute("SELECT julianday('now')")
+        avg_days_active = c.fetchone()[0] - counters['running_created_julianday_sum'] / running
+    return {
+        'total_users': int(counters.get('active_users', 0)),
+        'total_containers': int(counters.get('containers', 0)),
+        'running_containers': running,
+        'failed_containers': int(counters.get('failed_containers', 0)),
+        'avg_days_active': avg_days_active,
+    }
+
+def get_admin_stats(mode=None):
+    """Get admin dashboard statistics"""
+    conn = get_db()
+    c = conn.cursor()
+
+    if (mode or STATS_MODE) == 'aggregate':
+        stats = _admin_stats_aggregate(c)
+    else:
+        stats = _admin_stats_counters(c)
+
     return {
-        'total_users': total_users,
-        'total_containers': total_containers,
-        'running_containers': running_containers,
-        'failed_containers': failed_containers,
-        'avg_uptime_days': round(avg_uptime_days, 2)
+        'total_users': stats['total_users'],
+        'total_containers': stats['total_containers'],
+        'running_containers': stats['running_containers'],
+        'failed_containers': stats['failed_containers'],
+        'avg_uptime_days': round(stats['avg_days_active'] or 0, 2)
     }
 
-# Initialize database on import
-init_db()
+# ============================================
+# INSTRUMENTATION
+# ============================================
+
+# Every public query function is timed (db_call_duration_seconds on /metrics)
+register_pool(pool, 'control-panel')
+instrument_functions(globals(), exclude=('get_db', 'encode_cursor', 'decode_cursor', 'page_size'))
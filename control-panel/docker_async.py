@@ -0,0 +1,179 @@
+"""
+SaaS Control Panel - Async Docker Client
+The few Docker Engine API calls the async API needs, on one aiohttp
+connection pool (unix socket or tcp, from DOCKER_HOST)
+"""
+
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from instrumentation import DOCKER_LATENCY, docker_endpoint
+
+DEFAULT_DOCKER_HOST = "unix:///var/run/docker.sock"
+
+
+class DockerError(Exception):
+    """Error response from the Docker daemon"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status} {message}")
+        self.status = status
+        self.message = message
+
+
+class NotFound(DockerError):
+    pass
+
+
+def container_config(image, options):
+    """Engine API create body for provisioning.user_container_options()"""
+    config = {
+        "Image": image,
+        "Env": [f"{key}={value}" for key, value in (options.get("environment") or {}).items()],
+        "Labels": dict(options.get("labels") or {}),
+        "HostConfig": {},
+    }
+    ports = options.get("ports") or {}
+    if ports:
+        config["ExposedPorts"] = {port: {} for port in ports}
+        config["HostConfig"]["PortBindings"] = {
+            port: [{"HostIp": "", "HostPort": "" if host is None else str(host)}]
+            for port, host in ports.items()
+        }
+    volumes = options.get("volumes") or {}
+    if volumes:
+        config["HostConfig"]["Binds"] = [
+            f"{source}:{volume['bind']}:{volume.get('mode', 'rw')}" for source, volume in volumes.items()
+        ]
+    return config
+
+
+def _demux(data):
+    """stdout+stderr of a non-TTY exec stream (8-byte frame headers)"""
+    output = bytearray()
+    while len(data) >= 8:
+        size = int.from_bytes(data[4:8], "big")
+        output += data[8:8 + size]
+        data = data[8 + size:]
+    return bytes(output)
+
+
+class AsyncDocker:
+    """Docker Engine API over aiohttp.
+
+    One session with up to max_connections connections: a call in flight
+    costs a socket and a coroutine, not a thread. Errors raise DockerError
+    (NotFound for 404); 304 "already started/stopped" is not an error.
+    Calls are timed into docker_api_duration_seconds.
+    """
+
+    def __init__(self, base_url=None, max_connections=1000, timeout=60):
+        base_url = base_url or os.getenv("DOCKER_HOST") or DEFAULT_DOCKER_HOST
+        url = urlsplit(base_url)
+        if url.scheme == "unix":
+            self._socket_path = url.path
+            self.base_url = "http://docker"
+        else:
+            self._socket_path = None
+            self.base_url = f"http://{url.netloc}"
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # Created lazily: a ClientSession belongs to the running event loop
+        if self._session is None:
+            if self._socket_path:
+                connector = aiohttp.UnixConnector(path=self._socket_path, limit=self.max_connections)
+            else:
+                connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, method, path, params=None, body=None, timeout=None, raw=False):
+        start = time.perf_counter()
+        status = "error"
+        # Without an override the session's ClientTimeout applies
+        # (timeout=None would disable it)
+        options = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        try:
+            async with self._get_session().request(
+                method, self.base_url + path, params=params, json=body, **options
+            ) as response:
+                status = str(response.status)
+                data = await response.read()
+                if response.status >= 400:
+                    try:
+                        message = json.loads(data).get("message", "")
+                    except ValueError:
+                        message = data.decode(errors="replace")
+                    raise (NotFound if response.status == 404 else DockerError)(response.status, message)
+        finally:
+            DOCKER_LATENCY.observe(time.perf_counter() - start, method, docker_endpoint(path), status)
+        if raw:
+            return data
+        return json.loads(data) if data else None
+
+    # ------------------------------------------
+    # CONTAINERS
+    # ------------------------------------------
+
+    async def inspect(self, name):
+        return await self.request("GET", f"/containers/{name}/json")
+
+    async def list(self, filters=None, all_=False):
+        params = {"all": "1" if all_ else "0"}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        return await self.request("GET", "/containers/json", params=params)
+
+    async def create(self, name, config):
+        return await self.request("POST", "/containers/create", params={"name": name}, body=config)
+
+    async def start(self, name):
+        await self.request("POST", f"/containers/{name}/start")
+
+    async def stop(self, name, timeout=10):
+        # The daemon waits up to `timeout` seconds before killing
+        await self.request("POST", f"/containers/{name}/stop", params={"t": str(timeout)},
+                           timeout=self.timeout + timeout)
+
+    async def remove(self, name, force=True):
+        await self.request("DELETE", f"/containers/{name}", params={"force": "1" if force else "0"})
+
+    async def rename(self, name, new_name):
+        await self.request("POST", f"/containers/{name}/rename", params={"name": new_name})
+
+    async def exec_run(self, name, cmd):
+        """Run cmd in the container and wait for it; returns (exit_code, output)"""
+        created = await self.request("POST", f"/containers/{name}/exec", body={
+            "Cmd": cmd, "AttachStdout": True, "AttachStderr": True,
+        })
+        output = await self.request("POST", f"/exec/{created['Id']}/start",
+                                    body={"Detach": False, "Tty": False}, raw=True)
+        info = await self.request("GET", f"/exec/{created['Id']}/json")
+        return info.get("ExitCode"), _demux(output)
+
+    async def events(self, filters=None):
+        """Async iterator over the daemon's event stream (runs until cancelled)"""
+        params = {"filters": json.dumps(filters)} if filters else None
+        async with self._get_session().get(
+            self.base_url + "/events", params=params,
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=None)
+        ) as response:
+            if response.status >= 400:
+                raise DockerError(response.status, (await response.read()).decode(errors="replace"))
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
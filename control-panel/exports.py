@@ -0,0 +1,80 @@
+"""
+SaaS Control Panel - Exports
+Stream query results as NDJSON or CSV, optionally gzip-compressed, with
+memory bounded by the chunk size rather than the export size
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+
+# Bytes buffered before a chunk is handed to the WSGI server
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def parse_time(value):
+    """ISO-8601 date or datetime -> UTC 'YYYY-MM-DD HH:MM:SS' (the stored format), or None"""
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+
+
+def _csv(columns, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    # Header only (empty export)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _chunked(lines):
+    """Join small text lines into CHUNK_SIZE byte chunks"""
+    parts = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def _gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(columns, rows, fmt='ndjson', compress=False):
+    """Byte chunks of rows rendered as fmt ('ndjson' or 'csv')"""
+    lines = _csv(columns, rows) if fmt == 'csv' else _ndjson(columns, rows)
+    chunks = _chunked(lines)
+    return _gzipped(chunks) if compress else chunks
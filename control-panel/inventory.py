@@ -0,0 +1,239 @@
+"""
+SaaS Control Panel - Container Inventory
+In-process cache of Docker containers keyed by name, kept current from the
+Docker events stream with a periodic full resync
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event actions that need a fresh inspect of the container
+INSPECT_ACTIONS = {'create', 'start', 'restart', 'unpause', 'rename', 'update'}
+STOPPED_ACTIONS = {'die', 'stop', 'kill'}
+
+
+def _host_port_from_summary(ports, private_port=80):
+    """HostPort from the /containers/json Ports list"""
+    for p in ports or []:
+        if p.get('PrivatePort') == private_port and p.get('Type', 'tcp') == 'tcp' and p.get('PublicPort'):
+            return str(p['PublicPort'])
+    return None
+
+
+def _host_port_from_inspect(attrs, private_port=80):
+    """HostPort from a full inspect (NetworkSettings.Ports)"""
+    ports = (attrs.get('NetworkSettings') or {}).get('Ports') or {}
+    bindings = ports.get(f'{private_port}/tcp')
+    if bindings and bindings[0].get('HostPort'):
+        return bindings[0]['HostPort']
+    return None
+
+
+class ContainerInventory:
+    """Name -> container summary map for O(1) dashboard and port lookups.
+
+    The initial load and every resync use the sparse list endpoint, which
+    returns ports and state without inspecting each container. Afterwards
+    the Docker events stream keeps entries current; only containers that
+    changed are inspected. Listeners registered with subscribe() are
+    called with (action, entry) for every change.
+    """
+
+    def __init__(self, client, resync_interval=300):
+        self.client = client
+        self.resync_interval = resync_interval
+        self._by_name = {}
+        self._name_by_id = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._threads = []
+        self._loaded = threading.Event()
+        self._events_seen = 0
+        self._resyncs = 0
+        self._last_resync = None
+        self._last_resync_seconds = 0.0
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        if self._threads:
+            return
+        for target, name in ((self._watch_events, 'inventory-events'),
+                             (self._resync_loop, 'inventory-resync')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def subscribe(self, callback):
+        """Call callback(action, entry) after every inventory change"""
+        self._listeners.append(callback)
+
+    # ------------------------------------------
+    # LOOKUPS
+    # ------------------------------------------
+
+    def ensure_loaded(self, timeout=None):
+        """Load synchronously if the first resync has not happened yet"""
+        if not self._loaded.is_set():
+            if self._threads:
+                self._loaded.wait(timeout)
+            if not self._loaded.is_set():
+                self.resync()
+
+    def get(self, name):
+        self.ensure_loaded()
+        with self._lock:
+            entry = self._by_name.get(name)
+            return dict(entry) if entry else None
+
+    def get_port(self, name):
+        entry = self.get(name)
+        return entry['port'] if entry else None
+
+    def list(self):
+        """All containers sorted by name"""
+        self.ensure_loaded()
+        with self._lock:
+            return [dict(self._by_name[name]) for name in sorted(self._by_name)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'containers': len(self._by_name),
+                'events_seen': self._events_seen,
+                'resyncs': self._resyncs,
+                'last_resync': self._last_resync,
+                'last_resync_seconds': round(self._last_resync_seconds, 4),
+            }
+
+    # ------------------------------------------
+    # SYNCHRONISATION
+    # ------------------------------------------
+
+    def resync(self):
+        """Rebuild the whole inventory from one sparse list call"""
+        started = time.perf_counter()
+        summaries = self.client.api.containers(all=True)
+        by_name = {}
+        for summary in summaries:
+            names = [n.lstrip('/') for n in summary.get('Names') or []]
+            if not names:
+                continue
+            by_name[names[0]] = {
+                'id': summary['Id'],
+                'name': names[0],
+                'status': summary.get('State') or 'unknown',
+                'port': _host_port_from_summary(summary.get('Ports')),
+            }
+        with self._lock:
+            self._by_name = by_name
+            self._name_by_id = {entry['id']: name for name, entry in by_name.items()}
+            self._resyncs += 1
+            self._last_resync = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+            self._last_resync_seconds = time.perf_counter() - started
+        self._loaded.set()
+        self._notify('resync', None)
+
+    def _resync_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.resync()
+            except Exception:
+                logger.exception('Container inventory resync failed')
+            if self._stop.wait(self.resync_interval):
+                return
+
+    def _watch_events(self):
+        backoff = 1
+        since = int(time.time())
+        self._loaded.wait()
+        while not self._stop.is_set():
+            try:
+                events = self.client.events(decode=True, filters={'type': 'container'}, since=since)
+                backoff = 1
+                for event in events:
+                    since = event.get('time', since)
+                    self.apply_event(event)
+                    if self._stop.is_set():
+                        return
+            except Exception:
+                logger.exception('Docker events stream interrupted')
+            if self._stop.wait(backoff):
+                return
+            backoff = min(backoff * 2, 30)
+            # Anything may have changed while disconnected
+            since = int(time.time())
+            try:
+                self.resync()
+            except Exception:
+                logger.exception('Container inventory resync failed')
+
+    def apply_event(self, event):
+        """Update the inventory from one Docker container event"""
+        action = (event.get('Action') or event.get('status') or '').split(':')[0]
+        actor = event.get('Actor') or {}
+        container_id = actor.get('ID') or event.get('id')
+        attributes = actor.get('Attributes') or {}
+        if not container_id:
+            return
+
+        with self._lock:
+            self._events_seen += 1
+
+        if action == 'destroy':
+            with self._lock:
+                name = self._name_by_id.pop(container_id, None) or attributes.get('name')
+                entry = self._by_name.pop(name, None)
+            self._notify(action, entry)
+            return
+
+        if action in STOPPED_ACTIONS or action == 'pause':
+            # Known container: update in place, no inspect needed
+            with self._lock:
+                entry = self._by_name.get(self._name_by_id.get(container_id))
+                if entry is not None:
+                    entry['status'] = 'paused' if action == 'pause' else 'exited'
+                    if action != 'pause':
+                        entry['port'] = None
+                    entry = dict(entry)
+            if entry is not None:
+                self._notify(action, entry)
+                return
+        elif action not in INSPECT_ACTIONS:
+            return
+
+        try:
+            attrs = self.client.api.inspect_container(container_id)
+        except Exception:
+            # Already gone; the destroy event will clean up
+            return
+        name = (attrs.get('Name') or '').lstrip('/')
+        entry = {
+            'id': attrs['Id'],
+            'name': name,
+            'status': (attrs.get('State') or {}).get('Status') or 'unknown',
+            'port': _host_port_from_inspect(attrs),
+        }
+        with self._lock:
+            old_name = self._name_by_id.get(entry['id'])
+            if old_name and old_name != name:
+                self._by_name.pop(old_name, None)
+            self._by_name[name] = entry
+            self._name_by_id[entry['id']] = name
+        self._notify(action, dict(entry))
+
+    def _notify(self, action, entry):
+        for callback in list(self._listeners):
+            try:
+                callback(action, entry)
+            except Exception:
+                logger.exception('Inventory listener failed')
@@ -0,0 +1,161 @@
+"""
+SaaS Control Panel - Provisioning Job Queue
+Worker pool that runs provisioning jobs persisted in provisioning_jobs
+"""
+
+import logging
+import threading
+import time
+import uuid
+
+from database import (
+    create_provisioning_job,
+    get_provisioning_job,
+    claim_provisioning_job,
+    update_provisioning_job,
+    requeue_stale_jobs,
+    get_provisioning_job_counts
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisioningQueue:
+    """Run provisioning jobs on a pool of worker threads.
+
+    Jobs are claimed from the database with an atomic queued -> running
+    transition, so several processes can share the queue and jobs
+    survive a restart. submit() wakes an idle worker immediately; idle
+    workers otherwise poll every poll_interval seconds. Running jobs that
+    stop reporting progress for stale_after seconds (e.g. their process
+    died) are requeued at start and then by idle workers, at most every
+    stale_after / 2 seconds, which relies on the handler being safe to
+    re-run.
+    """
+
+    def __init__(self, handler, workers=4, poll_interval=1.0, stale_after=300):
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._succeeded = 0
+        self._failed = 0
+        self._total_seconds = 0.0
+        self._next_requeue = 0.0
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        if self._threads:
+            return
+        self._requeue_stale()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'provision-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # ------------------------------------------
+    # SUBMISSION
+    # ------------------------------------------
+
+    def submit(self, username, email="", job_id=None):
+        """Queue a job; returns (job, created)
+
+        Submitting an existing job_id, or a user that already has an active
+        job, returns that job instead of creating a new one.
+        """
+        job, created = create_provisioning_job(job_id or uuid.uuid4().hex, username, email)
+        if created:
+            with self._wakeup:
+                self._wakeup.notify()
+        return job, created
+
+    def get(self, job_id):
+        return get_provisioning_job(job_id)
+
+    # ------------------------------------------
+    # WORKERS
+    # ------------------------------------------
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = claim_provisioning_job()
+                if job is not None:
+                    self._run(job)
+                    continue
+                if self._requeue_stale():
+                    continue
+            except Exception:
+                logger.exception('Provisioning worker error')
+            with self._wakeup:
+                self._wakeup.wait(self.poll_interval)
+
+    def _requeue_stale(self):
+        """Requeue stale running jobs, at most every stale_after / 2 seconds"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_requeue:
+                return 0
+            self._next_requeue = now + self.stale_after / 2
+        requeued = requeue_stale_jobs(self.stale_after)
+        if requeued:
+            logger.warning('Requeued %d stale provisioning jobs', requeued)
+        return requeued
+
+    def _run(self, job):
+        job_id = job['id']
+        started = time.perf_counter()
+        with self._lock:
+            self._busy += 1
+
+        def progress(percent, step):
+            update_provisioning_job(job_id, progress=percent, step=step)
+
+        try:
+            result = self.handler(job, progress)
+            update_provisioning_job(job_id, status='succeeded', progress=100, result=result)
+            succeeded = True
+        except Exception as e:
+            logger.exception('Provisioning job %s failed', job_id)
+            update_provisioning_job(job_id, status='failed', error=str(e))
+            succeeded = False
+        finally:
+            with self._lock:
+                self._busy -= 1
+                self._total_seconds += time.perf_counter() - started
+
+        with self._lock:
+            if succeeded:
+                self._succeeded += 1
+            else:
+                self._failed += 1
+
+    # ------------------------------------------
+    # STATISTICS
+    # ------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            done = self._succeeded + self._failed
+            local = {
+                'workers': self.workers,
+                'busy_workers': self._busy,
+                'succeeded': self._succeeded,
+                'failed': self._failed,
+                'avg_job_seconds': round(self._total_seconds / done, 4) if done else 0.0,
+            }
+        local['jobs_by_status'] = get_provisioning_job_counts()
+        return local
@@ -0,0 +1,84 @@
+"""
+SaaS Control Panel - Leader Lock
+Elects one process among the server workers to run the background services
+that must not run twice (metrics collector, compactor, warm pool refill)
+"""
+
+import fcntl
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """Exclusive flock on a file next to the database.
+
+    Every worker polls the lock every poll_interval seconds until it gets
+    it; the holder then runs on_acquire once and keeps the lock until it
+    exits. The kernel drops the lock with the process, so when the leader
+    is recycled or killed another worker takes over within poll_interval.
+    """
+
+    def __init__(self, path, poll_interval=5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._on_acquire = None
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self, on_acquire):
+        if self._thread is not None:
+            return
+        self._on_acquire = on_acquire
+        if self._try_acquire():
+            return
+        self._thread = threading.Thread(target=self._run, name="leader-lock", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            if self._try_acquire():
+                return
+
+    def _try_acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        logger.info("Process %d is the leader (%s)", os.getpid(), self.path)
+        try:
+            self._on_acquire()
+        except Exception:
+            logger.exception("Leader startup failed")
+        return True
+
+    # ------------------------------------------
+    # STATISTICS
+    # ------------------------------------------
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def stats(self):
+        try:
+            with open(self.path) as f:
+                holder = int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            holder = None
+        return {"pid": os.getpid(), "is_leader": self.is_leader, "leader_pid": holder}
@@ -0,0 +1,180 @@
+"""
+SaaS Control Panel - Live Feed
+One shared source of dashboard changes (container state, stats, new
+activity logs) fanned out to every Server-Sent Events client
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from database import get_admin_stats, get_last_activity_log_id, get_activity_logs_after
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscriber:
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+
+class ChangeHub:
+    """Publish dashboard changes once and deliver them to all subscribers.
+
+    Container changes come from the inventory listener. Stats and new
+    activity rows come from a single poll thread (so writes from any
+    process are seen), which only queries while someone is subscribed.
+    Events carry increasing ids and the last `history` are kept, so a
+    reconnecting EventSource resumes from Last-Event-ID; a client that
+    fell too far behind gets a 'resync' event instead. Ids are
+    "<epoch>-<seq>" with a per-process epoch: a client reconnecting to
+    another worker, or after a restart, resyncs too.
+    """
+
+    def __init__(self, poll_interval=2.0, history=500, queue_size=1000, heartbeat=15):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.epoch = f'{int(time.time())}.{os.getpid()}'
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_stats = None
+        self._last_log_id = None
+        self._published = 0
+        self._dropped = 0
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception('Live feed poll failed')
+
+    # ------------------------------------------
+    # SOURCES
+    # ------------------------------------------
+
+    def poll_once(self):
+        """Publish changed stats and activity rows written since the last poll"""
+        with self._lock:
+            idle = not self._subscribers
+        if idle:
+            # Nobody listening: skip the queries and start fresh next time
+            self._last_stats = None
+            self._last_log_id = None
+            return
+
+        stats = get_admin_stats()
+        if stats != self._last_stats:
+            self._last_stats = stats
+            self.publish('stats', stats)
+
+        if self._last_log_id is None:
+            self._last_log_id = get_last_activity_log_id()
+            return
+        rows = get_activity_logs_after(self._last_log_id)
+        if rows:
+            self._last_log_id = rows[-1]['id']
+            self.publish('activity', rows)
+
+    def on_container_event(self, action, entry):
+        """Inventory listener"""
+        if entry is None:
+            return
+        self.publish('container', dict(entry, action=action))
+
+    # ------------------------------------------
+    # FAN-OUT
+    # ------------------------------------------
+
+    def publish(self, event, data):
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, event, json.dumps(data, default=str))
+            self._history.append(item)
+            self._published += 1
+            for sub in list(self._subscribers):
+                try:
+                    sub.queue.put_nowait(item)
+                except queue.Full:
+                    # Too slow to keep up: cut it loose, it will resync
+                    sub.overflowed = True
+                    self._subscribers.discard(sub)
+                    self._dropped += 1
+
+    def _parse_event_id(self, event_id):
+        """Sequence number of one of our event ids, None if another process issued it"""
+        epoch, _, seq = event_id.rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def subscribe(self, last_event_id=None):
+        """New subscriber, pre-loaded with the events missed since last_event_id"""
+        sub = _Subscriber(self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                last_seq = self._parse_event_id(last_event_id)
+                oldest = self._history[0][0] if self._history else self._seq + 1
+                if last_seq is None or last_seq > self._seq or last_seq + 1 < oldest:
+                    sub.overflowed = True
+                    return sub
+                for item in self._history:
+                    if item[0] > last_seq:
+                        sub.queue.put_nowait(item)
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stream(self, last_event_id=None):
+        """SSE text for one client; ends after a resync event"""
+        sub = self.subscribe(last_event_id)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                if sub.overflowed:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                try:
+                    seq, event, data = sub.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'id: {self.epoch}-{seq}\nevent: {event}\ndata: {data}\n\n'
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self._published,
+                'dropped_subscribers': self._dropped,
+                'last_event_id': f'{self.epoch}-{self._seq}',
+                'poll_interval': self.poll_interval,
+            }
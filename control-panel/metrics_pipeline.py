@@ -0,0 +1,186 @@
+"""
+SaaS Control Panel - Metrics Pipeline
+Background compaction of raw metric samples into 1m/1h/1d rollups and
+per-resolution retention
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from database import pool, get_rollup_watermarks
+from metric_store import METRIC_RESOLUTIONS, METRIC_RETENTION
+
+logger = logging.getLogger(__name__)
+
+
+def _format(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _parse(timestamp):
+    moment = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class MetricsCompactor:
+    """Roll finished buckets up one level at a time, then apply retention.
+
+    Each level is compacted from the level just below it (raw -> 1m ->
+    1h -> 1d) up to a watermark stored in metrics_rollup_state, so a run
+    only touches buckets that closed since the previous run. Buckets are
+    only compacted once they are `lag` seconds old, leaving time for late
+    samples to arrive. Rows are only deleted by retention once they have
+    been compacted into the next level.
+    """
+
+    def __init__(self, interval=60, lag=30):
+        self.interval = interval
+        self.lag = lag
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._last_run = None
+        self._last_duration = 0.0
+        self._compacted = {name: 0 for name, _, fmt, _ in METRIC_RESOLUTIONS if fmt}
+        self._expired = {name: 0 for name, _, _, _ in METRIC_RESOLUTIONS}
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-compactor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Metrics compaction failed')
+
+    # ------------------------------------------
+    # COMPACTION
+    # ------------------------------------------
+
+    def run_once(self, now=None):
+        """Compact every level then apply retention; returns rows written/deleted"""
+        now = now or time.time()
+        start = time.perf_counter()
+        compacted = {}
+        for index in range(1, len(METRIC_RESOLUTIONS)):
+            compacted[METRIC_RESOLUTIONS[index][0]] = self.compact(index, now)
+        expired = self.apply_retention(now)
+
+        with self._lock:
+            self._runs += 1
+            self._last_run = _format(now)
+            self._last_duration = time.perf_counter() - start
+            for name, rows in compacted.items():
+                self._compacted[name] += rows
+            for name, rows in expired.items():
+                self._expired[name] += rows
+        return {'compacted': compacted, 'expired': expired}
+
+    def compact(self, index, now=None):
+        """Roll the level below `index` into it; returns the number of buckets written"""
+        now = now or time.time()
+        name, table, fmt, step = METRIC_RESOLUTIONS[index]
+        source_name, source_table, source_fmt, _ = METRIC_RESOLUTIONS[index - 1]
+        until_epoch = (now - self.lag) // step * step
+
+        with pool.transaction() as conn:
+            watermarks = get_rollup_watermarks(conn)
+            if source_fmt is not None:
+                # Only compact what the source level itself has finished
+                source_until = watermarks.get(source_name)
+                if source_until is None:
+                    return 0
+                until_epoch = min(until_epoch, _parse(source_until) // step * step)
+            until = _format(until_epoch)
+            since = watermarks.get(name, '')
+            if since >= until:
+                return 0
+
+            if source_fmt is None:
+                select = f'''
+                    SELECT container_id, strftime('{fmt}', timestamp) AS b, COUNT(*),
+                           AVG(cpu_percent), MAX(cpu_percent), MIN(cpu_percent),
+                           AVG(memory_percent), MAX(memory_percent), MIN(memory_percent),
+                           MAX(network_in), MAX(network_out)
+                    FROM {source_table}
+                    WHERE timestamp >= ? AND timestamp < ?
+                    GROUP BY container_id, b'''
+            else:
+                select = f'''
+                    SELECT container_id, strftime('{fmt}', bucket) AS b, SUM(samples),
+                           SUM(cpu_avg * samples) / SUM(CASE WHEN cpu_avg IS NOT NULL THEN samples END),
+                           MAX(cpu_max), MIN(cpu_min),
+                           SUM(memory_avg * samples) / SUM(CASE WHEN memory_avg IS NOT NULL THEN samples END),
+                           MAX(memory_max), MIN(memory_min),
+                           MAX(network_in), MAX(network_out)
+                    FROM {source_table}
+                    WHERE bucket >= ? AND bucket < ?
+                    GROUP BY container_id, b'''
+
+            cur = conn.execute(f'''
+                INSERT OR REPLACE INTO {table} (
+                    container_id, bucket, samples,
+                    cpu_avg, cpu_max, cpu_min,
+                    memory_avg, memory_max, memory_min,
+                    network_in, network_out
+                )
+                {select}
+            ''', (since, until))
+            conn.execute(
+                'INSERT OR REPLACE INTO metrics_rollup_state (resolution, compacted_until) VALUES (?, ?)',
+                (name, until)
+            )
+            return cur.rowcount
+
+    def apply_retention(self, now=None):
+        """Delete rows past each resolution's retention; returns rows deleted per level"""
+        now = now or time.time()
+        expired = {}
+        with pool.transaction() as conn:
+            watermarks = get_rollup_watermarks(conn)
+            for index, (name, table, fmt, _) in enumerate(METRIC_RESOLUTIONS):
+                cutoff = _format(now - METRIC_RETENTION[name])
+                if index + 1 < len(METRIC_RESOLUTIONS):
+                    # Keep anything the next level has not absorbed yet
+                    next_until = watermarks.get(METRIC_RESOLUTIONS[index + 1][0])
+                    if next_until is None:
+                        expired[name] = 0
+                        continue
+                    cutoff = min(cutoff, next_until)
+                column = 'timestamp' if fmt is None else 'bucket'
+                cur = conn.execute(f'DELETE FROM {table} WHERE {column} < ?', (cutoff,))
+                expired[name] = cur.rowcount
+        return expired
+
+    # ------------------------------------------
+    # STATISTICS
+    # ------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None,
+                'interval_seconds': self.interval,
+                'runs': self._runs,
+                'last_run': self._last_run,
+                'last_duration_seconds': round(self._last_duration, 4),
+                'buckets_written': dict(self._compacted),
+                'rows_expired': dict(self._expired),
+            }
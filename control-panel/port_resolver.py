@@ -0,0 +1,212 @@
+"""
+SaaS Control Panel - Port Resolver
+Resolve a user's container host port from an in-memory LRU/TTL cache, then
+the containers table, and only then the Docker daemon
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from database import get_container_ports, reconcile_container_states, update_container_state
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_PREFIX = 'user-'
+
+# Cached answer for containers Docker does not know (or that have no port)
+_NO_PORT = object()
+
+# Container events after which its host port is gone
+GONE_ACTIONS = {'die', 'stop', 'kill', 'destroy'}
+
+
+class PortResolver:
+    """Three-tier lookup for user-<username> host ports.
+
+    A port from the containers table is trusted when the row says the
+    container is running and has a port; anything else goes to Docker,
+    and the answer is written back to the table. Container events from
+    the inventory refresh cached entries and the table: a container that
+    stopped is marked stopped with no port, so neither tier serves it.
+    After an inventory resync the table is reconciled with its snapshot,
+    which covers changes made while the events stream was down.
+    """
+
+    def __init__(self, client, max_entries=10000, ttl=60, negative_ttl=5, inventory=None):
+        self.client = client
+        self.inventory = inventory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._db_hits = 0
+        self._docker_lookups = 0
+        self._not_found = 0
+        self._invalidations = 0
+
+    # ------------------------------------------
+    # CACHE
+    # ------------------------------------------
+
+    def _cache_get(self, name):
+        """Cached port, _NO_PORT for a cached miss, or None if not cached"""
+        with self._lock:
+            item = self._cache.get(name)
+            if item is None:
+                return None
+            port, expires_at = item
+            if expires_at < time.monotonic():
+                del self._cache[name]
+                return None
+            self._cache.move_to_end(name)
+            self._hits += 1
+            return port
+
+    def _cache_put(self, name, port):
+        ttl = self.negative_ttl if port is _NO_PORT else self.ttl
+        with self._lock:
+            self._cache[name] = (port, time.monotonic() + ttl)
+            self._cache.move_to_end(name)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, name):
+        with self._lock:
+            if self._cache.pop(name, None) is not None:
+                self._invalidations += 1
+
+    # ------------------------------------------
+    # LOOKUPS
+    # ------------------------------------------
+
+    def resolve(self, username):
+        """Host port (string) of user-<username>, or None if it has none"""
+        return self.resolve_many([username])[username]
+
+    def resolve_many(self, usernames):
+        """Map of username -> host port (string) or None, in as few round trips as possible"""
+        result, stale = self.lookup(usernames)
+        for username in stale:
+            result[username] = self._resolve_from_docker(CONTAINER_PREFIX + username)
+        return result
+
+    def lookup(self, usernames):
+        """Ports known from the cache or the containers table
+
+        Returns (result, stale): the usernames in stale still need a Docker
+        lookup, whose inspect result goes to remember().
+        """
+        result = {}
+        missing = []
+        for username in usernames:
+            port = self._cache_get(CONTAINER_PREFIX + username)
+            if port is not None:
+                result[username] = None if port is _NO_PORT else port
+            else:
+                missing.append(username)
+        if not missing:
+            return result, []
+
+        rows = get_container_ports([CONTAINER_PREFIX + u for u in missing])
+        stale = []
+        for username in missing:
+            name = CONTAINER_PREFIX + username
+            row = rows.get(name)
+            if row and row['status'] == 'running' and row['port']:
+                port = str(row['port'])
+                self._cache_put(name, port)
+                result[username] = port
+                with self._lock:
+                    self._db_hits += 1
+            else:
+                stale.append(username)
+        return result, stale
+
+    def _resolve_from_docker(self, name):
+        try:
+            attrs = self.client.api.inspect_container(name)
+        except Exception:
+            attrs = {}
+        return self.remember(name, attrs)
+
+    def remember(self, name, attrs):
+        """Cache and store the port of a Docker inspect result ({} if unknown); returns it"""
+        with self._lock:
+            self._docker_lookups += 1
+        bindings = ((attrs.get('NetworkSettings') or {}).get('Ports') or {}).get('80/tcp')
+        if not bindings or not bindings[0].get('HostPort'):
+            with self._lock:
+                self._not_found += 1
+            self._cache_put(name, _NO_PORT)
+            if attrs:
+                # Known but not running ({} may just be Docker unreachable)
+                self._store(name, None)
+            return None
+        port = bindings[0]['HostPort']
+        self._cache_put(name, port)
+        self._store(name, int(port))
+        return port
+
+    def _store(self, name, port):
+        try:
+            update_container_state(name, port)
+        except Exception:
+            logger.exception('Could not store the state of %s', name)
+
+    # ------------------------------------------
+    # INVALIDATION
+    # ------------------------------------------
+
+    def on_container_event(self, action, entry):
+        """Inventory listener: drop or refresh the cached port of a changed container"""
+        if action == 'resync':
+            if self.inventory is not None:
+                self.reconcile(self.inventory.list())
+            return
+        if not entry or not entry.get('name', '').startswith(CONTAINER_PREFIX):
+            return
+        name = entry['name']
+        self.invalidate(name)
+        if entry.get('status') == 'running' and entry.get('port'):
+            # Docker hands out a new host port on every start
+            self._cache_put(name, entry['port'])
+            self._store(name, int(entry['port']))
+        elif action in GONE_ACTIONS:
+            self.forget(name)
+
+    def forget(self, name):
+        """The container stopped or was removed: drop its port from both tiers"""
+        self.invalidate(name)
+        self._store(name, None)
+
+    def reconcile(self, entries):
+        """Store a full inventory snapshot: the running user containers and their ports"""
+        running = {
+            entry['name']: int(entry['port']) for entry in entries
+            if entry['name'].startswith(CONTAINER_PREFIX)
+            and entry.get('status') == 'running' and entry.get('port')
+        }
+        try:
+            changed = reconcile_container_states(running, CONTAINER_PREFIX)
+        except Exception:
+            logger.exception('Could not reconcile container states')
+            return
+        for name in changed:
+            self.invalidate(name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'cache_hits': self._hits,
+                'db_hits': self._db_hits,
+                'docker_lookups': self._docker_lookups,
+                'not_found': self._not_found,
+                'invalidations': self._invalidations,
+            }
@@ -0,0 +1,294 @@
+"""
+SaaS Control Panel - Provisioning
+Create (or adopt) a user's user-app container and record it in the database
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import docker
+
+from database import (
+    get_user_by_username,
+    get_container_by_name,
+    create_user as db_create_user,
+    create_container as db_create_container,
+    update_container_status as db_update_container_status,
+    update_container_port,
+    log_activity,
+    ensure_users,
+    record_containers,
+    delete_users
+)
+
+USER_IMAGE = "user-app"
+
+# Docker volume holding the shared database, mounted read-only into user
+# containers (empty disables the mount)
+USER_DATA_VOLUME = os.getenv("USER_DATA_VOLUME", "saas-data")
+
+# Same rule as the dashboard form validation
+USERNAME_RE = re.compile(r"^[a-zA-Z0-9_-]{3,50}$")
+
+
+class ProvisioningError(Exception):
+    """Provisioning could not complete (the message is safe to show)"""
+
+
+class ReadyTimes:
+    """Recent time-to-ready samples per provisioning path, with percentiles"""
+
+    def __init__(self, size=1000):
+        self._samples = {}
+        self._size = size
+        self._lock = threading.Lock()
+
+    def observe(self, path, seconds):
+        with self._lock:
+            self._samples.setdefault(path, deque(maxlen=self._size)).append(seconds)
+
+    def summary(self):
+        with self._lock:
+            samples = {path: sorted(values) for path, values in self._samples.items()}
+        summary = {}
+        for path, values in samples.items():
+            def pct(p):
+                return round(values[min(int(p / 100 * len(values)), len(values) - 1)], 4)
+            summary[path] = {"count": len(values), "p50": pct(50), "p90": pct(90), "p99": pct(99)}
+        return summary
+
+
+# Time from provisioning start to a running, user-bound container:
+# "warm" when claimed from the warm pool, "cold" when created from scratch
+ready_times = ReadyTimes()
+
+
+def user_container_options(environment, labels=None):
+    """containers.run() keyword arguments shared by user and warm containers"""
+    options = {
+        "detach": True,
+        "ports": {"80/tcp": None},
+        "environment": environment,
+    }
+    if USER_DATA_VOLUME:
+        # user-app reads its own metrics and activity from the shared database
+        options["volumes"] = {USER_DATA_VOLUME: {"bind": "/data", "mode": "ro"}}
+    if labels:
+        options["labels"] = labels
+    return options
+
+
+def container_name_for(username):
+    return f"user-{username}"
+
+
+def host_port(attrs):
+    """Host port bound to 80/tcp in an inspect result, or None"""
+    ports = (attrs.get("NetworkSettings") or {}).get("Ports") or {}
+    bindings = ports.get("80/tcp")
+    if bindings and bindings[0].get("HostPort"):
+        return int(bindings[0]["HostPort"])
+    return None
+
+
+def ensure_user(username, email):
+    """Return the user row, creating it if needed"""
+    user = get_user_by_username(username)
+    if user:
+        return user
+    res = db_create_user(username, email or "", "")
+    if not res.get("success"):
+        raise ProvisioningError(res.get("error", "could not create user"))
+    return get_user_by_username(username)
+
+
+def start_user_container(client, username, email="", warm_pool=None):
+    """Running user-<username> container and how it was obtained: 'existing', 'warm' or 'cold'"""
+    name = container_name_for(username)
+    try:
+        cont = client.containers.get(name)
+        if cont.status != "running":
+            cont.start()
+        return cont, "existing"
+    except docker.errors.NotFound:
+        pass
+    cont = warm_pool.claim(username, email) if warm_pool else None
+    if cont is not None:
+        return cont, "warm"
+    cont = client.containers.run(
+        USER_IMAGE,
+        name=name,
+        **user_container_options({"USERNAME": username, "EMAIL": email})
+    )
+    return cont, "cold"
+
+
+def record_user_container(user, name, container_id, port, action_detail="provisioned"):
+    """Create or update the containers row of a running user container"""
+    rec = get_container_by_name(name)
+    if rec:
+        container_pk = rec["id"]
+        if port:
+            update_container_port(name, port)
+    else:
+        res = db_create_container(user["id"], container_id, name, port or 0)
+        if not res.get("success"):
+            raise ProvisioningError(res.get("error", "could not record container"))
+        container_pk = res["container_id"]
+        log_activity(user["id"], container_pk, "container_created", f"Container {name} {action_detail}")
+    db_update_container_status(container_pk, "running")
+
+
+def provision_user(client, username, email="", action_detail="provisioned", progress=None, warm_pool=None):
+    """Bring up user-<username> and record it; safe to call again after a failure
+
+    An existing container with the same name is adopted (and started)
+    instead of failing on the name conflict, and an existing containers
+    row is reused. Otherwise a container is claimed from warm_pool when
+    one is available, and created from scratch if not.
+    `progress(percent, step)` is called between steps.
+    Returns {'container_name', 'container_id', 'port', 'path'}.
+    """
+    report = progress or (lambda percent, step: None)
+    started = time.perf_counter()
+
+    report(10, "user")
+    user = ensure_user(username, email)
+
+    report(30, "container")
+    cont, path = start_user_container(client, username, user.get("email") or email or "", warm_pool)
+
+    report(70, "inspect")
+    cont.reload()
+    port = host_port(cont.attrs)
+
+    report(90, "record")
+    record_user_container(user, cont.name, cont.id, port, action_detail)
+
+    if path != "existing":
+        ready_times.observe(path, time.perf_counter() - started)
+
+    report(100, "done")
+    return {"container_name": cont.name, "container_id": cont.id, "port": port, "path": path}
+
+
+# ------------------------------------------
+# BULK OPERATIONS
+# ------------------------------------------
+
+def _summary(results, started):
+    seconds = time.perf_counter() - started
+    failed = sum(1 for r in results if r["status"] == "error")
+    return {
+        "requested": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "per_second": round(len(results) / seconds, 2) if seconds else 0.0,
+    }
+
+
+def provision_users(client, users, workers=16, warm_pool=None, action_detail="provisioned"):
+    """Provision many users at once
+
+    users is a list of {'username', 'email'}. The user rows are created in
+    one transaction, the Docker calls run on at most `workers` threads and
+    the containers rows are written in one more transaction.
+    Returns {'results': [...], 'summary': {...}} with one result per user.
+    """
+    started = time.perf_counter()
+    emails = {}
+    for user in users:
+        emails.setdefault(user["username"], user.get("email") or "")
+    results = {u: {"username": u, "status": "error"} for u in emails}
+
+    valid = [u for u in emails if USERNAME_RE.match(u)]
+    for username in emails.keys() - set(valid):
+        results[username]["error"] = "invalid username"
+    rows = ensure_users([(u, emails[u]) for u in valid]) if valid else {}
+    todo = []
+    for username in valid:
+        if rows[username] is None:
+            results[username]["error"] = "Username or email already exists"
+        else:
+            todo.append(rows[username])
+
+    def bring_up(user):
+        t0 = time.perf_counter()
+        cont, path = start_user_container(client, user["username"], user["email"], warm_pool)
+        cont.reload()
+        return cont, path, time.perf_counter() - t0
+
+    records = []
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(workers, len(todo)), thread_name_prefix="bulk-provision") as executor:
+            futures = {executor.submit(bring_up, user): user for user in todo}
+            for future in as_completed(futures):
+                user = futures[future]
+                result = results[user["username"]]
+                try:
+                    cont, path, seconds = future.result()
+                except Exception as e:
+                    result["error"] = str(e)
+                    continue
+                if path != "existing":
+                    ready_times.observe(path, seconds)
+                port = host_port(cont.attrs)
+                records.append({
+                    "user_id": user["id"],
+                    "container_id": cont.id,
+                    "container_name": cont.name,
+                    "port": port
+                })
+                result.update(status="ok", container_name=cont.name, port=port, path=path)
+
+    if records:
+        record_containers(records, action_detail)
+
+    ordered = [results[u] for u in emails]
+    return {"results": ordered, "summary": _summary(ordered, started)}
+
+
+def teardown_users(client, usernames, workers=16):
+    """Remove many users' containers in parallel, then delete the users in one transaction
+
+    Returns {'results': [...], 'summary': {...}} with one result per user.
+    """
+    started = time.perf_counter()
+    usernames = list(dict.fromkeys(usernames))
+    results = {u: {"username": u, "status": "error"} for u in usernames}
+
+    def remove(username):
+        try:
+            client.api.remove_container(container_name_for(username), force=True)
+            return "removed"
+        except docker.errors.NotFound:
+            return "absent"
+
+    removed = []
+    if usernames:
+        with ThreadPoolExecutor(max_workers=min(workers, len(usernames)), thread_name_prefix="bulk-teardown") as executor:
+            futures = {executor.submit(remove, u): u for u in usernames}
+            for future in as_completed(futures):
+                username = futures[future]
+                try:
+                    results[username]["container"] = future.result()
+                except Exception as e:
+                    results[username]["error"] = str(e)
+                    continue
+                removed.append(username)
+
+    deleted = set(delete_users(removed)) if removed else set()
+    for username in removed:
+        result = results[username]
+        if username in deleted or result["container"] == "removed":
+            result["status"] = "deleted"
+        else:
+            result["status"] = "not_found"
+
+    ordered = [results[u] for u in usernames]
+    return {"results": ordered, "summary": _summary(ordered, started)}
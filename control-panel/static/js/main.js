@@ -83,6 +83,8 @@ document.addEventListener('DOMContentLoaded', function() {
   initFormValidation();
   addAccessibilityFeatures();
   initContainerFilter();
+  initBatchActions();
+  initLiveFeed();
 });
 
 // ============================================
@@ -137,23 +139,289 @@ function formatDate(dateString) {
 // ============================================
 
 /**
- * Initialize container table filtering
+ * Build a containers table row (same markup as the server-rendered rows)
+ * @param {object} c - container from /api/admin/containers
+ * @returns {HTMLTableRowElement}
+ */
+function renderContainerRow(c) {
+  const esc = value => String(value ?? '').replace(/[&<>"']/g, ch => (
+    { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[ch]
+  ));
+  const name = esc(c.container_name);
+  const status = esc(c.status || 'unknown');
+  const port = c.port ? esc(c.port) : '';
+  const badge = status.includes('running') ? 'success' : status.includes('paused') ? 'warning' : 'danger';
+
+  const row = document.createElement('tr');
+  row.className = `container-row status-${status.split(' ')[0].toLowerCase()}`;
+  row.innerHTML = `
+    <td><input type="checkbox" class="container-select" value="${name}" aria-label="Select ${name}"></td>
+    <td><strong class="cell-user">${esc(c.username)}</strong></td>
+    <td><code class="container-name cell-name">${name}</code></td>
+    <td><span class="badge badge-${badge} cell-status">${status}</span></td>
+    <td>${port ? `<code class="cell-port">${port}</code>` : '<span class="text-muted cell-port">-</span>'}</td>
+    <td>
+      <div class="action-buttons">
+        <a href="/start/${name}" class="btn btn-success btn-sm" title="Start container">▶ Start</a>
+        <a href="/stop/${name}" class="btn btn-warning btn-sm" onclick="return confirmStop()" title="Stop container">⏸ Stop</a>
+        <a href="/delete/${name}" class="btn btn-danger btn-sm" onclick="return confirmDelete()" title="Delete container permanently">🗑 Delete</a>
+        ${port ? `<a href="http://localhost:${port}" target="_blank" class="btn btn-primary btn-sm" title="Open in browser">🔗 Open</a>` : ''}
+      </div>
+    </td>`;
+  return row;
+}
+
+/**
+ * Initialize container table filtering and paging
+ * Filters run server-side (username prefix and status) against
+ * /api/admin/containers; "Load more" follows the keyset cursor.
  */
 function initContainerFilter() {
   const input = document.getElementById('container-filter');
+  const statusSelect = document.getElementById('container-status-filter');
   const table = document.getElementById('containers-table');
+  const loadMore = document.getElementById('containers-load-more');
   if (!input || !table) return;
 
-  const rows = Array.from(table.querySelectorAll('tbody tr'));
+  const tbody = table.querySelector('tbody');
+  let cursor = table.dataset.nextCursor || null;
+  let timer = null;
+  let request = 0;
+
+  async function load(reset) {
+    const params = new URLSearchParams({ limit: '50' });
+    const q = input.value.trim().replace(/^user-/, '');
+    if (q) params.set('q', q);
+    if (statusSelect && statusSelect.value) params.set('status', statusSelect.value);
+    if (!reset && cursor) params.set('cursor', cursor);
+
+    // Ignore responses that arrive after a newer filter was typed
+    const current = ++request;
+    const res = await fetch(`/api/admin/containers?${params}`, { credentials: 'same-origin' });
+    if (!res.ok || current !== request) return;
+    const data = await res.json();
+
+    if (reset) tbody.innerHTML = '';
+    data.containers.forEach(c => tbody.appendChild(renderContainerRow(c)));
+    cursor = data.next_cursor;
+    if (loadMore) loadMore.hidden = !cursor;
+  }
+
   input.addEventListener('input', function() {
-    const q = input.value.toLowerCase().trim();
-    rows.forEach(row => {
-      const user = (row.querySelector('.cell-user')?.textContent || '').toLowerCase();
-      const name = (row.querySelector('.cell-name')?.textContent || '').toLowerCase();
-      const status = (row.querySelector('.cell-status')?.textContent || '').toLowerCase();
-      const port = (row.querySelector('.cell-port')?.textContent || '').toLowerCase();
-      const match = !q || user.includes(q) || name.includes(q) || status.includes(q) || port.includes(q);
-      row.style.display = match ? '' : 'none';
+    clearTimeout(timer);
+    timer = setTimeout(() => load(true), 250);
+  });
+  if (statusSelect) statusSelect.addEventListener('change', () => load(true));
+  if (loadMore) loadMore.addEventListener('click', () => load(false));
+}
+
+// ============================================
+// BATCH ACTIONS
+// ============================================
+
+/**
+ * Replace a container row with fresh markup (or remove it)
+ * @param {string} name - container name
+ * @param {object|null} change - {status, port}; null removes the row
+ * @returns {boolean} whether a row was found
+ */
+function patchContainerRow(name, change) {
+  const table = document.getElementById('containers-table');
+  if (!table) return false;
+  const box = Array.from(table.querySelectorAll('.container-select')).find(b => b.value === name);
+  const row = box?.closest('tr');
+  if (!row) return false;
+  if (!change) {
+    row.remove();
+    return true;
+  }
+  const port = row.querySelector('code.cell-port')?.textContent || null;
+  const fresh = renderContainerRow({
+    container_name: name,
+    username: row.querySelector('.cell-user')?.textContent || name.replace(/^user-/, ''),
+    status: change.status,
+    port: 'port' in change ? change.port : port
+  });
+  fresh.querySelector('.container-select').checked = box.checked;
+  row.replaceWith(fresh);
+  return true;
+}
+
+/**
+ * POST a batch action and call onEvent for each streamed NDJSON event
+ * @param {string} action - start, stop or delete
+ * @param {string[]} names - container names
+ * @param {function} onEvent
+ */
+async function runContainerBatch(action, names, onEvent) {
+  const res = await fetch('/api/admin/containers/batch', {
+    method: 'POST',
+    credentials: 'same-origin',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ action, names })
+  });
+  if (!res.ok) throw new Error((await res.json()).error || res.statusText);
+
+  // One event per line, possibly split across chunks
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.filter(Boolean).forEach(line => onEvent(JSON.parse(line)));
+  }
+}
+
+/**
+ * Apply a successful batch progress event to its row
+ */
+function applyBatchEvent(action, event) {
+  if (event.type !== 'progress' || event.status !== 'ok') return;
+  if (action === 'delete') {
+    patchContainerRow(event.name, null);
+  } else if (action === 'start') {
+    patchContainerRow(event.name, { status: 'running' });
+  } else {
+    patchContainerRow(event.name, { status: 'stopped', port: null });
+  }
+}
+
+/**
+ * Start, stop or delete the selected containers through the batch API,
+ * and send the per-row buttons through it too instead of reloading the page
+ */
+function initBatchActions() {
+  const table = document.getElementById('containers-table');
+  const progress = document.getElementById('batch-progress');
+  const selectAll = document.getElementById('select-all-containers');
+  const buttons = document.querySelectorAll('[data-batch-action]');
+  if (!table || !buttons.length) return;
+
+  const selected = () => Array.from(table.querySelectorAll('.container-select:checked')).map(box => box.value);
+  const pastTense = { start: 'started', stop: 'stopped', delete: 'deleted' };
+
+  if (selectAll) {
+    selectAll.addEventListener('change', function() {
+      table.querySelectorAll('.container-select').forEach(box => { box.checked = selectAll.checked; });
+    });
+  }
+
+  async function run(action, names) {
+    if (!names.length) return;
+    buttons.forEach(b => { b.disabled = true; });
+    progress.textContent = `0 / ${names.length}`;
+    let failed = 0;
+    try {
+      await runContainerBatch(action, names, event => {
+        applyBatchEvent(action, event);
+        if (event.type === 'progress') {
+          if (event.status !== 'ok') failed += 1;
+          progress.textContent = `${event.done} / ${event.total}${failed ? ` (${failed} failed)` : ''}`;
+        } else if (event.type === 'summary') {
+          progress.textContent = `${event.succeeded} ${pastTense[action]}, ${event.failed} failed in ${event.seconds}s`;
+        }
+      });
+    } catch (err) {
+      progress.textContent = `Batch ${action} failed: ${err.message}`;
+    } finally {
+      buttons.forEach(b => { b.disabled = false; });
+      if (selectAll) selectAll.checked = false;
+    }
+  }
+
+  buttons.forEach(button => {
+    button.addEventListener('click', function() {
+      const action = button.dataset.batchAction;
+      const names = selected();
+      if (!names.length) return;
+      if (action !== 'start' && !confirmAction(`${action === 'stop' ? 'Stop' : 'Delete'} ${names.length} container(s)?`, action)) return;
+      run(action, names);
+    });
+  });
+
+  // Row buttons (/start/<name> etc.): the inline confirm runs first and
+  // cancels the click by preventing the default
+  table.addEventListener('click', function(e) {
+    const link = e.target.closest('a.btn');
+    const match = link && /^\/(start|stop|delete)\/(.+)$/.exec(link.getAttribute('href'));
+    if (!match || e.defaultPrevented) return;
+    e.preventDefault();
+    run(match[1], [decodeURIComponent(match[2])]);
+  });
+}
+
+// ============================================
+// LIVE FEED
+// ============================================
+
+/**
+ * Subscribe to /api/admin/events and patch the dashboard in place
+ */
+function initLiveFeed() {
+  const statValues = document.querySelectorAll('[data-stat]');
+  const timeline = document.querySelector('.activity-timeline');
+  if (!statValues.length || !window.EventSource) return;
+
+  const source = new EventSource('/api/admin/events');
+
+  source.addEventListener('stats', function(e) {
+    const stats = JSON.parse(e.data);
+    statValues.forEach(el => {
+      if (el.dataset.stat in stats) el.textContent = stats[el.dataset.stat];
     });
   });
+
+  source.addEventListener('container', function(e) {
+    const c = JSON.parse(e.data);
+    if (c.action === 'destroy') {
+      patchContainerRow(c.name, null);
+      return;
+    }
+    if (patchContainerRow(c.name, { status: c.status, port: c.port })) return;
+
+    // New user container: show it unless the table is filtered
+    const table = document.getElementById('containers-table');
+    const filter = document.getElementById('container-filter');
+    const statusFilter = document.getElementById('container-status-filter');
+    if (table && c.name.startsWith('user-') && !filter?.value && !statusFilter?.value) {
+      table.querySelector('tbody').prepend(renderContainerRow({
+        container_name: c.name,
+        username: c.name.replace(/^user-/, ''),
+        status: c.status,
+        port: c.port
+      }));
+    }
+  });
+
+  source.addEventListener('activity', function(e) {
+    if (!timeline) return;
+    JSON.parse(e.data).forEach(item => {
+      const div = document.createElement('div');
+      div.className = 'activity-item';
+      const time = document.createElement('span');
+      time.className = 'activity-time';
+      time.textContent = item.timestamp;
+      const text = document.createElement('span');
+      text.className = 'activity-action';
+      const who = document.createElement('strong');
+      who.textContent = item.username || 'system';
+      text.append(who, ` — ${item.action} (${item.details})`);
+      div.append(time, text);
+      timeline.prepend(div);
+    });
+    // Keep the same length as the server-rendered list
+    timeline.querySelectorAll('.activity-item').forEach((el, i) => {
+      if (i >= 10 || !el.querySelector('strong')) el.remove();
+    });
+  });
+
+  // Missed too many events (or the server restarted): reload once
+  source.addEventListener('resync', function() {
+    source.close();
+    window.location.reload();
+  });
 }
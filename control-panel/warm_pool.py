@@ -0,0 +1,199 @@
+"""
+SaaS Control Panel - Warm Pool
+Keep a number of generic user-app containers running so provisioning can
+claim one instead of cold-starting a container
+"""
+
+import logging
+import secrets
+import threading
+import time
+import uuid
+
+from provisioning import user_container_options
+
+logger = logging.getLogger(__name__)
+
+WARM_LABEL = "saas.warm"
+WARM_PREFIX = "warm-"
+
+# Runs inside the claimed container: posts the identity to its own
+# /internal/reconfigure endpoint with the token from the container env
+RECONFIGURE_SCRIPT = (
+    "import json,os,sys,urllib.request;"
+    "req=urllib.request.Request('http://127.0.0.1:80/internal/reconfigure',"
+    "data=json.dumps({'username':sys.argv[1],'email':sys.argv[2]}).encode(),"
+    "headers={'Content-Type':'application/json',"
+    "'X-Reconfigure-Token':os.environ['RECONFIGURE_TOKEN']});"
+    "urllib.request.urlopen(req,timeout=5).read()"
+)
+
+# Succeeds once the app inside the container answers
+READY_SCRIPT = (
+    "import urllib.request;"
+    "urllib.request.urlopen('http://127.0.0.1:80/api/status',timeout=2).read()"
+)
+
+
+class WarmPool:
+    """Pool of running, unassigned user-app containers.
+
+    Warm containers are labelled saas.warm=1 and named warm-<id>. The
+    Docker daemon is the source of truth: each refill pass lists the
+    labelled containers and creates the shortfall, so containers survive
+    control-panel restarts. A claim renames the container to
+    user-<username> first (the rename is atomic, so two processes can
+    never claim the same one), then sets its identity through the
+    container's reconfigure endpoint.
+    """
+
+    def __init__(self, client, image, target_size=0, refill_interval=5, ready_timeout=30):
+        self.client = client
+        self.image = image
+        self.target_size = target_size
+        self.refill_interval = refill_interval
+        self.ready_timeout = ready_timeout
+        self._available = []
+        self._lock = threading.Lock()
+        self._refill_now = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._created = 0
+        self._claimed = 0
+        self._claim_failures = 0
+        self._create_failures = 0
+
+    # ------------------------------------------
+    # LIFECYCLE
+    # ------------------------------------------
+
+    def start(self):
+        """Run the refill loop in this process (one process per deployment)"""
+        if self._thread is not None or self.target_size <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="warm-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._refill_now.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except Exception:
+                logger.exception("Warm pool refill failed")
+            self._refill_now.wait(self.refill_interval)
+            self._refill_now.clear()
+
+    # ------------------------------------------
+    # REFILL
+    # ------------------------------------------
+
+    def _list_warm(self):
+        listed = self.client.api.containers(filters={"label": f"{WARM_LABEL}=1", "status": "running"})
+        names = []
+        for entry in listed:
+            for n in entry.get("Names") or []:
+                if n.lstrip("/").startswith(WARM_PREFIX):
+                    names.append(n.lstrip("/"))
+        return names
+
+    def _wait_ready(self, cont):
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            exit_code, _ = cont.exec_run(["python", "-c", READY_SCRIPT])
+            if exit_code == 0:
+                return True
+            time.sleep(0.5)
+        return False
+
+    def refill(self):
+        """Create containers until the pool holds target_size ready ones"""
+        names = self._list_warm()
+        with self._lock:
+            self._available = names
+        for _ in range(max(self.target_size - len(names), 0)):
+            if self._stop.is_set():
+                return
+            name = f"{WARM_PREFIX}{uuid.uuid4().hex[:12]}"
+            try:
+                cont = self.client.containers.run(
+                    self.image,
+                    name=name,
+                    **user_container_options(
+                        {
+                            "USERNAME": "",
+                            "EMAIL": "",
+                            "RECONFIGURE_TOKEN": secrets.token_urlsafe(24)
+                        },
+                        labels={WARM_LABEL: "1"}
+                    )
+                )
+                if not self._wait_ready(cont):
+                    raise RuntimeError(f"{name} did not become ready")
+            except Exception:
+                logger.exception("Could not create warm container")
+                with self._lock:
+                    self._create_failures += 1
+                continue
+            with self._lock:
+                self._available.append(name)
+                self._created += 1
+
+    # ------------------------------------------
+    # CLAIM
+    # ------------------------------------------
+
+    def claim(self, username, email):
+        """Bind a warm container to the user and return it, or None if the pool is empty"""
+        if self.target_size <= 0:
+            return None
+        if self._thread is None:
+            # Another process (the leader) refills the pool: see what it holds
+            names = self._list_warm()
+            with self._lock:
+                self._available = names
+        target = f"user-{username}"
+        while True:
+            with self._lock:
+                if not self._available:
+                    break
+                name = self._available.pop()
+            try:
+                cont = self.client.containers.get(name)
+                cont.rename(target)
+            except Exception:
+                # Claimed by another process or gone; try the next one
+                continue
+            try:
+                exit_code, output = cont.exec_run(["python", "-c", RECONFIGURE_SCRIPT, username, email or ""])
+                if exit_code != 0:
+                    raise RuntimeError(output.decode(errors="replace") if output else "reconfigure failed")
+            except Exception:
+                logger.exception("Could not reconfigure %s for %s", name, username)
+                with self._lock:
+                    self._claim_failures += 1
+                try:
+                    cont.remove(force=True)
+                except Exception:
+                    pass
+                continue
+            with self._lock:
+                self._claimed += 1
+            self._refill_now.set()
+            return cont
+        self._refill_now.set()
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "target_size": self.target_size,
+                "available": len(self._available),
+                "created": self._created,
+                "claimed": self._claimed,
+                "claim_failures": self._claim_failures,
+                "create_failures": self._create_failures,
+            }
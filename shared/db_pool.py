@@ -0,0 +1,221 @@
+"""
+SaaS Control Panel - Shared SQLite Connection Pool
+Per-thread long-lived connections in WAL mode, used by every service that
+opens the shared database file.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from urllib.parse import unquote
+
+# Pragmas applied to every new connection. Values can be overridden through
+# the environment so they can be tuned per deployment without a rebuild.
+DEFAULT_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+
+
+class _ThreadConnection:
+    """A thread's connection; collected (and the connection closed) when the thread ends"""
+
+    __slots__ = ('conn', 'generation', 'file_id', 'finalizer', '__weakref__')
+
+    def __init__(self, conn, generation, file_id):
+        self.conn = conn
+        self.generation = generation
+        self.file_id = file_id
+        self.finalizer = None
+
+
+class ConnectionPool:
+    """Hand out one long-lived SQLite connection per thread.
+
+    Connections are opened lazily on first use by a thread (a miss) and
+    reused afterwards (a hit). A connection is closed when its thread
+    exits, so short-lived request or executor threads do not leak them.
+    They run in autocommit mode; writes go through transaction(), which
+    takes the write lock up front with BEGIN IMMEDIATE and records how
+    long that took.
+    """
+
+    def __init__(self, db_path, pragmas=None, uri=False):
+        self.db_path = db_path
+        self.uri = uri
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._generation = 0
+        self._pid = os.getpid()
+        self._hits = 0
+        self._misses = 0
+        self._lock_waits = 0
+        self._lock_wait_seconds = 0.0
+        self._lock_timeouts = 0
+
+    # ------------------------------------------
+    # CONNECTIONS
+    # ------------------------------------------
+
+    def _file_path(self):
+        """Filesystem path of the database, also for file: URIs"""
+        if not self.uri:
+            return self.db_path
+        if not self.db_path.startswith('file:'):
+            return None
+        return unquote(self.db_path[5:].split('?', 1)[0])
+
+    def _file_id(self):
+        """Identity of the database file, so a deleted/recreated file is noticed"""
+        path = self._file_path()
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def _connect(self):
+        timeout = self.pragmas.get('busy_timeout', 5000) / 1000.0
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            uri=self.uri
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is None:
+                continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _release(self, conn, pid):
+        """Close a connection whose thread ended or that was replaced"""
+        if os.getpid() != pid:
+            # Inherited through fork: closing it could checkpoint the parent's WAL
+            return
+        with self._lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _discard_local(self):
+        holder = getattr(self._local, 'holder', None)
+        self._local.holder = None
+        if holder is not None:
+            holder.finalizer()
+
+    def acquire(self):
+        """Return the calling thread's connection, opening it if needed"""
+        if os.getpid() != self._pid:
+            # Forked worker: never share a connection with the parent
+            with self._lock:
+                self._pid = os.getpid()
+                self._connections = set()
+                self._generation += 1
+            self._local = threading.local()
+
+        holder = getattr(self._local, 'holder', None)
+        file_id = self._file_id()
+        if holder is not None:
+            if holder.generation == self._generation and holder.file_id == file_id:
+                with self._lock:
+                    self._hits += 1
+                return holder.conn
+            self._discard_local()
+
+        conn = self._connect()
+        # The file may only have been created by the connect above
+        holder = _ThreadConnection(conn, self._generation, file_id or self._file_id())
+        # The thread-local drops the holder when the thread exits
+        holder.finalizer = weakref.finalize(holder, self._release, conn, os.getpid())
+        self._local.holder = holder
+        with self._lock:
+            self._misses += 1
+            self._connections.add(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding the thread's connection for reads"""
+        yield self.acquire()
+
+    @contextmanager
+    def transaction(self):
+        """Context manager running the block in a single write transaction.
+
+        Nested use joins the outer transaction.
+        """
+        conn = self.acquire()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        start = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError:
+            with self._lock:
+                self._lock_timeouts += 1
+                self._lock_wait_seconds += time.perf_counter() - start
+            raise
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._lock_waits += 1
+            self._lock_wait_seconds += waited
+
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if conn.in_transaction:
+                conn.commit()
+
+    def close_all(self):
+        """Close every pooled connection (e.g. before removing the DB file)"""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections = set()
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    # ------------------------------------------
+    # STATISTICS
+    # ------------------------------------------
+
+    def stats(self):
+        """Snapshot of pool counters"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / total, 4) if total else 0.0,
+                'open_connections': len(self._connections),
+                'lock_waits': self._lock_waits,
+                'lock_wait_seconds': round(self._lock_wait_seconds, 6),
+                'lock_timeouts': self._lock_timeouts,
+            }
@@ -0,0 +1,66 @@
+"""
+SaaS Control Panel - gunicorn settings
+Shared by every service: copied next to each app.py, where gunicorn reads
+it by default. Each Dockerfile runs
+
+    gunicorn --bind 0.0.0.0:<port> "app:create_app()"
+
+and everything else is tuned through the environment.
+"""
+
+import glob
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+workers = int(os.getenv("WEB_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+# gthread: each worker serves WEB_THREADS requests at once, which also keeps
+# the SSE streams of the admin dashboard from blocking a whole worker.
+# gevent/eventlet can be used instead when installed in the image.
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_connections = int(os.getenv("WEB_WORKER_CONNECTIONS", "1000"))
+
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+# SIGTERM/SIGHUP: workers finish their requests for up to this many seconds
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Recycle workers after this many requests (0 = never), staggered by the jitter
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "0"))
+
+# create_app() opens the database, Docker clients and threads: it must run
+# in each worker after the fork, never in the master
+preload_app = False
+
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+errorlog = "-"
+
+
+def on_starting(server):
+    # Workers merge their /metrics through this directory (instrumentation.py).
+    # Kept on the arbiter: this file is re-read on every SIGHUP reload.
+    path = os.environ.get("METRICS_DIR")
+    server.created_metrics_dir = None
+    if path:
+        for stale in glob.glob(os.path.join(path, "*.json")):
+            os.remove(stale)
+    else:
+        server.created_metrics_dir = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+
+
+def on_exit(server):
+    if getattr(server, "created_metrics_dir", None):
+        shutil.rmtree(server.created_metrics_dir, ignore_errors=True)
+
+
+def worker_exit(server, worker):
+    # Stop the app's background threads and write the last metrics
+    app = sys.modules.get("app")
+    if app is not None and hasattr(app, "shutdown"):
+        app.shutdown()
+    instrumentation = sys.modules.get("instrumentation")
+    if instrumentation is not None:
+        instrumentation.registry.dump()
@@ -0,0 +1,517 @@
+"""
+SaaS Control Panel - Instrumentation
+Request latency histograms, timers around database functions, Docker API
+and outbound HTTP calls, a Prometheus text endpoint and optional traces of
+slow requests. Shared by every service; no dependency beyond Flask.
+"""
+
+import atexit
+import bisect
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cached reads (sub-millisecond) up to slow container starts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Requests slower than this are written as JSON traces; 0 disables tracing
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '0'))
+# File the traces are appended to; empty = the service log
+SLOW_REQUEST_LOG = os.getenv('SLOW_REQUEST_LOG', '')
+# Spans kept per traced request
+MAX_TRACE_SPANS = 200
+
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Shared by the workers of one server (set by gunicorn.conf.py) so that
+# /metrics reports all of them, whichever worker answers the scrape
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+
+# ============================================
+# METRICS
+# ============================================
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _gauge_lines(name, labels, samples):
+    return [f'{name}{_labels(labels, k)} {_number(v)}' for k, v in sorted(samples.items())]
+
+
+class Histogram:
+    """Cumulative latency histogram per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # bucket counts (+Inf last), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def collect(self):
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._series.items()}
+
+    def format(self, samples):
+        lines = []
+        for values, (counts, total) in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value that goes up and down (e.g. requests in flight)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return dict(self._values)
+
+    def format(self, samples):
+        return _gauge_lines(self.name, self.labels, samples)
+
+
+class Callback:
+    """Metric read at scrape time from fn() -> {label values tuple: value}"""
+
+    def __init__(self, name, help, kind, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labels = tuple(labels)
+
+    def collect(self):
+        try:
+            return dict(self.fn())
+        except Exception:
+            logger.warning('Metric callback %s failed', self.name, exc_info=True)
+            return {}
+
+    def format(self, samples):
+        return _gauge_lines(self.name, self.labels, samples)
+
+
+def _merge_value(current, value):
+    if current is None:
+        return value
+    if isinstance(value, list):
+        # histogram: [bucket counts, sum]
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+    return current + value
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Metrics of this process, or of every worker when METRICS_DIR is set.
+
+    With several server workers each one dumps its samples to
+    METRICS_DIR/<pid>-<start>.json (every METRICS_FLUSH_INTERVAL seconds,
+    at scrape time and on exit) and a scrape sums all the files. Files of
+    exited workers still count for histograms and counters, not for gauges.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._dump_name = None
+        self._flusher = None
+
+    def register(self, metric):
+        """Add metric, or return the one already registered under its name"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def collect(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.collect() for metric in metrics}
+
+    # ------------------------------------------
+    # MULTI-PROCESS
+    # ------------------------------------------
+
+    def dump(self):
+        """Write this process's samples to METRICS_DIR"""
+        if not METRICS_DIR:
+            return
+        pid = os.getpid()
+        if self._dump_name is None or not self._dump_name.startswith(f'{pid}-'):
+            self._dump_name = f'{pid}-{time.time_ns()}.json'
+        data = {name: [[list(k), v] for k, v in samples.items()] for name, samples in self.collect().items()}
+        path = os.path.join(METRICS_DIR, self._dump_name)
+        # Per thread: a scrape and the flusher may dump at the same time
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def start_flusher(self):
+        """Dump periodically and on exit (no-op without METRICS_DIR)"""
+        with self._lock:
+            if not METRICS_DIR or self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush, name='metrics-flusher', daemon=True)
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        self._flusher.start()
+        atexit.register(self.dump)
+
+    def _flush(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                self.dump()
+            except OSError:
+                logger.warning('Could not write metrics to %s', METRICS_DIR, exc_info=True)
+
+    def collect_all(self):
+        """Samples summed over every worker's dump"""
+        self.dump()
+        merged = {}
+        for entry in os.scandir(METRICS_DIR):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(int(entry.name.split('-', 1)[0]))
+            for name, samples in data.items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                target = merged.setdefault(name, {})
+                for labels, value in samples:
+                    key = tuple(labels)
+                    target[key] = _merge_value(target.get(key), value)
+        return merged
+
+    # ------------------------------------------
+    # EXPOSITION
+    # ------------------------------------------
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        samples = self.collect_all() if METRICS_DIR else self.collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.format(samples.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to build the response of a Flask request',
+    ('method', 'route', 'status')))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'http_requests_in_flight', 'Flask requests being handled'))
+DB_LATENCY = registry.register(Histogram(
+    'db_call_duration_seconds', 'Duration of database module functions', ('function',)))
+DOCKER_LATENCY = registry.register(Histogram(
+    'docker_api_duration_seconds', 'Docker Engine API calls, until the response headers',
+    ('method', 'endpoint', 'status')))
+HTTP_CLIENT_LATENCY = registry.register(Histogram(
+    'http_client_request_duration_seconds', 'Outbound HTTP calls to other services',
+    ('method', 'endpoint', 'status')))
+
+
+POOL_METRICS = {
+    'hits': ('sqlite_pool_hits_total', 'counter', 'Pooled connection reuses'),
+    'misses': ('sqlite_pool_misses_total', 'counter', 'Connections opened'),
+    'open_connections': ('sqlite_pool_open_connections', 'gauge', 'Open pooled connections'),
+    'lock_waits': ('sqlite_pool_lock_waits_total', 'counter', 'Write transactions started'),
+    'lock_wait_seconds': ('sqlite_pool_lock_wait_seconds_total', 'counter',
+                          'Time spent waiting for the write lock'),
+    'lock_timeouts': ('sqlite_pool_lock_timeouts_total', 'counter', 'Write lock timeouts'),
+}
+
+_pools = {}
+
+
+def _pool_values(key):
+    return {(name,): pool.stats()[key] for name, pool in list(_pools.items())}
+
+
+def register_pool(pool, name):
+    """Expose a db_pool.ConnectionPool's counters (write lock waits etc.)"""
+    _pools[name] = pool
+    for key, (metric_name, kind, help) in POOL_METRICS.items():
+        registry.register(Callback(metric_name, help, kind, functools.partial(_pool_values, key), ('pool',)))
+
+
+# ============================================
+# REQUEST TRACES
+# ============================================
+
+_local = threading.local()
+_trace_lock = threading.Lock()
+
+
+class Trace:
+    """Time spent in each kind of call during one request"""
+
+    def __init__(self, keep_spans):
+        self.started = time.perf_counter()
+        self.totals = {}
+        self.spans = [] if keep_spans else None
+        self.depth = 0
+
+    def add(self, kind, name, start, seconds):
+        calls, total = self.totals.get(kind, (0, 0.0))
+        self.totals[kind] = (calls + 1, total + seconds)
+        if self.spans is not None and len(self.spans) < MAX_TRACE_SPANS:
+            self.spans.append({
+                'kind': kind,
+                'name': name,
+                'start_ms': round((start - self.started) * 1000, 3),
+                'ms': round(seconds * 1000, 3),
+            })
+
+
+def _record(histogram, kind, name, start, seconds, *label_values):
+    histogram.observe(seconds, *label_values)
+    trace = getattr(_local, 'trace', None)
+    # Nested calls (a database function calling another) are already
+    # inside the outer call's time
+    if trace is not None and trace.depth == 0:
+        trace.add(kind, name, start, seconds)
+
+
+def _write_trace(record):
+    line = json.dumps(record)
+    if not SLOW_REQUEST_LOG:
+        logger.warning('Slow request: %s', line)
+        return
+    with _trace_lock:
+        with open(SLOW_REQUEST_LOG, 'a') as f:
+            f.write(line + '\n')
+
+
+# ============================================
+# WRAPPERS
+# ============================================
+
+def timed(fn, histogram=DB_LATENCY, kind='db', name=None):
+    """Wrap fn so each call is observed in histogram under its name"""
+    name = name or fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        trace = getattr(_local, 'trace', None)
+        start = time.perf_counter()
+        if trace is not None:
+            trace.depth += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.depth -= 1
+            _record(histogram, kind, name, start, time.perf_counter() - start, name)
+
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+def instrument_functions(namespace, names=None, exclude=(), histogram=DB_LATENCY, kind='db'):
+    """Replace the public functions of a module namespace (globals()) by timed wrappers
+
+    Calls between functions of the module go through the module globals
+    too, so they are timed as well (but counted once in request traces).
+    Generator functions are left alone: their work happens after return.
+    """
+    module = namespace.get('__name__')
+    if names is None:
+        names = [
+            n for n, v in namespace.items()
+            if not n.startswith('_') and inspect.isfunction(v) and v.__module__ == module
+        ]
+    for n in names:
+        fn = namespace[n]
+        if n in exclude or hasattr(fn, '__wrapped__') or inspect.isgeneratorfunction(fn):
+            continue
+        namespace[n] = timed(fn, histogram, kind)
+
+
+def instrument_session(session, histogram=HTTP_CLIENT_LATENCY, kind='http', endpoint=None):
+    """Time every request made through a requests.Session
+
+    endpoint(url) gives the endpoint label; by default the host, so that
+    ids in paths do not create one series per user.
+    """
+    endpoint = endpoint or (lambda url: urlsplit(url).netloc)
+    send = session.request
+
+    def request(method, url, *args, **kwargs):
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = send(method, url, *args, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            label = endpoint(url)
+            _record(histogram, kind, f'{method} {label}', start, time.perf_counter() - start,
+                    method, label, status)
+
+    session.request = request
+    return session
+
+
+_DOCKER_VERSION = re.compile(r'^/v\d+\.\d+')
+_DOCKER_OBJECTS = {'containers', 'exec', 'images', 'networks', 'volumes'}
+_DOCKER_COLLECTION = {'json', 'create', 'prune', 'search', 'load', 'get'}
+
+
+def docker_endpoint(url):
+    """'/v1.43/containers/<id>/start' -> '/containers/{id}/start'"""
+    parts = _DOCKER_VERSION.sub('', urlsplit(url).path).split('/')
+    if len(parts) > 2 and parts[1] in _DOCKER_OBJECTS and parts[2] not in _DOCKER_COLLECTION:
+        parts[2] = '{id}'
+        # Image names may contain slashes: keep only the trailing action
+        if parts[1] == 'images' and len(parts) > 4:
+            parts[3:-1] = []
+    return '/'.join(parts)
+
+
+def instrument_docker(client):
+    """Time the Docker API calls of a docker.DockerClient"""
+    instrument_session(client.api, DOCKER_LATENCY, 'docker', docker_endpoint)
+    return client
+
+
+# ============================================
+# FLASK
+# ============================================
+
+def instrument_app(app, service):
+    """Time every request of a Flask app and serve /metrics"""
+    from flask import Response, g, request
+
+    def start_request():
+        if METRICS_DIR and registry._flusher is None:
+            # Started by the first request, so never before a fork
+            registry.start_flusher()
+        g._instrument_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.add(1)
+        _local.trace = Trace(keep_spans=SLOW_REQUEST_MS > 0)
+
+    def remember_status(response):
+        g._instrument_status = response.status_code
+        return response
+
+    def finish_request(exc):
+        start = g.pop('_instrument_start', None)
+        trace = getattr(_local, 'trace', None)
+        _local.trace = None
+        if start is None:
+            return
+        REQUESTS_IN_FLIGHT.add(-1)
+        seconds = time.perf_counter() - start
+        status = g.pop('_instrument_status', 500 if exc else 200)
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        if route == '/metrics':
+            return
+        REQUEST_LATENCY.observe(seconds, request.method, route, str(status))
+
+        if SLOW_REQUEST_MS > 0 and seconds * 1000 >= SLOW_REQUEST_MS and trace is not None:
+            accounted = sum(total for _, total in trace.totals.values())
+            _write_trace({
+                'service': service,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'method': request.method,
+                'route': route,
+                'path': request.path,
+                'status': status,
+                'ms': round(seconds * 1000, 3),
+                'breakdown': {
+                    kind: {'calls': calls, 'ms': round(total * 1000, 3)}
+                    for kind, (calls, total) in trace.totals.items()
+                },
+                'other_ms': round(max(seconds - accounted, 0) * 1000, 3),
+                'spans': trace.spans,
+            })
+
+    # First so the timing covers the app's own before_request hooks
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request)
+    app.after_request(remember_status)
+    app.teardown_request(finish_request)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return {'error': 'unauthorized'}, 401
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    return app
@@ -0,0 +1,270 @@
+"""
+SaaS Control Panel - Shared Metric Store Layout
+Metric resolutions, retention and the queries that read across the raw
+table and its rollups, shared by the control panel and user-app
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+# Metric resolutions, finest first: (name, table, bucket format, bucket seconds).
+# Raw samples are compacted into each coarser rollup by metrics_pipeline.py.
+METRIC_RESOLUTIONS = [
+    ('raw', 'metrics', None, 1),
+    ('1m', 'metrics_1m', '%Y-%m-%d %H:%M:00', 60),
+    ('1h', 'metrics_1h', '%Y-%m-%d %H:00:00', 3600),
+    ('1d', 'metrics_1d', '%Y-%m-%d 00:00:00', 86400),
+]
+
+# How long each resolution is kept, in seconds
+METRIC_RETENTION = {
+    'raw': int(float(os.getenv('METRICS_RETENTION_RAW_HOURS', '2')) * 3600),
+    '1m': int(float(os.getenv('METRICS_RETENTION_1M_DAYS', '7')) * 86400),
+    '1h': int(float(os.getenv('METRICS_RETENTION_1H_DAYS', '90')) * 86400),
+    '1d': int(float(os.getenv('METRICS_RETENTION_1D_DAYS', '730')) * 86400),
+}
+
+def utc_timestamp(seconds_ago=0):
+    """UTC time in SQLite CURRENT_TIMESTAMP format"""
+    moment = datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def rollup_watermarks(conn):
+    """Map of resolution -> compacted_until for every compacted rollup"""
+    rows = conn.execute('SELECT resolution, compacted_until FROM metrics_rollup_state').fetchall()
+    return {row[0]: row[1] for row in rows}
+
+def pick_metric_resolution(window_seconds, min_points=60):
+    """Coarsest resolution that still gives min_points buckets over the window
+
+    Moves further up if the retention of that level does not cover the
+    whole window.
+    """
+    index = 0
+    for i, (_, _, _, step) in enumerate(METRIC_RESOLUTIONS):
+        if step * min_points <= window_seconds:
+            index = i
+    # Never read from a level whose retention does not cover the window
+    while (index < len(METRIC_RESOLUTIONS) - 1
+           and METRIC_RETENTION[METRIC_RESOLUTIONS[index][0]] < window_seconds):
+        index += 1
+    return METRIC_RESOLUTIONS[index]
+
+def metric_source(resolution, container_id, since, watermarks):
+    """UNION ALL of the chosen level and the finer levels not yet compacted into it
+
+    Every segment exposes the same rollup-shaped columns (ts, samples,
+    cpu_avg/max/min, memory_avg/max/min, network_in/out) so callers can
+    aggregate across them. Walking coarse to fine, each level contributes
+    rows from the coarser level's watermark up to its own, so segments
+    never overlap in time.
+    """
+    index = METRIC_RESOLUTIONS.index(resolution)
+    segments = []
+    params = []
+    coarser_until = None
+
+    for name, table, fmt, _ in reversed(METRIC_RESOLUTIONS[:index + 1]):
+        if fmt is None:
+            column = 'timestamp'
+            select = f'''
+                SELECT timestamp AS ts, 1 AS samples,
+                       cpu_percent AS cpu_avg, cpu_percent AS cpu_max, cpu_percent AS cpu_min,
+                       memory_percent AS memory_avg, memory_percent AS memory_max,
+                       memory_percent AS memory_min, network_in, network_out
+                FROM {table}
+                WHERE container_id = ? AND timestamp >= ?'''
+        else:
+            column = 'bucket'
+            select = f'''
+                SELECT bucket AS ts, samples, cpu_avg, cpu_max, cpu_min,
+                       memory_avg, memory_max, memory_min, network_in, network_out
+                FROM {table}
+                WHERE container_id = ? AND bucket >= ?'''
+        segment_params = [container_id, since]
+
+        if fmt is not None:
+            compacted_until = watermarks.get(name)
+            if compacted_until is None:
+                # Nothing compacted into this level yet
+                continue
+            select += f' AND {column} < ?'
+            segment_params.append(compacted_until)
+        if coarser_until is not None:
+            select += f' AND {column} >= ?'
+            segment_params.append(coarser_until)
+
+        segments.append(select)
+        params.extend(segment_params)
+        if fmt is not None:
+            coarser_until = compacted_until
+
+    return ' UNION ALL '.join(segments), params
+
+
+# ============================================
+# BUCKETED SERIES
+# ============================================
+
+try:
+    import numpy as np
+except ImportError:  # optional: pure-Python percentiles below
+    np = None
+
+SERIES_FIELDS = ('cpu', 'memory')
+SERIES_AGGREGATES = ('avg', 'max', 'min', 'p95')
+
+# Upper bound on buckets per series, whatever range/step is asked for
+MAX_SERIES_POINTS = int(os.getenv('METRICS_MAX_POINTS', '1000'))
+
+# p95 reads a finer level than avg/max so each bucket has this many rows
+P95_ROWS_PER_BUCKET = 30
+
+# Accepted units for range/step, e.g. "30m", "24h", "7d" (plain numbers are seconds)
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_duration(value):
+    """'90', '15m', '24h', '7d' -> seconds; ValueError otherwise"""
+    value = value.strip().lower()
+    unit = DURATION_UNITS.get(value[-1:])
+    try:
+        seconds = int(float(value[:-1] if unit else value) * (unit or 1))
+    except OverflowError:
+        seconds = 0
+    if seconds <= 0:
+        raise ValueError(f"invalid duration {value!r}")
+    return seconds
+
+def series_window(window, step=None, default_points=120):
+    """(since, until, step) for the last `window` seconds, aligned to step
+
+    Aligning keeps bucket edges (and cache keys) fixed for a whole step.
+    """
+    if step is None:
+        step = max(60, -(-window // default_points))
+    until = (int(datetime.now(timezone.utc).timestamp()) // step + 1) * step
+    return until - -(-window // step) * step, until, step
+
+def _utc_format(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _weighted_p95_numpy(rows, column, points):
+    """p95 per slot over (slot, value, weight) rows, vectorised"""
+    data = np.array(rows, dtype=np.float32)
+    slots, values, weights = data[:, 0], data[:, column], data[:, -1]
+    keep = ~np.isnan(values)
+    slots, values, weights = slots[keep], values[keep], weights[keep]
+    result = [None] * points
+    if not len(slots):
+        return result
+    order = np.lexsort((values, slots))
+    slots, values, weights = slots[order], values[order], weights[order]
+    cumulative = np.cumsum(weights, dtype=np.float64)
+    present, starts = np.unique(slots, return_index=True)
+    ends = np.append(starts[1:], len(slots)) - 1
+    before = np.where(starts > 0, cumulative[starts - 1], 0.0)
+    targets = before + 0.95 * (cumulative[ends] - before)
+    picks = np.minimum(np.searchsorted(cumulative, targets, side='left'), ends)
+    for slot, value in zip(present.astype(int).tolist(), values[picks].tolist()):
+        result[slot] = round(value, 2)
+    return result
+
+def _weighted_p95_python(rows, column, points):
+    by_slot = {}
+    for row in rows:
+        if row[column] is not None:
+            by_slot.setdefault(row[0], []).append((row[column], row[-1]))
+    result = [None] * points
+    for slot, pairs in by_slot.items():
+        pairs.sort()
+        target = 0.95 * sum(w for _, w in pairs)
+        running = 0
+        for value, weight in pairs:
+            running += weight
+            if running >= target:
+                break
+        result[slot] = round(value, 2)
+    return result
+
+def metric_series(conn, container_id, since, until, step, aggregates=('avg', 'max'),
+                  fields=SERIES_FIELDS, watermarks=None):
+    """CPU/memory bucketed into fixed steps over [since, until), as columns
+
+    since/until are epoch seconds and step the bucket width in seconds.
+    avg/max/min come from the coarsest level no wider than step. p95 is
+    read from a level about P95_ROWS_PER_BUCKET times finer: exact on raw
+    samples, an estimate from rollup averages otherwise. Empty buckets
+    are None, so every column has one entry per bucket.
+    """
+    since, until, step = int(since), int(until), int(step)
+    unknown = set(aggregates) - set(SERIES_AGGREGATES)
+    if unknown:
+        raise ValueError(f"unknown aggregate(s): {', '.join(sorted(unknown))}")
+    unknown = set(fields) - set(SERIES_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(sorted(unknown))}")
+    if step <= 0 or until <= since:
+        raise ValueError("step must be positive and until after since")
+    points = -(-(until - since) // step)
+    if points > MAX_SERIES_POINTS:
+        raise ValueError(f"{points} points requested, at most {MAX_SERIES_POINTS} allowed")
+
+    # Retention is measured back from now, bucket width from the step
+    reach = max(datetime.now(timezone.utc).timestamp() - since, until - since)
+    resolution = pick_metric_resolution(reach, min_points=max(1, int(reach // step)))
+    if watermarks is None:
+        watermarks = rollup_watermarks(conn)
+    source, params = metric_source(resolution, container_id, _utc_format(since), watermarks)
+    slot = "(CAST(strftime('%s', ts) AS INTEGER) - ?) / ?"
+    until_ts = _utc_format(until)
+
+    columns = ['slot']
+    for field in fields:
+        columns += [
+            f'SUM({field}_avg * samples) / SUM(CASE WHEN {field}_avg IS NOT NULL THEN samples END)',
+            f'MAX({field}_max)',
+            f'MIN({field}_min)',
+        ]
+    rows = conn.execute(f'''
+        SELECT {slot} AS slot, {', '.join(columns[1:])}
+        FROM ({source})
+        WHERE ts < ?
+        GROUP BY slot
+        ORDER BY slot
+    ''', [since, step] + params + [until_ts]).fetchall()
+
+    series = {
+        'resolution': resolution[0],
+        'since': since,
+        'until': until,
+        'step': step,
+        'points': points,
+        't': [since + i * step for i in range(points)],
+    }
+    for i, field in enumerate(fields):
+        series[field] = {}
+        for j, name in enumerate(('avg', 'max', 'min')):
+            if name in aggregates:
+                column = [None] * points
+                for row in rows:
+                    value = row[1 + 3 * i + j]
+                    if value is not None and 0 <= row[0] < points:
+                        column[row[0]] = round(value, 2)
+                series[field][name] = column
+
+    if 'p95' in aggregates:
+        fine = pick_metric_resolution(reach, min_points=max(1, int(reach // step)) * P95_ROWS_PER_BUCKET)
+        if fine != resolution:
+            source, params = metric_source(fine, container_id, _utc_format(since), watermarks)
+        values = ', '.join(f'{field}_avg' for field in fields)
+        rows = conn.execute(f'''
+            SELECT {slot} AS slot, {values}, samples
+            FROM ({source})
+            WHERE ts < ?
+        ''', [since, step] + params + [until_ts]).fetchall()
+        rows = [tuple(row) for row in rows if 0 <= row[0] < points]
+        percentile = _weighted_p95_numpy if np is not None and rows else _weighted_p95_python
+        for i, field in enumerate(fields):
+            series[field]['p95'] = percentile(rows, 1 + i, points)
+
+    return series
@@ -0,0 +1,31 @@
+"""
+SaaS Control Panel - Token Tables
+Schema of the token signing keys and deny list. auth-service publishes a
+key as it boots, possibly before the control panel has migrated a fresh
+database, so both services create these tables (IF NOT EXISTS).
+"""
+
+TOKEN_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS token_keys (
+        kid TEXT PRIMARY KEY,
+        public_key TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+    # One row per revoked token (jti) or per user whose tokens were all
+    # revoked (subject); kept until the tokens it covers have expired
+    '''CREATE TABLE IF NOT EXISTS token_denylist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        jti TEXT,
+        subject TEXT,
+        revoked_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_token_denylist_expires ON token_denylist(expires_at)',
+]
+
+
+def create_token_tables(conn):
+    """Create the token tables on a connection or cursor (inside a write transaction)"""
+    for statement in TOKEN_TABLES:
+        conn.execute(statement)
@@ -0,0 +1,322 @@
+"""
+SaaS Control Panel - Signed Tokens
+Compact Ed25519-signed tokens (JWT, alg EdDSA) issued by auth-service and
+verified locally by every service. Public keys and the deny list live in
+the shared database and are polled, so verifying a request needs no
+database or network round trip.
+"""
+
+import base64
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from instrumentation import Callback, registry
+
+logger = logging.getLogger(__name__)
+
+ISSUER = "auth-service"
+# Cookies ignore the port: set by auth-service on localhost:5000, sent to
+# every service on localhost
+TOKEN_COOKIE = "saas_token"
+ADMIN_TOKEN_COOKIE = "saas_admin_token"
+
+USER_AUDIENCE = "user-app"
+ADMIN_AUDIENCE = "control-panel"
+
+# Roles in control-panel tokens: the admin, or auth-service calling its API
+ADMIN_ROLE = "admin"
+SERVICE_ROLE = "service"
+
+
+class InvalidToken(Exception):
+    """Token malformed, badly signed, expired, for another audience or revoked"""
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _json_b64(value):
+    return _b64(json.dumps(value, separators=(",", ":"), sort_keys=True).encode())
+
+
+def _is_number(value):
+    # bool is an int subclass; "exp": true is not a date
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def request_token(request, cookie=TOKEN_COOKIE):
+    """Bearer token of a Flask/aiohttp request, else the token cookie"""
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[7:].strip()
+    return request.cookies.get(cookie)
+
+
+# ============================================
+# ISSUING (AUTH-SERVICE)
+# ============================================
+
+class TokenSigner:
+    """Issue tokens with a signing key that rotates every `rotation` seconds.
+
+    Private keys only exist in the memory of the issuing process. Each
+    key's public half is published with publish_key(kid, public_key,
+    expires_at) one rotation before it starts signing, so verifiers have
+    polled it by then, and stays published until the last token it signed
+    has expired.
+    """
+
+    def __init__(self, publish_key, ttl=3600, rotation=86400):
+        self.publish_key = publish_key
+        self.ttl = ttl
+        self.rotation = rotation
+        self._key = None
+        self._header = None
+        self._next = None
+        self._rotate_at = 0.0
+        self._service_tokens = {}
+        self._lock = threading.Lock()
+
+    def _new_key(self, signs_until):
+        key = Ed25519PrivateKey.generate()
+        kid = secrets.token_hex(8)
+        public = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        self.publish_key(kid, _b64(public), signs_until + self.ttl)
+        return key, kid
+
+    def _current_key(self):
+        with self._lock:
+            now = time.time()
+            if self._key is None or now >= self._rotate_at + self.rotation:
+                # First use, or idle past the end of the next key too
+                self._rotate_at = now + self.rotation
+                current = self._new_key(self._rotate_at)
+                self._next = self._new_key(self._rotate_at + self.rotation)
+            elif now >= self._rotate_at:
+                current = self._next
+                self._rotate_at += self.rotation
+                self._next = self._new_key(self._rotate_at + self.rotation)
+            else:
+                return self._key, self._header
+            self._key = current[0]
+            self._header = _json_b64({"alg": "EdDSA", "kid": current[1], "typ": "JWT"})
+            logger.info("Signing tokens with key %s", current[1])
+            return self._key, self._header
+
+    def start(self):
+        """Publish the signing keys now rather than on the first token"""
+        self._current_key()
+
+    def issue(self, subject, audience, ttl=None, **claims):
+        """Signed token for subject; returns (token, claims)"""
+        key, header = self._current_key()
+        now = int(time.time())
+        claims.update(
+            iss=ISSUER, sub=subject, aud=audience, iat=now,
+            exp=now + int(ttl or self.ttl), jti=secrets.token_hex(8)
+        )
+        signing_input = f"{header}.{_json_b64(claims)}"
+        return f"{signing_input}.{_b64(key.sign(signing_input.encode()))}", claims
+
+    def service_token(self, subject, audience):
+        """Service-role token for calls between services, reused until its last tenth"""
+        cached = self._service_tokens.get((subject, audience))
+        if cached is not None and cached[1] - time.time() > self.ttl / 10:
+            return cached[0]
+        token, claims = self.issue(subject, audience, role=SERVICE_ROLE)
+        self._service_tokens[(subject, audience)] = (token, claims["exp"])
+        return token
+
+
+# ============================================
+# VERIFYING (EVERY SERVICE)
+# ============================================
+
+class TokenVerifier:
+    """Check tokens against polled public keys and deny list.
+
+    load_keys() returns {kid: public key (base64url)} and load_denylist()
+    a list of {'jti', 'subject', 'revoked_at'} rows: a row with a jti
+    revokes that token, a row with a subject revokes every token of that
+    subject issued up to revoked_at. Both are reloaded every
+    poll_interval seconds, and at once (at most every second) when a token
+    names a key not seen yet.
+
+    Verified tokens are cached (up to cache_size) with their claims, so a
+    repeated token costs a dict lookup plus the expiry and deny checks.
+    """
+
+    def __init__(self, load_keys, load_denylist, poll_interval=5, cache_size=10000, leeway=30):
+        self.load_keys = load_keys
+        self.load_denylist = load_denylist
+        self.poll_interval = poll_interval
+        self.cache_size = cache_size
+        self.leeway = leeway
+        self._keys = {}
+        self._denied_jtis = frozenset()
+        self._revoked_subjects = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_refresh = 0.0
+        self._verified = 0
+        self._cache_hits = 0
+        self._rejected = 0
+
+    # ------------------------------------------
+    # POLLING
+    # ------------------------------------------
+
+    def start(self):
+        """Load keys and deny list now, then poll them in a background thread"""
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="token-poll", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    def refresh(self):
+        self._last_refresh = time.monotonic()
+        try:
+            rows = self.load_keys()
+            denylist = self.load_denylist()
+        except Exception:
+            logger.warning("Could not load token keys or deny list", exc_info=True)
+            return
+        keys = {}
+        for kid, public in rows.items():
+            try:
+                keys[kid] = Ed25519PublicKey.from_public_bytes(_unb64(public))
+            except ValueError:
+                logger.warning("Ignoring malformed public key %s", kid)
+        revoked_subjects = {}
+        for row in denylist:
+            if row.get("subject"):
+                revoked_subjects[row["subject"]] = max(row["revoked_at"], revoked_subjects.get(row["subject"], 0))
+        with self._lock:
+            self._keys = keys
+            self._denied_jtis = frozenset(row["jti"] for row in denylist if row.get("jti"))
+            self._revoked_subjects = revoked_subjects
+            # Tokens signed by a key that was withdrawn must not stay cached
+            for token, (kid, _) in list(self._cache.items()):
+                if kid not in keys:
+                    del self._cache[token]
+
+    # ------------------------------------------
+    # VERIFICATION
+    # ------------------------------------------
+
+    def _check(self, claims, audience, now):
+        if claims["exp"] + self.leeway < now:
+            raise InvalidToken("token expired")
+        if "nbf" in claims and claims["nbf"] - self.leeway > now:
+            raise InvalidToken("token not valid yet")
+        if audience is not None and claims.get("aud") != audience:
+            raise InvalidToken("token is for another audience")
+        if claims["jti"] in self._denied_jtis:
+            raise InvalidToken("token revoked")
+        revoked_at = self._revoked_subjects.get(claims["sub"])
+        if revoked_at is not None and claims["iat"] <= revoked_at:
+            raise InvalidToken("token revoked")
+
+    def verify(self, token, audience=None):
+        """Claims of a valid token (shared with the cache: do not modify); raises InvalidToken"""
+        if not token:
+            raise InvalidToken("no token")
+        now = time.time()
+        try:
+            with self._lock:
+                cached = self._cache.get(token)
+                if cached is not None:
+                    self._cache.move_to_end(token)
+                    self._check(cached[1], audience, now)
+                    self._cache_hits += 1
+                    return cached[1]
+            kid, claims = self._verify_signature(token)
+            with self._lock:
+                self._check(claims, audience, now)
+                self._verified += 1
+                self._cache[token] = (kid, claims)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return claims
+        except InvalidToken:
+            with self._lock:
+                self._rejected += 1
+            raise
+
+    def _verify_signature(self, token):
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_unb64(header_b64))
+            signature = _unb64(signature_b64)
+        except ValueError:
+            raise InvalidToken("malformed token")
+        if not isinstance(header, dict):
+            raise InvalidToken("malformed token")
+        if header.get("alg") != "EdDSA":
+            raise InvalidToken("unsupported algorithm")
+        kid = header.get("kid")
+        if not isinstance(kid, str):
+            raise InvalidToken("unknown signing key")
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_refresh >= 1:
+            # Just published by another auth-service process
+            self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise InvalidToken("unknown signing key")
+        try:
+            key.verify(signature, f"{header_b64}.{payload_b64}".encode())
+            claims = json.loads(_unb64(payload_b64))
+        except (InvalidSignature, ValueError):
+            raise InvalidToken("bad signature")
+        if not isinstance(claims, dict) or not all(k in claims for k in ("sub", "iat", "exp", "jti")):
+            raise InvalidToken("missing claims")
+        if not isinstance(claims["sub"], str) or not isinstance(claims["jti"], str) \
+                or not all(_is_number(claims[k]) for k in ("iat", "exp", "nbf") if k in claims):
+            raise InvalidToken("malformed claims")
+        if claims.get("iss") != ISSUER:
+            raise InvalidToken("unknown issuer")
+        return kid, claims
+
+    def stats(self):
+        with self._lock:
+            return {
+                "keys": len(self._keys),
+                "denied_tokens": len(self._denied_jtis),
+                "revoked_subjects": len(self._revoked_subjects),
+                "cached": len(self._cache),
+                "verified": self._verified,
+                "cache_hits": self._cache_hits,
+                "rejected": self._rejected,
+            }
+
+
+def register_metrics(verifier):
+    """Expose token checks on /metrics (summed over the workers)"""
+    registry.register(Callback(
+        "token_verifications_total", "Token checks by outcome (signature checked, cache hit, rejected)",
+        "counter", lambda: {(outcome,): verifier.stats()[outcome] for outcome in ("verified", "cache_hits", "rejected")},
+        labels=("outcome",)))
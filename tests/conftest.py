@@ -0,0 +1,18 @@
+"""
+Test setup: service modules are imported as they run in their images,
+with shared/ next to them, against a throwaway database
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# control-panel first: auth-service also has a database.py and app.py, and
+# user-app an app.py (only its tenant_data module is imported from there)
+sys.path[:0] = [os.path.join(ROOT, "shared"), os.path.join(ROOT, "control-panel"),
+                os.path.join(ROOT, "auth-service"), os.path.join(ROOT, "user-app")]
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="saas-tests-"), "saas_control_panel.db")
+os.environ["AUDIT_SYNC"] = "1"
@@ -0,0 +1,60 @@
+"""Trigger-maintained counters give the same admin stats as the aggregate query"""
+
+import pytest
+
+import database
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    database.init_db()
+
+
+def _assert_modes_agree():
+    counters = database.get_admin_stats('counters')
+    assert counters == database.get_admin_stats('aggregate')
+    return counters
+
+
+def _container(conn, name, status, created_at):
+    conn.execute('''
+        INSERT INTO containers (user_id, container_id, container_name, port, status, created_at)
+        SELECT id, ?, ?, 0, ?, ? FROM users WHERE username = 'stats-user'
+    ''', (name, name, status, created_at))
+
+
+def test_counters_follow_every_kind_of_write():
+    base = _assert_modes_agree()
+    with database.pool.transaction() as conn:
+        conn.execute("INSERT INTO users (username, email, password, is_active) VALUES ('stats-user', 's@x', 'x', 1)")
+        conn.execute("INSERT INTO users (username, email, password, is_active) VALUES ('stats-idle', 'i@x', 'x', 0)")
+        _container(conn, 'stats-a', 'running', '2024-01-01 00:00:00')
+        _container(conn, 'stats-b', 'running', '2024-03-01 00:00:00')
+        _container(conn, 'stats-c', 'error', '2024-03-01 00:00:00')
+    stats = _assert_modes_agree()
+    assert stats['total_users'] == base['total_users'] + 1
+    assert stats['total_containers'] == base['total_containers'] + 3
+    assert stats['running_containers'] == base['running_containers'] + 2
+    assert stats['failed_containers'] == base['failed_containers'] + 1
+
+    with database.pool.transaction() as conn:
+        conn.execute("UPDATE containers SET status = 'stopped' WHERE container_name = 'stats-a'")
+        conn.execute("UPDATE containers SET created_at = '2024-02-01 00:00:00' WHERE container_name = 'stats-b'")
+        conn.execute("UPDATE users SET is_active = 1 WHERE username = 'stats-idle'")
+        conn.execute("UPDATE users SET is_active = 0 WHERE username = 'stats-user'")
+    _assert_modes_agree()
+
+    with database.pool.transaction() as conn:
+        conn.execute("DELETE FROM containers WHERE container_name LIKE 'stats-%'")
+        conn.execute("DELETE FROM users WHERE username LIKE 'stats-%'")
+    assert _assert_modes_agree() == base
+
+
+def test_rebuild_repairs_drifted_counters():
+    expected = _assert_modes_agree()
+    with database.pool.transaction() as conn:
+        conn.execute("UPDATE stats_counters SET value = value + 5 WHERE name = 'containers'")
+    assert database.get_admin_stats('counters') != expected
+
+    database.rebuild_stats_counters()
+    assert _assert_modes_agree() == expected
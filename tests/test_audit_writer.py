@@ -0,0 +1,115 @@
+"""No activity row is lost or left waiting once the writer is closed"""
+
+import contextlib
+import threading
+
+from audit_writer import AuditWriter, _STOP
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield self
+
+    def executemany(self, sql, rows):
+        with self._lock:
+            self.rows.extend(rows)
+            self.batches.append(len(rows))
+
+
+def _flush_returns(writer, timeout=2):
+    thread = threading.Thread(target=writer.flush, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_rows_logged_after_close_are_written_and_flush_returns():
+    pool = FakePool()
+    writer = AuditWriter(pool, flush_interval=0.01)
+    writer.write(1, None, "login", "before")
+    writer.close()
+    writer.write(1, None, "login", "after")
+    assert _flush_returns(writer)
+    assert [row[3] for row in pool.rows] == ["before", "after"]
+
+
+def test_rows_queued_behind_the_stop_marker_are_drained():
+    pool = FakePool()
+    writer = AuditWriter(pool, flush_interval=0.01)
+    writer.write(1, None, "login", "first")
+    # What the old close() allowed: a row enqueued after the marker
+    writer._queue.put(_STOP)
+    writer._queue.put((1, None, "login", "late", "2024-01-01 00:00:00"))
+    writer._thread.join(2)
+    assert not writer._thread.is_alive()
+    assert _flush_returns(writer)
+    assert [row[3] for row in pool.rows] == ["first", "late"]
+
+
+def test_concurrent_writes_during_close_are_not_lost():
+    pool = FakePool()
+    writer = AuditWriter(pool, batch_size=7, flush_interval=0.001)
+
+    def log(n):
+        for i in range(200):
+            writer.write(n, None, "tick", str(i))
+
+    threads = [threading.Thread(target=log, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    writer.close()
+    for thread in threads:
+        thread.join()
+    assert _flush_returns(writer)
+    assert len(pool.rows) == 8 * 200
+
+
+def test_rows_are_written_in_batches_of_batch_size():
+    pool = FakePool()
+    writer = AuditWriter(pool, batch_size=50, flush_interval=5)
+    writer.write_many([(1, None, "tick", str(i)) for i in range(120)])
+    writer.close()
+    assert pool.batches[:2] == [50, 50]
+    assert sum(pool.batches) == 120
+    assert writer.stats()["written"] == 120
+
+
+def test_full_queue_writes_on_the_callers_thread():
+    class BlockingPool(FakePool):
+        entered = threading.Event()
+        release = threading.Event()
+
+        def executemany(self, sql, rows):
+            if threading.current_thread().name == "audit-writer":
+                self.entered.set()
+                self.release.wait(2)
+            super().executemany(sql, rows)
+
+    pool = BlockingPool()
+    writer = AuditWriter(pool, batch_size=1, flush_interval=0.01, max_queue=1)
+    writer.write(1, None, "login", "taken by the writer")
+    assert pool.entered.wait(2)
+    writer.write(1, None, "login", "queued")
+    writer.write(1, None, "login", "inline")
+    assert [row[3] for row in pool.rows] == ["inline"]
+    assert writer.stats()["overflow_writes"] == 1
+
+    pool.release.set()
+    writer.flush()
+    assert sorted(row[3] for row in pool.rows) == ["inline", "queued", "taken by the writer"]
+    writer.close()
+
+
+def test_synchronous_mode_writes_before_returning():
+    pool = FakePool()
+    writer = AuditWriter(pool, synchronous=True)
+    writer.write(1, 2, "container_started", "user-bob")
+    assert writer._thread is None
+    assert pool.rows[0][:4] == (1, 2, "container_started", "user-bob")
+    assert writer.stats()["mode"] == "sync"
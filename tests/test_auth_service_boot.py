@@ -0,0 +1,33 @@
+"""auth-service boots on a fresh volume, before the control panel has migrated it"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip("cryptography")
+
+BOOT = """
+import app
+app.create_app()
+app.shutdown()
+"""
+
+
+def test_create_app_publishes_keys_on_an_empty_database(tmp_path):
+    db_path = str(tmp_path / "fresh.db")
+    # Own interpreter: auth-service's app and database modules share their
+    # names with the control panel's
+    env = dict(os.environ, DB_PATH=db_path, PASSWORD_HASH_PROCESSES="0", PYTHONPATH=os.pathsep.join(
+        [os.path.join(ROOT, "shared"), os.path.join(ROOT, "auth-service")] + sys.path))
+    result = subprocess.run([sys.executable, "-c", BOOT], cwd=os.path.join(ROOT, "auth-service"),
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+    conn = sqlite3.connect(db_path)
+    # The current key and the next one, published ahead
+    assert conn.execute("SELECT COUNT(*) FROM token_keys").fetchone()[0] == 2
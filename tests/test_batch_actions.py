@@ -0,0 +1,112 @@
+"""Container selections are started/stopped/deleted in parallel and recorded as they finish"""
+
+import json
+import threading
+import types
+
+import docker
+import pytest
+
+import app as control_panel
+import database
+from batch_actions import run_container_batch
+
+NAMES = ["user-batch-a", "user-batch-b", "user-batch-c"]
+
+
+class FakeApi:
+    def __init__(self):
+        self.calls = []
+        self.failing = set()
+        self.slow = {}
+        self._lock = threading.Lock()
+
+    def _call(self, action, name):
+        with self._lock:
+            self.calls.append((action, name))
+        if name in self.slow:
+            self.slow[name].wait(2)
+        if name in self.failing:
+            raise docker.errors.APIError("conflict")
+
+    def start(self, name):
+        self._call("start", name)
+
+    def stop(self, name, timeout=10):
+        self._call("stop", name)
+
+    def remove_container(self, name, force=False):
+        self._call("remove", name)
+        if name == "user-batch-c":
+            raise docker.errors.NotFound(name)
+
+
+@pytest.fixture
+def api():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, email, password) VALUES ('batch', 'batch@batch.test', 'x')")
+        conn.execute("DELETE FROM containers WHERE container_name LIKE 'user-batch-%'")
+        for name in NAMES:
+            conn.execute('''
+                INSERT INTO containers (user_id, container_id, container_name, port, status)
+                SELECT id, ?, ?, 0, 'running' FROM users WHERE username = 'batch'
+            ''', (name, name))
+    return FakeApi()
+
+
+def _statuses():
+    rows = database.get_db().execute(
+        "SELECT container_name, status FROM containers WHERE container_name LIKE 'user-batch-%'").fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def test_stop_batch_reports_each_container_and_records_successes(api):
+    api.failing.add("user-batch-b")
+    events = list(run_container_batch(types.SimpleNamespace(api=api), "stop", NAMES + ["user-batch-a"]))
+
+    progress, summary = events[:-1], events[-1]
+    assert sorted(e["name"] for e in progress) == NAMES
+    assert [e["done"] for e in progress] == [1, 2, 3]
+    assert {e["name"]: e["status"] for e in progress}["user-batch-b"] == "error"
+    assert (summary["total"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    assert _statuses() == {"user-batch-a": "stopped", "user-batch-b": "running", "user-batch-c": "stopped"}
+
+
+def test_containers_are_handled_concurrently(api):
+    barrier = threading.Barrier(3, timeout=2)
+    api.start = lambda name: barrier.wait()
+    events = list(run_container_batch(types.SimpleNamespace(api=api), "start", NAMES, parallelism=3))
+    assert events[-1]["succeeded"] == 3
+
+
+def test_delete_drops_rows_even_for_containers_already_gone(api):
+    events = list(run_container_batch(types.SimpleNamespace(api=api), "delete", NAMES))
+    assert {e["name"]: e.get("result") for e in events[:-1]}["user-batch-c"] == "absent"
+    assert _statuses() == {}
+
+
+def test_disconnect_cancels_queued_containers_and_records_finished_ones(api):
+    api.slow["user-batch-b"] = gate = threading.Event()
+    batch = run_container_batch(types.SimpleNamespace(api=api), "stop", NAMES, parallelism=1)
+    assert next(batch)["name"] == "user-batch-a"
+
+    threading.Timer(0.2, gate.set).start()
+    batch.close()
+
+    assert [name for _, name in api.calls] == ["user-batch-a", "user-batch-b"]
+    assert _statuses() == {"user-batch-a": "stopped", "user-batch-b": "stopped", "user-batch-c": "running"}
+
+
+def test_route_streams_ndjson_for_a_filter(api, monkeypatch):
+    monkeypatch.setattr(control_panel, "client", types.SimpleNamespace(api=api))
+    client = control_panel.app.test_client()
+    with client.session_transaction() as session:
+        session["admin"] = True
+
+    assert client.post("/api/admin/containers/batch", json={"action": "pause", "names": []}).status_code == 400
+    response = client.post("/api/admin/containers/batch",
+                           json={"action": "stop", "filter": {"status": "running", "q": "batch"}})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.mimetype == "application/x-ndjson"
+    assert events[-1]["type"] == "summary" and events[-1]["succeeded"] == 3
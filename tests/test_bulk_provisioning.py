@@ -0,0 +1,121 @@
+"""Bulk provisioning and teardown report one result per user and batch the database writes"""
+
+import itertools
+import threading
+import types
+
+import docker
+import pytest
+
+import database
+from provisioning import provision_users, teardown_users
+
+
+class FakeContainer:
+    def __init__(self, name, port):
+        self.id = f"id-{name}"
+        self.name = name
+        self.status = "running"
+        self.attrs = {"NetworkSettings": {"Ports": {"80/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(port)}]}}}
+
+    def reload(self):
+        pass
+
+    def start(self):
+        self.status = "running"
+
+
+class FakeDocker:
+    def __init__(self):
+        self.by_name = {}
+        self.failing = set()
+        self.ports = itertools.count(33000)
+        self._lock = threading.Lock()
+        self.containers = types.SimpleNamespace(run=self._run, get=self._get)
+        self.api = types.SimpleNamespace(remove_container=self._remove)
+
+    def _run(self, image, name, **options):
+        if name in self.failing:
+            raise docker.errors.APIError("no space left on device")
+        with self._lock:
+            cont = self.by_name[name] = FakeContainer(name, next(self.ports))
+        return cont
+
+    def _get(self, name):
+        if name not in self.by_name:
+            raise docker.errors.NotFound(name)
+        return self.by_name[name]
+
+    def _remove(self, name, force=False):
+        if name in self.failing:
+            raise docker.errors.APIError("device busy")
+        if self.by_name.pop(name, None) is None:
+            raise docker.errors.NotFound(name)
+
+
+@pytest.fixture
+def daemon():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("DELETE FROM containers WHERE container_name LIKE 'user-bulk%'")
+        conn.execute("DELETE FROM users WHERE username LIKE 'bulk%' OR email LIKE '%@bulk.test'")
+        conn.execute("INSERT INTO users (username, email, password) VALUES ('bulk-owner', 'taken@bulk.test', 'x')")
+    return FakeDocker()
+
+
+def _row(name):
+    row = database.get_container_by_name(name)
+    return row and (row["status"], row["port"])
+
+
+def test_bulk_provisioning_results_per_user(daemon):
+    daemon.failing.add("user-bulk-d")
+    users = [
+        {"username": "bulk-a", "email": "a@bulk.test"},
+        {"username": "bulk-b", "email": "b@bulk.test"},
+        {"username": "bulk-a", "email": "again@bulk.test"},
+        {"username": "no", "email": "no@bulk.test"},
+        {"username": "bulk-c", "email": "taken@bulk.test"},
+        {"username": "bulk-d", "email": "d@bulk.test"},
+    ]
+
+    out = provision_users(daemon, users, workers=4)
+
+    results = {r["username"]: r for r in out["results"]}
+    assert [r["username"] for r in out["results"]] == ["bulk-a", "bulk-b", "no", "bulk-c", "bulk-d"]
+    assert results["bulk-a"]["status"] == results["bulk-b"]["status"] == "ok"
+    assert results["no"]["error"] == "invalid username"
+    assert results["bulk-c"]["error"] == "Username or email already exists"
+    assert "no space left" in results["bulk-d"]["error"]
+    assert out["summary"]["requested"] == 5 and out["summary"]["succeeded"] == 2
+    assert _row("user-bulk-a") == ("running", results["bulk-a"]["port"])
+    assert database.get_user_by_username("bulk-a")["email"] == "a@bulk.test"
+    assert _row("user-bulk-d") is None
+
+
+def test_bulk_provisioning_again_adopts_existing_containers(daemon):
+    provision_users(daemon, [{"username": "bulk-a", "email": "a@bulk.test"}])
+    again = provision_users(daemon, [{"username": "bulk-a", "email": "a@bulk.test"}])
+    assert again["results"][0]["path"] == "existing"
+    count = database.get_db().execute(
+        "SELECT COUNT(*) FROM containers WHERE container_name = 'user-bulk-a'").fetchone()[0]
+    assert count == 1
+
+
+def test_teardown_removes_containers_then_users(daemon):
+    provision_users(daemon, [{"username": u, "email": f"{u}@bulk.test"} for u in ("bulk-a", "bulk-b", "bulk-c")])
+    daemon.by_name.pop("user-bulk-b")
+    daemon.failing.add("user-bulk-c")
+
+    out = teardown_users(daemon, ["bulk-a", "bulk-b", "bulk-c", "bulk-ghost", "bulk-a"])
+
+    statuses = {r["username"]: (r["status"], r.get("container")) for r in out["results"]}
+    assert statuses == {
+        "bulk-a": ("deleted", "removed"),
+        "bulk-b": ("deleted", "absent"),
+        "bulk-c": ("error", None),
+        "bulk-ghost": ("not_found", "absent"),
+    }
+    assert database.get_user_by_username("bulk-a") is None and _row("user-bulk-a") is None
+    # A failed removal keeps the user and its row
+    assert database.get_user_by_username("bulk-c") is not None and _row("user-bulk-c")[0] == "running"
@@ -0,0 +1,66 @@
+"""A half-open trial that fails unexpectedly or is never reported does not block the circuit"""
+
+import time
+
+import pytest
+
+from control_panel import HALF_OPEN, CircuitBreaker, ControlPanelClient
+
+
+def _half_open(breaker):
+    breaker.record_failure()
+    time.sleep(breaker.reset_timeout + 0.01)
+
+
+def test_unexpected_error_in_trial_releases_it(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    client = ControlPanelClient("http://control-panel.invalid", retries=0, breaker=breaker)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("not a requests error")
+
+    monkeypatch.setattr(client.session, "request", broken)
+    _half_open(breaker)
+    with pytest.raises(RuntimeError):
+        client.user_port("alice")
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_unexpected_error_from_token_releases_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+
+    def token():
+        raise ValueError("signing key unavailable")
+
+    client = ControlPanelClient("http://control-panel.invalid", retries=0, breaker=breaker, token=token)
+    _half_open(breaker)
+    with pytest.raises(ValueError):
+        client.user_port("alice")
+    assert breaker.allow()
+
+
+def test_unreported_trial_times_out():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    _half_open(breaker)
+    assert breaker.allow()
+    # Trial in flight: everything else is refused...
+    assert not breaker.allow()
+    # ...until it has been out for reset_timeout without an outcome
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_trial_outcome_still_closes_or_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    _half_open(breaker)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+    _half_open(breaker)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
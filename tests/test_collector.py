@@ -0,0 +1,115 @@
+"""Docker stats become metric rows: CPU against the previous cycle, only for known user containers"""
+
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import database
+from collector import MetricsCollector, _cpu_percent, _memory_percent
+
+
+def _stats(total_usage, system_usage, usage=600, rx=10):
+    return {
+        'cpu_stats': {'cpu_usage': {'total_usage': total_usage}, 'system_cpu_usage': system_usage,
+                      'online_cpus': 2},
+        'memory_stats': {'usage': usage, 'limit': 1000, 'stats': {'inactive_file': 100}},
+        'networks': {'eth0': {'rx_bytes': rx, 'tx_bytes': 1}, 'eth1': {'rx_bytes': rx, 'tx_bytes': 1}},
+    }
+
+
+class FakeApi:
+    def __init__(self):
+        self.listed = []
+        self.samples = {}
+        self.calls = []
+        self.block = threading.Event()
+
+    def containers(self, filters=None):
+        return self.listed
+
+    def stats(self, docker_id, stream=False, one_shot=False):
+        self.calls.append((docker_id, one_shot))
+        sample = self.samples[docker_id]
+        if sample == 'hang':
+            self.block.wait(2)
+        if isinstance(sample, Exception):
+            raise sample
+        return sample
+
+
+@pytest.fixture
+def collector():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, email, password) VALUES ('carol', 'c@example.com', 'x')")
+        conn.execute("DELETE FROM containers WHERE container_id IN ('d1', 'd2')")
+        conn.execute("DELETE FROM metrics")
+        for docker_id in ('d1', 'd2'):
+            conn.execute('''
+                INSERT INTO containers (user_id, container_id, container_name, status)
+                SELECT id, ?, ?, 'running' FROM users WHERE username = 'carol'
+            ''', (docker_id, f'user-{docker_id}'))
+    api = FakeApi()
+    collector = MetricsCollector(types.SimpleNamespace(api=api), interval=0.5)
+    collector._executor = ThreadPoolExecutor(max_workers=4)
+    yield collector, api
+    api.block.set()
+    collector._executor.shutdown(wait=True)
+
+
+def _metrics():
+    return database.get_db().execute('''
+        SELECT c.container_id, m.cpu_percent, m.memory_percent, m.network_in
+        FROM metrics m JOIN containers c ON c.id = m.container_id ORDER BY m.timestamp, c.container_id
+    ''').fetchall()
+
+
+def test_cpu_and_memory_follow_docker_stats():
+    # First sample: nothing to compare with yet
+    assert _cpu_percent(_stats(200, 2000), None) == 0.0
+    assert _cpu_percent(_stats(300, 3000), _stats(200, 2000)['cpu_stats']) == 20.0
+    # Page cache is not used memory
+    assert _memory_percent(_stats(0, 0, usage=600)) == 50.0
+
+
+def test_only_known_user_containers_are_sampled(collector):
+    collector, api = collector
+    api.listed = [{'Id': 'd1', 'Names': ['/user-d1']}, {'Id': 'x9', 'Names': ['/user-unknown']},
+                  {'Id': 'w1', 'Names': ['/warm-1']}]
+    api.samples = {'d1': _stats(100, 1000)}
+
+    assert collector.collect_once() == 1
+    assert [call[0] for call in api.calls] == ['d1']
+    assert [tuple(row) for row in _metrics()] == [('d1', 0.0, 50.0, 20)]
+
+
+def test_cpu_is_measured_against_the_previous_cycle(collector):
+    collector, api = collector
+    api.listed = [{'Id': 'd1', 'Names': ['/user-d1']}]
+    api.samples = {'d1': _stats(100, 1000)}
+    collector.collect_once()
+    api.samples = {'d1': _stats(150, 1500)}
+    with database.pool.transaction() as conn:
+        conn.execute('DELETE FROM metrics')
+
+    collector.collect_once()
+
+    assert [row['cpu_percent'] for row in _metrics()] == [20.0]
+    assert api.calls == [('d1', True), ('d1', True)]
+
+
+def test_failed_and_late_samples_are_counted_not_written(collector):
+    collector, api = collector
+    api.listed = [{'Id': 'd1', 'Names': ['/user-d1']}, {'Id': 'd2', 'Names': ['/user-d2']}]
+    api.samples = {'d1': RuntimeError('daemon error'), 'd2': 'hang'}
+
+    assert collector.collect_once() == 0
+    last = collector.stats()['last_cycle']
+    assert (last['errors'], last['dropped']) == (1, 1)
+
+    # d2 is still in flight: not sampled again
+    api.samples['d1'] = _stats(100, 1000)
+    assert collector.collect_once() == 1
+    assert collector.stats()['last_cycle']['dropped'] == 1
@@ -0,0 +1,70 @@
+"""Tenant-wide control-panel routes need the admin session or a control-panel token"""
+
+import time
+
+import pytest
+
+import app as control_panel
+import database
+from tokens import TokenSigner, ADMIN_AUDIENCE, USER_AUDIENCE
+
+
+def _publish_key(kid, public_key, expires_at):
+    with database.pool.transaction() as conn:
+        conn.execute('INSERT INTO token_keys (kid, public_key, created_at, expires_at) VALUES (?, ?, ?, ?)',
+                     (kid, public_key, time.time(), expires_at))
+
+
+@pytest.fixture
+def api(monkeypatch):
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, email, password) VALUES ('alice', 'a@example.com', 'x')")
+    signer = TokenSigner(_publish_key)
+    signer.start()
+    control_panel.token_verifier.refresh()
+
+    teardowns = []
+    monkeypatch.setattr(control_panel, "teardown_users",
+                        lambda client, usernames, **kwargs: teardowns.append(usernames) or {"results": []})
+    return control_panel.app.test_client(), signer, teardowns
+
+
+def _user_exists(username):
+    return database.get_db().execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone() is not None
+
+
+def test_anonymous_bulk_delete_is_rejected(api):
+    client, _, teardowns = api
+    response = client.delete("/api/users/bulk", json={"usernames": ["alice"]})
+    assert response.status_code == 401
+    assert teardowns == []
+    assert _user_exists("alice")
+
+
+def test_user_token_cannot_bulk_delete(api):
+    client, signer, teardowns = api
+    token, _ = signer.issue("alice", USER_AUDIENCE)
+    response = client.delete("/api/users/bulk", json={"usernames": ["alice"]},
+                             headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert teardowns == []
+
+
+def test_service_token_can_bulk_delete(api):
+    client, signer, teardowns = api
+    token = signer.service_token("auth-service", ADMIN_AUDIENCE)
+    response = client.delete("/api/users/bulk", json={"usernames": ["alice"]},
+                             headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert teardowns == [["alice"]]
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("post", "/api/provision/bulk", {"users": [{"username": "mallory"}]}),
+    ("get", "/api/jobs/some-job", None),
+    ("post", "/api/users/ports", {"usernames": ["alice"]}),
+])
+def test_anonymous_tenant_routes_are_rejected(api, method, path, body):
+    client, _, _ = api
+    assert getattr(client, method)(path, json=body).status_code == 401
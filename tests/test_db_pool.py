@@ -0,0 +1,105 @@
+"""Pooled connections: one per thread, closed when the thread exits"""
+
+import gc
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"))
+    yield pool
+    pool.close_all()
+
+
+def _in_threads(pool, count, fn):
+    def run():
+        fn(pool.acquire())
+
+    for _ in range(count):
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+
+def test_short_lived_threads_do_not_leak_connections(pool):
+    opened = []
+    _in_threads(pool, 300, opened.append)
+    assert pool.stats()["open_connections"] == 0
+    assert pool.stats()["misses"] == 300
+    # Closed, not just forgotten
+    with pytest.raises(Exception):
+        opened[0].execute("SELECT 1")
+
+
+def test_a_thread_reuses_its_connection(pool):
+    assert pool.acquire() is pool.acquire()
+    stats = pool.stats()
+    assert (stats["misses"], stats["hits"], stats["open_connections"]) == (1, 1, 1)
+
+
+def test_transactions_commit_across_threads(pool):
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE t (n INTEGER)")
+
+    def insert(conn):
+        with pool.transaction() as tx:
+            tx.execute("INSERT INTO t VALUES (1)")
+
+    _in_threads(pool, 20, insert)
+    assert pool.acquire().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 20
+    assert pool.stats()["open_connections"] == 1
+
+
+def test_close_all_reopens_on_next_use(pool):
+    first = pool.acquire()
+    pool.close_all()
+    assert pool.acquire() is not first
+    assert pool.stats()["open_connections"] == 1
+
+
+def test_connections_run_in_wal_with_the_configured_pragmas(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pragmas.db"), pragmas={"busy_timeout": 1234})
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    pool.close_all()
+
+
+def test_failed_transaction_rolls_back_and_nested_blocks_join_it(pool):
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE t (n INTEGER)")
+
+    with pytest.raises(RuntimeError):
+        with pool.transaction() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            with pool.transaction() as inner:
+                assert inner is conn
+                inner.execute("INSERT INTO t VALUES (2)")
+            raise RuntimeError("boom")
+
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    assert pool.stats()["lock_waits"] == 2
+
+
+def test_recreated_database_file_gets_a_new_connection(tmp_path):
+    path = tmp_path / "recreated.db"
+    pool = ConnectionPool(str(path))
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE old (n INTEGER)")
+    # Removed under the open connection, as a test teardown or a reset does
+    for leftover in tmp_path.glob("recreated.db*"):
+        leftover.unlink()
+
+    with pool.transaction() as conn:
+        conn.execute("CREATE TABLE new (n INTEGER)")
+    tables = {row[0] for row in pool.acquire().execute("SELECT name FROM sqlite_master")}
+    assert tables == {"new"}
+    pool.close_all()
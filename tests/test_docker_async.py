@@ -0,0 +1,41 @@
+"""AsyncDocker calls are bounded by the client's default timeout"""
+
+import asyncio
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+from docker_async import AsyncDocker
+
+
+async def _hanging_daemon():
+    async def hang(request):
+        await asyncio.sleep(2)
+        return web.json_response({})
+
+    daemon = web.Application()
+    daemon.router.add_get("/containers/{name}/json", hang)
+    runner = web.AppRunner(daemon)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+def test_default_timeout_applies_without_override():
+    async def scenario():
+        runner, port = await _hanging_daemon()
+        docker = AsyncDocker(f"tcp://127.0.0.1:{port}", timeout=0.3)
+        start = time.monotonic()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(docker.inspect("user-alice"), 1.5)
+            assert time.monotonic() - start < 1
+        finally:
+            await docker.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+"""Exports stream every row in range, as NDJSON or CSV, optionally gzipped"""
+
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import app as control_panel
+import database
+import exports
+from exports import parse_time, stream_export
+
+
+@pytest.fixture
+def client():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("DELETE FROM activity_logs WHERE action = 'export-test'")
+        conn.executemany('''
+            INSERT INTO activity_logs (user_id, container_id, action, details, timestamp)
+            VALUES (NULL, NULL, 'export-test', ?, ?)
+        ''', [('first', '2024-01-01 10:00:00'), ('with, comma\nand "quotes"', '2024-01-01 11:00:00'),
+              ('last', '2024-01-02 00:00:00')])
+    client = control_panel.app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+    return client
+
+
+def _body(chunks):
+    return b''.join(chunks).decode()
+
+
+def test_ndjson_and_csv_rendering():
+    rows = [(1, 'a,b'), (2, None)]
+    assert _body(stream_export(['id', 'text'], iter(rows))) == \
+        '{"id": 1, "text": "a,b"}\n{"id": 2, "text": null}\n'
+    assert list(csv.reader(io.StringIO(_body(stream_export(['id', 'text'], iter(rows), 'csv'))))) == \
+        [['id', 'text'], ['1', 'a,b'], ['2', '']]
+    # An empty CSV export still has its header
+    assert _body(stream_export(['id', 'text'], iter([]), 'csv')) == 'id,text\r\n'
+
+
+def test_lines_are_joined_into_bounded_chunks(monkeypatch):
+    monkeypatch.setattr(exports, 'CHUNK_SIZE', 100)
+    chunks = list(stream_export(['n'], ((i,) for i in range(100))))
+    assert all(100 <= len(chunk) < 120 for chunk in chunks[:-1])
+    assert len(_body(chunks).splitlines()) == 100
+
+
+def test_gzip_round_trip():
+    rows = [(i, 'x' * 50) for i in range(1000)]
+    compressed = b''.join(stream_export(['id', 'text'], iter(rows), 'csv', compress=True))
+    assert gzip.decompress(compressed) == b''.join(stream_export(['id', 'text'], iter(rows), 'csv'))
+
+
+def test_parse_time_normalises_to_utc():
+    assert parse_time('2024-01-01') == '2024-01-01 00:00:00'
+    assert parse_time('2024-01-01T12:30:00Z') == '2024-01-01 12:30:00'
+    assert parse_time('2024-01-01T12:30:00+02:00') == '2024-01-01 10:30:00'
+    assert parse_time('') is None
+    with pytest.raises(ValueError):
+        parse_time('yesterday')
+
+
+def test_activity_log_export_in_range(client):
+    response = client.get('/api/admin/export/activity-logs?action=export-test'
+                          '&since=2024-01-01T10:30:00Z&until=2024-01-02&format=csv')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert 'attachment; filename="activity-logs-' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['details'] for row in rows] == ['with, comma\nand "quotes"']
+
+
+def test_gzipped_ndjson_export(client):
+    response = client.get('/api/admin/export/activity-logs?action=export-test&gzip=1')
+    assert response.mimetype == 'application/gzip'
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert [json.loads(line)['details'] for line in lines] == ['first', 'with, comma\nand "quotes"', 'last']
+
+
+@pytest.mark.parametrize('query', ['activity-logs?format=xml', 'activity-logs?since=soon',
+                                   'metrics?resolution=5m'])
+def test_bad_parameters_are_rejected(client, query):
+    assert client.get(f'/api/admin/export/{query}').status_code == 400
+
+
+def test_exports_need_the_admin_session():
+    assert control_panel.app.test_client().get('/api/admin/export/metrics').status_code == 401
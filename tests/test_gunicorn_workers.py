@@ -0,0 +1,82 @@
+"""gunicorn settings, the per-worker factories and the leader lock"""
+
+import os
+import runpy
+import sys
+import time
+import types
+
+from conftest import ROOT
+from leader import LeaderLock
+
+CONF = os.path.join(ROOT, "shared", "gunicorn.conf.py")
+
+
+def test_settings_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("WEB_WORKERS", "3")
+    monkeypatch.setenv("WEB_THREADS", "16")
+    monkeypatch.setenv("WEB_MAX_REQUESTS", "1000")
+
+    conf = runpy.run_path(CONF)
+
+    assert (conf["workers"], conf["worker_class"], conf["threads"]) == (3, "gthread", 16)
+    assert conf["max_requests"] == 1000 and conf["preload_app"] is False
+
+
+def test_metrics_dir_is_created_or_cleared(tmp_path, monkeypatch):
+    conf = runpy.run_path(CONF)
+    server = types.SimpleNamespace()
+    monkeypatch.setenv("METRICS_DIR", "unset")
+    monkeypatch.delenv("METRICS_DIR")
+
+    conf["on_starting"](server)
+    created = os.environ["METRICS_DIR"]
+    assert os.path.isdir(created) and server.created_metrics_dir == created
+    conf["on_exit"](server)
+    assert not os.path.exists(created)
+
+    (tmp_path / "123-1.json").write_text("{}")
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    conf["on_starting"](server)
+    assert os.listdir(tmp_path) == [] and server.created_metrics_dir is None
+
+
+def test_worker_exit_stops_the_app(monkeypatch):
+    stopped = []
+    monkeypatch.setitem(sys.modules, "app", types.SimpleNamespace(shutdown=lambda: stopped.append(True)))
+
+    runpy.run_path(CONF)["worker_exit"](None, None)
+
+    assert stopped == [True]
+
+
+def test_control_panel_import_opens_nothing():
+    import app as control_panel
+
+    assert control_panel.client is None and control_panel.leader is None
+    control_panel.shutdown()
+
+
+def test_one_leader_and_failover(tmp_path):
+    path = str(tmp_path / "db.leader")
+    started = []
+    first = LeaderLock(path, poll_interval=0.05)
+    second = LeaderLock(path, poll_interval=0.05)
+
+    first.start(lambda: started.append("first"))
+    second.start(lambda: started.append("second"))
+    time.sleep(0.2)
+    assert started == ["first"] and first.is_leader and not second.is_leader
+    assert first.stats()["leader_pid"] == os.getpid()
+
+    # The kernel drops the lock with the leader's process (here: its descriptor)
+    os.close(first._fd)
+    first._fd = None
+    deadline = time.monotonic() + 2
+    while not second.is_leader and time.monotonic() < deadline:
+        time.sleep(0.02)
+    second.stop()
+    assert started == ["first", "second"]
+    second._thread.join(1)
+    assert not second._thread.is_alive()
+    os.close(second._fd)
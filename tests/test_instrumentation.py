@@ -0,0 +1,112 @@
+"""Prometheus exposition, timers and slow-request traces"""
+
+import json
+import os
+
+import pytest
+from flask import Flask
+
+import instrumentation
+from instrumentation import Gauge, Histogram, Registry, docker_endpoint, instrument_app, instrument_functions
+
+
+def _app():
+    app = Flask(__name__)
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id):
+        return {'id': item_id}
+
+    return instrument_app(app, 'test')
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.register(Histogram('op_seconds', 'Op', ('op',), buckets=(0.1, 1.0)))
+    for seconds in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(seconds, 'read')
+    registry.register(Gauge('busy', 'Busy')).add(2)
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE op_seconds histogram' in lines
+    assert 'op_seconds_bucket{op="read",le="0.1"} 1' in lines
+    assert 'op_seconds_bucket{op="read",le="1.0"} 3' in lines
+    assert 'op_seconds_bucket{op="read",le="+Inf"} 4' in lines
+    assert 'op_seconds_count{op="read"} 4' in lines and 'op_seconds_sum{op="read"} 4.05' in lines
+    assert 'busy 2' in lines
+    assert registry.register(Histogram('op_seconds', 'Again')) is latency
+
+
+@pytest.mark.parametrize('url, endpoint', [
+    ('http+docker://localhost/v1.43/containers/abc123/start', '/containers/{id}/start'),
+    ('http+docker://localhost/v1.43/containers/json?all=1', '/containers/json'),
+    ('http+docker://localhost/v1.43/images/library/nginx:latest/json', '/images/{id}/json'),
+    ('http+docker://localhost/v1.43/version', '/version'),
+])
+def test_docker_endpoints_have_no_ids(url, endpoint):
+    assert docker_endpoint(url) == endpoint
+
+
+def test_worker_dumps_are_summed(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'METRICS_DIR', str(tmp_path))
+    registry = Registry()
+    latency = registry.register(Histogram('op_seconds', 'Op', buckets=(1.0,)))
+    busy = registry.register(Gauge('busy', 'Busy'))
+    latency.observe(0.5)
+    busy.add(1)
+    # An exited worker: its histogram still counts, its gauge does not
+    (tmp_path / '999999999-1.json').write_text(json.dumps({
+        'op_seconds': [[[], [[2, 1], 7.0]]],
+        'busy': [[[], 5]],
+    }))
+
+    merged = registry.collect_all()
+
+    assert merged['op_seconds'][()] == [[3, 1], 7.5]
+    assert merged['busy'][()] == 1
+    assert any(name.startswith(f'{os.getpid()}-') for name in os.listdir(tmp_path))
+
+
+def test_requests_are_timed_by_route_and_served_on_metrics():
+    client = _app().test_client()
+    assert client.get('/items/7').status_code == 200
+    client.get('/nowhere')
+
+    response = client.get('/metrics')
+
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/<int:item_id>",status="200"}' in body
+    assert 'route="<unmatched>",status="404"' in body
+    assert 'route="/metrics"' not in body
+
+
+def test_metrics_token(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'METRICS_TOKEN', 's3cret')
+    client = _app().test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+
+def test_slow_request_trace_counts_nested_calls_once(tmp_path, monkeypatch):
+    log = tmp_path / 'slow.log'
+    monkeypatch.setattr(instrumentation, 'SLOW_REQUEST_MS', 0.001)
+    monkeypatch.setattr(instrumentation, 'SLOW_REQUEST_LOG', str(log))
+    namespace = {'__name__': 'fake_db'}
+    exec('def get_row():\n    return 1\n\ndef get_rows():\n    return [get_row(), get_row()]\n', namespace)
+    instrument_functions(namespace)
+    app = Flask(__name__)
+
+    @app.route('/rows')
+    def rows():
+        return {'rows': namespace['get_rows']()}
+
+    instrument_app(app, 'test').test_client().get('/rows')
+
+    record = json.loads(log.read_text().splitlines()[-1])
+    assert record['service'] == 'test' and record['route'] == '/rows' and record['status'] == 200
+    assert record['breakdown']['db']['calls'] == 1
+    assert [span['name'] for span in record['spans']] == ['get_rows']
+    db = instrumentation.DB_LATENCY.collect()
+    assert sum(db[('get_row',)][0]) >= 2
@@ -0,0 +1,87 @@
+"""The inventory mirrors Docker from one list call plus events, inspecting only what changed"""
+
+import types
+
+import pytest
+
+from inventory import ContainerInventory
+
+
+class FakeApi:
+    def __init__(self):
+        self.summaries = []
+        self.attrs = {}
+        self.inspected = []
+
+    def containers(self, all=False):
+        return self.summaries
+
+    def inspect_container(self, container_id):
+        self.inspected.append(container_id)
+        return self.attrs[container_id]
+
+
+def _inspect(container_id, name, status='running', port='32800'):
+    bindings = [{'HostIp': '0.0.0.0', 'HostPort': port}] if port else None
+    return {'Id': container_id, 'Name': '/' + name, 'State': {'Status': status},
+            'NetworkSettings': {'Ports': {'80/tcp': bindings}}}
+
+
+def _event(action, container_id, **attributes):
+    return {'Type': 'container', 'Action': action, 'Actor': {'ID': container_id, 'Attributes': attributes}}
+
+
+@pytest.fixture
+def inventory():
+    api = FakeApi()
+    api.summaries = [
+        {'Id': 'a1', 'Names': ['/user-alice'], 'State': 'running',
+         'Ports': [{'PrivatePort': 80, 'PublicPort': 32768, 'Type': 'tcp'}]},
+        {'Id': 'b1', 'Names': ['/user-bob'], 'State': 'exited', 'Ports': []},
+    ]
+    inventory = ContainerInventory(types.SimpleNamespace(api=api))
+    notified = []
+    inventory.subscribe(lambda action, entry: notified.append((action, entry)))
+    inventory.resync()
+    return inventory, api, notified
+
+
+def test_resync_loads_names_states_and_ports_without_inspecting(inventory):
+    inventory, api, notified = inventory
+    assert inventory.get_port('user-alice') == '32768'
+    assert inventory.get('user-bob')['status'] == 'exited'
+    assert [entry['name'] for entry in inventory.list()] == ['user-alice', 'user-bob']
+    assert api.inspected == []
+    assert notified == [('resync', None)]
+
+
+def test_stop_events_update_in_place(inventory):
+    inventory, api, notified = inventory
+    inventory.apply_event(_event('die', 'a1'))
+    assert inventory.get('user-alice') == {'id': 'a1', 'name': 'user-alice', 'status': 'exited', 'port': None}
+    assert api.inspected == []
+    assert notified[-1][0] == 'die'
+
+
+def test_start_and_rename_are_inspected(inventory):
+    inventory, api, notified = inventory
+    api.attrs['b1'] = _inspect('b1', 'user-bob', port='32801')
+    inventory.apply_event(_event('start', 'b1'))
+    assert inventory.get_port('user-bob') == '32801'
+
+    api.attrs['b1'] = _inspect('b1', 'user-robert', port='32801')
+    inventory.apply_event(_event('rename', 'b1'))
+    assert inventory.get('user-bob') is None
+    assert inventory.get_port('user-robert') == '32801'
+    assert api.inspected == ['b1', 'b1']
+
+
+def test_destroy_removes_the_entry_and_other_actions_are_ignored(inventory):
+    inventory, api, notified = inventory
+    inventory.apply_event(_event('exec_start', 'a1'))
+    assert api.inspected == [] and len(notified) == 1
+
+    inventory.apply_event(_event('destroy', 'a1', name='user-alice'))
+    assert inventory.get('user-alice') is None
+    assert notified[-1] == ('destroy', {'id': 'a1', 'name': 'user-alice', 'status': 'running', 'port': '32768'})
+    assert inventory.stats()['events_seen'] == 2
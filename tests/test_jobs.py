@@ -0,0 +1,109 @@
+"""Provisioning jobs run once per user on the worker pool, and orphaned ones are requeued"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+import database
+from jobs import ProvisioningQueue
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute('DELETE FROM provisioning_jobs')
+
+
+def _orphan_job():
+    """A running job that stopped reporting progress an hour ago"""
+    job_id = uuid.uuid4().hex
+    with database.pool.transaction() as conn:
+        database.create_provisioning_job(job_id, f"u{job_id[:8]}", "")
+        conn.execute('''
+            UPDATE provisioning_jobs SET status = 'running', updated_at = datetime('now', '-1 hour')
+            WHERE id = ?
+        ''', (job_id,))
+    return job_id
+
+
+def _wait_for(job_id, status, timeout=3):
+    deadline = time.monotonic() + timeout
+    job = database.get_provisioning_job(job_id)
+    while job['status'] != status and time.monotonic() < deadline:
+        time.sleep(0.02)
+        job = database.get_provisioning_job(job_id)
+    return job
+
+
+def test_submit_is_idempotent_per_key_and_per_active_user():
+    queue = ProvisioningQueue(lambda job, progress: None)
+    job, created = queue.submit("dora", "d@example.com", job_id="key-1")
+    assert created and job["status"] == "queued"
+
+    assert queue.submit("dora", job_id="key-1") == (job, False)
+    # Another key, same user with a job still queued
+    assert queue.submit("dora", job_id="key-2") == (job, False)
+
+
+def test_jobs_report_progress_and_outcome():
+    def handler(job, progress):
+        progress(50, "container")
+        if job["username"].startswith("bad"):
+            raise RuntimeError("no capacity")
+        return {"port": "32800"}
+
+    queue = ProvisioningQueue(handler, workers=2, poll_interval=0.05)
+    queue.start()
+    try:
+        good, _ = queue.submit("erin")
+        bad, _ = queue.submit("bad-frank")
+        good, bad = _wait_for(good["id"], "succeeded"), _wait_for(bad["id"], "failed")
+    finally:
+        queue.stop()
+
+    assert (good["progress"], good["result"]) == (100, {"port": "32800"})
+    assert (bad["step"], bad["error"]) == ("container", "no capacity")
+    stats = queue.stats()
+    assert (stats["succeeded"], stats["failed"], stats["busy_workers"]) == (1, 1, 0)
+
+
+def test_worker_requeues_a_job_that_went_stale_after_start():
+    ran = threading.Event()
+    queue = ProvisioningQueue(lambda job, progress: ran.set(), workers=1, poll_interval=0.05, stale_after=0.2)
+    queue.start()
+    try:
+        job_id = _orphan_job()
+        assert ran.wait(3)
+    finally:
+        queue.stop()
+    job = _wait_for(job_id, 'succeeded')
+    assert (job['status'], job['attempts']) == ('succeeded', 1)
+
+
+def test_async_provisioner_requeues_a_job_that_went_stale_after_start():
+    async_api = pytest.importorskip("async_api")
+
+    class Provisioner(async_api.AsyncProvisioner):
+        async def provision(self, username, email, progress):
+            return {"username": username}
+
+    async def run():
+        provisioner = Provisioner(concurrency=2, poll_interval=0.05, stale_after=0.2)
+        provisioner.start()
+        try:
+            await asyncio.sleep(0.1)  # past the sweep at start
+            job_id = await async_api.db(_orphan_job)
+            for _ in range(150):
+                job = await async_api.db(database.get_provisioning_job, job_id)
+                if job['status'] == 'succeeded':
+                    return job
+                await asyncio.sleep(0.02)
+            return job
+        finally:
+            await provisioner.stop()
+
+    assert asyncio.run(run())['status'] == 'succeeded'
@@ -0,0 +1,84 @@
+"""Reconnecting dashboard clients resume from Last-Event-ID or are told to resync"""
+
+import app as control_panel
+import database
+from live_feed import ChangeHub
+
+
+def _ids(sub):
+    ids = []
+    while not sub.queue.empty():
+        ids.append(sub.queue.get_nowait()[0])
+    return ids
+
+
+def test_resume_replays_the_missed_events():
+    hub = ChangeHub(history=10)
+    for i in range(5):
+        hub.publish('stats', {'i': i})
+
+    sub = hub.subscribe(f'{hub.epoch}-2')
+
+    assert not sub.overflowed
+    assert _ids(sub) == [3, 4, 5]
+
+
+def test_id_from_another_process_resyncs():
+    hub = ChangeHub(history=10)
+    other = ChangeHub(history=10)
+    other.epoch = hub.epoch + '0'
+    for i in range(3):
+        hub.publish('stats', {'i': i})
+
+    assert hub.subscribe(f'{other.epoch}-1').overflowed
+    assert hub.subscribe('2').overflowed
+    assert hub.subscribe('garbage').overflowed
+
+
+def test_id_older_than_the_history_resyncs():
+    hub = ChangeHub(history=3)
+    for i in range(10):
+        hub.publish('stats', {'i': i})
+
+    assert hub.subscribe(f'{hub.epoch}-5').overflowed
+    assert _ids(hub.subscribe(f'{hub.epoch}-7')) == [8, 9, 10]
+
+
+def test_slow_subscriber_is_cut_loose():
+    hub = ChangeHub(queue_size=2)
+    sub = hub.subscribe()
+    for i in range(3):
+        hub.publish('stats', {'i': i})
+
+    assert sub.overflowed
+    assert hub.stats()['subscribers'] == 0
+
+
+def test_stream_ids_carry_the_epoch_and_end_on_resync():
+    hub = ChangeHub()
+    hub.publish('activity', [{'id': 1}])
+    stream = hub.stream(f'{hub.epoch}-0')
+    assert next(stream) == 'retry: 3000\n\n'
+    assert next(stream) == f'id: {hub.epoch}-1\nevent: activity\ndata: [{{"id": 1}}]\n\n'
+
+    assert list(hub.stream('1-0')) == ['retry: 3000\n\n', 'event: resync\ndata: {}\n\n']
+
+
+def test_poll_publishes_changes_only_while_someone_listens():
+    database.init_db()
+    hub = ChangeHub()
+    hub.poll_once()
+    assert hub.stats()['published'] == 0
+
+    sub = hub.subscribe()
+    hub.poll_once()
+    hub.poll_once()
+    events = [sub.queue.get_nowait()[1] for _ in range(sub.queue.qsize())]
+    assert events == ['stats']
+
+    database.log_activity(None, None, 'live-feed-test', 'hello')
+    hub.poll_once()
+    seq, event, data = sub.queue.get_nowait()
+    assert event == 'activity' and '"live-feed-test"' in data
+
+    assert control_panel.app.test_client().get('/api/admin/events').status_code == 401
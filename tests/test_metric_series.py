@@ -0,0 +1,95 @@
+"""Series buckets are fixed steps over [since, until), one entry per bucket, None when empty"""
+
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+import app as control_panel
+import database
+import metric_store
+from metric_store import metric_series, parse_duration, series_window
+
+
+def _ts(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+@pytest.fixture
+def window():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute('DELETE FROM metrics WHERE container_id = 91')
+    since, until, step = series_window(600, 60)
+    return since, until, step
+
+
+def test_durations_and_aligned_windows():
+    assert [parse_duration(v) for v in ('90', '15m', '24h', '7d', '1.5h')] == [90, 900, 86400, 604800, 5400]
+    for bad in ('', '0', '-5m', 'abc', '1e999d'):
+        with pytest.raises(ValueError):
+            parse_duration(bad)
+    since, until, step = series_window(3600, 300)
+    assert until % step == 0 and until - since == 3600
+    assert series_window(86400)[2] == 720
+
+
+def test_buckets_over_raw_samples(window):
+    since, until, step = window
+    database.store_metrics([
+        {'container_id': 91, 'cpu_percent': cpu, 'memory_percent': 40, 'timestamp': _ts(since + offset)}
+        for offset, cpu in ((125, 10), (130, 30), (175, 20), (300, 80))
+    ])
+
+    series = database.get_container_series(91, since, until, step, ('avg', 'max', 'min'))
+
+    assert series['resolution'] == '1m' and series['points'] == 10
+    assert series['t'] == [since + i * step for i in range(10)]
+    assert series['cpu']['avg'][2] == 20.0
+    assert (series['cpu']['max'][2], series['cpu']['min'][2]) == (30.0, 10.0)
+    assert series['cpu']['avg'][5] == 80.0
+    assert series['cpu']['avg'][:2] == [None, None] and series['memory']['max'][9] is None
+
+
+def test_p95_implementations_agree():
+    if metric_store.np is None:
+        pytest.skip('numpy not installed')
+    rng = random.Random(7)
+    rows = [(rng.randrange(20), rng.choice([None, rng.uniform(0, 100)]), rng.uniform(0, 100), rng.randint(1, 60))
+            for _ in range(2000)]
+    for column in (1, 2):
+        assert metric_store._weighted_p95_numpy(rows, column, 20) == \
+            pytest.approx(metric_store._weighted_p95_python(rows, column, 20), abs=0.01)
+
+
+def test_p95_over_raw_samples(window):
+    since, until, step = window
+    database.store_metrics([
+        {'container_id': 91, 'cpu_percent': float(i), 'memory_percent': 0, 'timestamp': _ts(since + 60 + i)}
+        for i in range(1, 21)
+    ])
+    series = database.get_container_series(91, since, until, step, ('p95',))
+    assert series['cpu']['p95'][1] == 19.0
+    assert series['cpu']['p95'][0] is None
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({'aggregates': ('median',)}, 'unknown aggregate'),
+    ({'step': 0}, 'step must be positive'),
+    ({'step': 1, 'until_offset': 10 ** 6}, 'points requested'),
+])
+def test_invalid_requests(window, kwargs, message):
+    since, until, step = window
+    until += kwargs.pop('until_offset', 0)
+    with pytest.raises(ValueError, match=message):
+        metric_series(database.get_db(), 91, since, until, kwargs.get('step', step), kwargs.get('aggregates', ('avg',)))
+
+
+def test_route_validates_range_and_aggregates():
+    client = control_panel.app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+    assert client.get('/api/admin/containers/91/metrics/series?range=soon').status_code == 400
+    assert client.get('/api/admin/containers/91/metrics/series?aggregates=avg,mode').status_code == 400
+    body = client.get('/api/admin/containers/91/metrics/series?range=1h&step=5m').get_json()
+    assert body['points'] == 12 and len(body['cpu']['avg']) == 12
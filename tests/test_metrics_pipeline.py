@@ -0,0 +1,73 @@
+"""Rollups follow their watermarks and retention never drops uncompacted rows"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+import database
+from metrics_pipeline import MetricsCompactor
+
+NOW = datetime(2024, 1, 1, 12, 5, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def compactor():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        for table in ('metrics', 'metrics_1m', 'metrics_1h', 'metrics_1d', 'metrics_rollup_state'):
+            conn.execute(f'DELETE FROM {table}')
+    return MetricsCompactor(lag=30)
+
+
+def _store(*samples):
+    return database.store_metrics([
+        {'container_id': 7, 'cpu_percent': cpu, 'memory_percent': cpu / 2, 'timestamp': ts}
+        for ts, cpu in samples
+    ])
+
+
+def _rows(table):
+    return [tuple(row) for row in database.get_db().execute(
+        f'SELECT bucket, samples, cpu_avg, cpu_max, cpu_min FROM {table} ORDER BY bucket')]
+
+
+def test_store_metrics_replaces_a_second_sample_in_the_same_second(compactor):
+    assert _store(('2024-01-01 12:00:00', 10), ('2024-01-01 12:00:00', 20)) == 2
+    rows = database.get_db().execute('SELECT cpu_percent FROM metrics').fetchall()
+    assert [row[0] for row in rows] == [20]
+
+
+def test_closed_minutes_are_rolled_up_once(compactor):
+    _store(('2024-01-01 12:03:10', 10), ('2024-01-01 12:03:40', 30), ('2024-01-01 12:04:50', 50))
+
+    # 12:04 is still open (lag 30 s): only 12:03 is compacted
+    assert compactor.compact(1, NOW) == 1
+    assert _rows('metrics_1m') == [('2024-01-01 12:03:00', 2, 20.0, 30.0, 10.0)]
+    assert database.get_rollup_watermarks()['1m'] == '2024-01-01 12:04:00'
+    assert compactor.compact(1, NOW) == 0
+
+
+def test_hourly_rollup_weights_minutes_by_samples(compactor):
+    _store(('2024-01-01 11:10:00', 10),
+           ('2024-01-01 11:20:00', 40), ('2024-01-01 11:20:10', 40), ('2024-01-01 11:20:20', 40))
+
+    result = compactor.run_once(NOW)
+
+    assert result['compacted'] == {'1m': 2, '1h': 1, '1d': 0}
+    assert _rows('metrics_1h') == [('2024-01-01 11:00:00', 4, 32.5, 40.0, 10.0)]
+    # 1d waits for the day to close in 1h
+    assert _rows('metrics_1d') == []
+    assert database.get_rollup_watermarks() == {
+        '1m': '2024-01-01 12:04:00', '1h': '2024-01-01 12:00:00', '1d': '2024-01-01 00:00:00'}
+
+
+def test_retention_keeps_raw_rows_until_they_are_compacted(compactor):
+    _store(('2024-01-01 09:00:00', 10), ('2024-01-01 12:01:00', 20))
+
+    assert compactor.apply_retention(NOW)['raw'] == 0
+    assert database.get_db().execute('SELECT COUNT(*) FROM metrics').fetchone()[0] == 2
+
+    compactor.compact(1, NOW)
+    assert compactor.apply_retention(NOW)['raw'] == 1
+    remaining = database.get_db().execute('SELECT timestamp FROM metrics').fetchall()
+    assert [row[0] for row in remaining] == ['2024-01-01 12:01:00']
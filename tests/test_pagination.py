@@ -0,0 +1,64 @@
+"""Keyset pages walk a list newest first without gaps or repeats, even across equal timestamps"""
+
+import pytest
+
+import app as control_panel
+import database
+
+
+@pytest.fixture(autouse=True)
+def users():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("DELETE FROM users WHERE username LIKE 'page-%'")
+        for i in range(7):
+            # Three users share each timestamp: the id breaks the tie
+            conn.execute('''
+                INSERT INTO users (username, email, password, created_at) VALUES (?, ?, 'x', ?)
+            ''', (f'page-{i}', f'page-{i}@example.com', f'2024-01-0{1 + i // 3} 00:00:00'))
+
+
+def _walk(limit, **filters):
+    names, cursor = [], None
+    while True:
+        page = database.get_users_page(limit=limit, cursor=cursor, **filters)
+        names += [row['username'] for row in page['items']]
+        assert len(page['items']) <= limit
+        cursor = page['next_cursor']
+        if cursor is None:
+            return names
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_pages_cover_every_row_once_newest_first(limit):
+    assert _walk(limit, username_prefix='page-') == [f'page-{i}' for i in reversed(range(7))]
+
+
+def test_prefix_filter_is_a_prefix_not_a_pattern():
+    assert _walk(5, username_prefix='page-1') == ['page-1']
+    assert _walk(5, username_prefix='page_') == []
+
+
+def test_page_size_is_clamped():
+    assert database.page_size('abc') == database.DEFAULT_PAGE_SIZE
+    assert database.page_size(0) == 1
+    assert database.page_size(10 ** 6) == database.MAX_PAGE_SIZE
+
+
+def test_cursor_round_trip_and_bad_cursors():
+    assert database.decode_cursor(database.encode_cursor('2024-01-01 00:00:00', 5)) == ['2024-01-01 00:00:00', 5]
+    for bad in ('not base64!', database.encode_cursor(1), 'e30'):
+        with pytest.raises(database.InvalidCursor):
+            database.get_users_page(cursor=bad)
+
+
+def test_admin_route_pages_and_rejects_bad_cursors():
+    client = control_panel.app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+
+    first = client.get('/api/admin/users?limit=4&q=page-').get_json()
+    second = client.get(f'/api/admin/users?limit=4&q=page-&cursor={first["next_cursor"]}').get_json()
+    assert [u['username'] for u in first['users'] + second['users']] == [f'page-{i}' for i in reversed(range(7))]
+    assert second['next_cursor'] is None
+    assert client.get('/api/admin/users?cursor=@@').status_code == 400
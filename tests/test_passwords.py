@@ -0,0 +1,106 @@
+"""scrypt hashes, legacy plaintext values and the verification cache"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import database
+from conftest import ROOT
+from passwords import PasswordHasher, parse
+
+# Low cost: these tests check the format and the flow, not the strength
+FAST = dict(n=2 ** 10, r=8, p=1, processes=0)
+
+
+def test_hash_round_trip():
+    hasher = PasswordHasher(**FAST)
+    stored = hasher.hash("hunter2")
+
+    assert stored.startswith("scrypt$1024$8$1$")
+    assert stored != hasher.hash("hunter2")
+    assert hasher.verify("hunter2", stored)
+    assert not hasher.verify("hunter3", stored)
+    assert not hasher.verify("", stored) and not hasher.verify("hunter2", None)
+    assert not hasher.needs_rehash(stored)
+
+
+def test_legacy_plaintext_is_accepted_and_flagged():
+    hasher = PasswordHasher(**FAST)
+
+    assert parse("hunter2") is None and parse("scrypt$x$8$1$a$b") is None
+    assert hasher.verify("hunter2", "hunter2")
+    assert not hasher.verify("hunter", "hunter2")
+    assert hasher.needs_rehash("hunter2")
+
+
+def test_raised_cost_needs_rehash_but_old_hashes_still_verify():
+    stored = PasswordHasher(**FAST).hash("hunter2")
+    stronger = PasswordHasher(**dict(FAST, n=2 ** 11))
+
+    assert stronger.verify("hunter2", stored)
+    assert stronger.needs_rehash(stored)
+
+
+def test_only_successful_verifications_are_cached():
+    hasher = PasswordHasher(**FAST)
+    stored = hasher.hash("hunter2")
+
+    assert not hasher.verify("wrong", stored) and not hasher.verify("wrong", stored)
+    assert hasher.stats()["cache_hits"] == 0
+
+    assert hasher.verify("hunter2", stored) and hasher.verify("hunter2", stored)
+    assert hasher.stats()["cache_hits"] == 1
+    # A new hash of the same password is a different entry
+    assert hasher.verify("hunter2", hasher.hash("hunter2"))
+    assert hasher.stats()["cache_hits"] == 1
+
+
+def test_expired_and_disabled_cache():
+    stored = PasswordHasher(**FAST).hash("hunter2")
+    for hasher in (PasswordHasher(**FAST, cache_ttl=0), PasswordHasher(**FAST, cache_ttl=-1)):
+        hasher.verify("hunter2", stored)
+        hasher.verify("hunter2", stored)
+        assert hasher.stats()["cache_hits"] == 0 and hasher.stats()["cached"] == 0
+
+
+def test_process_pool():
+    hasher = PasswordHasher(**dict(FAST, processes=1))
+    try:
+        assert hasher.verify("hunter2", hasher.hash("hunter2"))
+    finally:
+        hasher.shutdown()
+
+
+LOGIN = """
+import app
+client = app.app.test_client()
+client.post("/user/login", data={"username": "legacy-login", "password": "hunter2"})
+app.shutdown()
+"""
+
+
+def test_login_replaces_a_plaintext_password():
+    pytest.importorskip("cryptography")
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("DELETE FROM users WHERE username = 'legacy-login'")
+        conn.execute("INSERT INTO users (username, email, password) "
+                     "VALUES ('legacy-login', 'legacy@passwords.test', 'hunter2')")
+
+    # Own interpreter: auth-service's app and database modules share their
+    # names with the control panel's
+    env = dict(os.environ, PASSWORD_HASH_PROCESSES="0", PASSWORD_SCRYPT_N="1024",
+               CONTROL_PANEL_URL="http://127.0.0.1:9", CONTROL_PANEL_RETRIES="0",
+               PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "shared"), os.path.join(ROOT, "auth-service")]
+                                          + sys.path))
+    result = subprocess.run([sys.executable, "-c", LOGIN], cwd=os.path.join(ROOT, "auth-service"),
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+    conn = sqlite3.connect(os.environ["DB_PATH"])
+    stored = conn.execute("SELECT password FROM users WHERE username = 'legacy-login'").fetchone()[0]
+    assert stored.startswith("scrypt$1024$")
+    assert PasswordHasher(**FAST).verify("hunter2", stored)
@@ -0,0 +1,87 @@
+"""A stopped container's port is not served again from the containers table"""
+
+import pytest
+
+import database
+from port_resolver import PortResolver
+
+
+@pytest.fixture
+def resolver():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, email, password) VALUES ('bob', 'b@example.com', 'x')")
+        conn.execute("DELETE FROM containers WHERE container_name = 'user-bob'")
+        conn.execute('''
+            INSERT INTO containers (user_id, container_id, container_name, port, status)
+            SELECT id, 'c0ffee', 'user-bob', 32768, 'running' FROM users WHERE username = 'bob'
+        ''')
+    return PortResolver(None)
+
+
+def _row():
+    return database.get_container_ports(['user-bob'])['user-bob']
+
+
+@pytest.mark.parametrize("action", ["die", "stop", "kill", "destroy"])
+def test_lookup_after_stop_event_does_not_return_old_port(resolver, action):
+    assert resolver.lookup(['bob']) == ({'bob': '32768'}, [])
+
+    resolver.on_container_event(action, {'id': 'c0ffee', 'name': 'user-bob', 'status': 'exited', 'port': None})
+
+    result, stale = resolver.lookup(['bob'])
+    assert 'bob' not in result and stale == ['bob']
+    assert _row() == {'port': None, 'status': 'stopped'}
+
+
+def test_restart_event_serves_the_new_port(resolver):
+    resolver.on_container_event('die', {'id': 'c0ffee', 'name': 'user-bob', 'status': 'exited', 'port': None})
+    resolver.on_container_event('start', {'id': 'c0ffee', 'name': 'user-bob', 'status': 'running', 'port': '32790'})
+
+    resolver.invalidate('user-bob')
+    assert resolver.lookup(['bob']) == ({'bob': '32790'}, [])
+    assert _row() == {'port': 32790, 'status': 'running'}
+
+
+def test_unreachable_docker_keeps_the_row(resolver):
+    assert resolver.remember('user-bob', {}) is None
+    assert _row() == {'port': 32768, 'status': 'running'}
+
+
+class _Inventory:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def list(self):
+        return self.entries
+
+
+def test_resync_marks_a_container_missing_from_docker_stopped(resolver):
+    assert resolver.lookup(['bob']) == ({'bob': '32768'}, [])
+    resolver.inventory = _Inventory([{'id': 'f00', 'name': 'warm-1', 'status': 'running', 'port': '40000'}])
+
+    resolver.on_container_event('resync', None)
+
+    assert resolver.lookup(['bob']) == ({}, ['bob'])
+    assert _row() == {'port': None, 'status': 'stopped'}
+
+
+def test_resync_stores_the_port_docker_reports(resolver):
+    resolver.inventory = _Inventory([{'id': 'c0ffee', 'name': 'user-bob', 'status': 'running', 'port': '32801'}])
+
+    resolver.on_container_event('resync', None)
+
+    assert resolver.lookup(['bob']) == ({'bob': '32801'}, [])
+    assert _row() == {'port': 32801, 'status': 'running'}
+
+
+def test_delete_route_drops_the_port(resolver, monkeypatch):
+    import app as control_panel
+
+    monkeypatch.setattr(control_panel, "port_resolver", resolver)
+    assert resolver.lookup(['bob']) == ({'bob': '32768'}, [])
+
+    assert control_panel.app.test_client().delete("/api/user/bob").status_code == 200
+
+    assert resolver.lookup(['bob']) == ({}, ['bob'])
+    assert _row() == {'port': None, 'status': 'stopped'}
@@ -0,0 +1,38 @@
+"""The hot queries, as their functions run them, keep using their indexes"""
+
+import pytest
+
+import database
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    database.init_db()
+
+
+def _failed(failures):
+    return {failure["query"] for failure in failures}
+
+
+def test_hot_query_plans():
+    assert database.check_query_plans() == []
+
+
+def test_missing_index_is_reported():
+    with database.pool.transaction() as conn:
+        conn.execute("DROP INDEX idx_containers_name")
+    try:
+        assert {"get_container_by_name", "get_container_ports"} <= _failed(database.check_query_plans())
+    finally:
+        with database.pool.transaction() as conn:
+            conn.execute("CREATE INDEX idx_containers_name ON containers(container_name, port, status)")
+
+
+def test_changed_query_is_checked_as_it_runs(monkeypatch):
+    def get_user_containers(user_id):
+        # Sorts on a column no index covers
+        return database.get_db().execute(
+            "SELECT id FROM containers WHERE user_id = ? ORDER BY last_started DESC", (user_id,)).fetchall()
+
+    monkeypatch.setattr(database, "get_user_containers", get_user_containers)
+    assert _failed(database.check_query_plans()) == {"get_user_containers"}
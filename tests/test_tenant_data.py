@@ -0,0 +1,88 @@
+"""user-app reads its own container's data read-only and at most once per TTL"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import database
+import tenant_data
+from metric_store import utc_timestamp
+
+
+@pytest.fixture(autouse=True)
+def tenant():
+    database.init_db()
+    with database.pool.transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO users (username, email, password) VALUES ('tenant', 't@tenant.test', 'x')")
+        conn.execute("DELETE FROM containers WHERE container_name = 'user-tenant'")
+        cur = conn.execute('''
+            INSERT INTO containers (user_id, container_id, container_name, port, status)
+            SELECT id, 'ten', 'user-tenant', 32900, 'running' FROM users WHERE username = 'tenant'
+        ''')
+        conn.execute('DELETE FROM metrics WHERE container_id = ?', (cur.lastrowid,))
+        conn.execute("DELETE FROM activity_logs WHERE details LIKE 'tenant:%' OR action = 'tenant_login'")
+    tenant_data.cache._values.clear()
+    return cur.lastrowid
+
+
+def test_cache_loads_once_per_key_within_the_ttl():
+    cache = tenant_data.TTLCache(ttl=0.2)
+    loads = []
+
+    def slow_loader():
+        time.sleep(0.05)
+        loads.append(1)
+        return len(loads)
+
+    threads = [threading.Thread(target=cache.get, args=("k", slow_loader)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == [1]
+    assert cache.get("k", slow_loader) == 1
+
+    time.sleep(0.25)
+    assert cache.get("k", slow_loader) == 2
+
+
+def test_metrics_summarise_the_container_samples(tenant):
+    database.store_metrics([
+        {'container_id': tenant, 'cpu_percent': cpu, 'memory_percent': 50, 'timestamp': utc_timestamp(seconds_ago=ago)}
+        for ago, cpu in ((30, 10), (20, 20), (10, 60))
+    ])
+
+    metrics = tenant_data.get_metrics('tenant')
+
+    assert len(metrics['days']) == 1
+    assert (metrics['cpu_avg'], metrics['cpu_max'], metrics['memory_avg']) == (30.0, 60.0, 50.0)
+    assert tenant_data.get_container('tenant')['port'] == 32900
+    assert tenant_data.get_metrics('nobody')['days'] == []
+
+
+def test_reads_are_cached_for_the_ttl(tenant):
+    tenant_data.get_metrics('tenant')
+    database.store_metrics([{'container_id': tenant, 'cpu_percent': 99, 'memory_percent': 1}])
+    assert tenant_data.get_metrics('tenant')['days'] == []
+    assert tenant_data.stats()['cache_hits'] >= 1
+
+
+def test_activity_is_newest_first_with_readable_actions():
+    with database.pool.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO activity_logs (user_id, action, details, timestamp)
+            SELECT id, ?, ?, ? FROM users WHERE username = 'tenant'
+        ''', [('tenant_login', None, '2024-01-01 10:00:00'),
+              ('container_started', 'tenant: started', '2024-01-01 11:00:00')])
+
+    assert tenant_data.get_activity('tenant')[:2] == [
+        {'time': '2024-01-01 11:00:00', 'action': 'tenant: started'},
+        {'time': '2024-01-01 10:00:00', 'action': 'Tenant login'},
+    ]
+
+
+def test_connection_is_read_only():
+    with pytest.raises(sqlite3.OperationalError):
+        tenant_data.pool.acquire().execute("DELETE FROM users")
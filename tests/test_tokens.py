@@ -0,0 +1,85 @@
+"""Tokens that are well formed but hostile are rejected with InvalidToken"""
+
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from tokens import ISSUER, InvalidToken, TokenSigner, TokenVerifier, _b64, _json_b64
+
+KEY = Ed25519PrivateKey.generate()
+KID = "test-key"
+
+
+def _verifier():
+    public = KEY.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    verifier = TokenVerifier(lambda: {KID: _b64(public)}, lambda: [])
+    verifier.refresh()
+    return verifier
+
+
+def _sign(header, claims):
+    """Correctly signed token with arbitrary JSON header and payload"""
+    signing_input = f"{_json_b64(header)}.{_json_b64(claims)}"
+    return f"{signing_input}.{_b64(KEY.sign(signing_input.encode()))}"
+
+
+def _claims(**overrides):
+    now = int(time.time())
+    claims = {"iss": ISSUER, "sub": "alice", "aud": "user-app", "iat": now, "exp": now + 60, "jti": "abc"}
+    claims.update(overrides)
+    return claims
+
+
+HEADER = {"alg": "EdDSA", "kid": KID, "typ": "JWT"}
+
+
+def test_valid_token_is_accepted():
+    assert _verifier().verify(_sign(HEADER, _claims()), "user-app")["sub"] == "alice"
+
+
+@pytest.mark.parametrize("header", [[], "EdDSA", 1, None, {"alg": "EdDSA", "kid": ["x"]}, {"alg": "EdDSA"}])
+def test_malformed_header_is_rejected(header):
+    with pytest.raises(InvalidToken):
+        _verifier().verify(_sign(header, _claims()))
+
+
+@pytest.mark.parametrize("claims", [
+    [],
+    "alice",
+    _claims(exp="x"),
+    _claims(exp=True),
+    _claims(exp=None),
+    _claims(iat=[1]),
+    _claims(iat=False),
+    _claims(nbf="soon"),
+    _claims(sub=["alice"]),
+    _claims(sub=None),
+    _claims(jti={"id": 1}),
+])
+def test_malformed_claims_are_rejected(claims):
+    with pytest.raises(InvalidToken):
+        _verifier().verify(_sign(HEADER, claims), "user-app")
+
+
+def test_not_yet_valid_token_is_rejected():
+    with pytest.raises(InvalidToken):
+        _verifier().verify(_sign(HEADER, _claims(nbf=time.time() + 3600)))
+
+
+@pytest.mark.parametrize("token", ["", "a.b", "a.b.c.d", "!!!.???.***", "e30.e30.e30"])
+def test_garbage_is_rejected(token):
+    with pytest.raises(InvalidToken):
+        _verifier().verify(token)
+
+
+def test_issued_token_round_trips():
+    keys = {}
+    signer = TokenSigner(lambda kid, public, expires_at: keys.update({kid: public}))
+    verifier = TokenVerifier(lambda: dict(keys), lambda: [])
+    token, _ = signer.issue("alice", "user-app")
+    verifier.refresh()
+    assert verifier.verify(token, "user-app")["sub"] == "alice"
@@ -0,0 +1,117 @@
+"""Warm containers are created up to the target and claimed by renaming them to the user"""
+
+import types
+
+import docker
+import pytest
+
+from provisioning import start_user_container
+from warm_pool import RECONFIGURE_SCRIPT, WARM_LABEL, WarmPool
+
+
+class FakeContainer:
+    def __init__(self, daemon, name, options):
+        self.daemon = daemon
+        self.name = name
+        self.options = options
+        self.status = "running"
+        self.execs = []
+
+    def exec_run(self, cmd):
+        self.execs.append(cmd)
+        return (self.daemon.reconfigure_exit if RECONFIGURE_SCRIPT in cmd else 0), b""
+
+    def rename(self, name):
+        if name in self.daemon.by_name or self.daemon.by_name.get(self.name) is not self:
+            raise docker.errors.APIError("conflict")
+        del self.daemon.by_name[self.name]
+        self.name = name
+        self.daemon.by_name[name] = self
+
+    def remove(self, force=False):
+        self.daemon.by_name.pop(self.name, None)
+
+
+class FakeDocker:
+    def __init__(self):
+        self.by_name = {}
+        self.reconfigure_exit = 0
+        self.containers = types.SimpleNamespace(run=self._run, get=self._get)
+        self.api = types.SimpleNamespace(containers=self._list)
+
+    def _run(self, image, name, **options):
+        cont = FakeContainer(self, name, options)
+        self.by_name[name] = cont
+        return cont
+
+    def _get(self, name):
+        if name not in self.by_name:
+            raise docker.errors.NotFound(name)
+        return self.by_name[name]
+
+    def _list(self, filters=None):
+        return [{"Names": ["/" + name]} for name, cont in self.by_name.items()
+                if cont.options.get("labels", {}).get(WARM_LABEL) == "1"]
+
+
+@pytest.fixture
+def daemon():
+    return FakeDocker()
+
+
+def test_refill_creates_only_the_shortfall(daemon):
+    pool = WarmPool(daemon, "user-app", target_size=3)
+    pool.refill()
+    pool.refill()
+
+    assert len(daemon.by_name) == 3
+    cont = next(iter(daemon.by_name.values()))
+    assert cont.name.startswith("warm-")
+    assert cont.options["environment"]["RECONFIGURE_TOKEN"]
+    assert pool.stats()["created"] == 3 and pool.stats()["available"] == 3
+
+
+def test_claim_renames_and_reconfigures(daemon):
+    pool = WarmPool(daemon, "user-app", target_size=1)
+    pool.refill()
+
+    cont = pool.claim("gina", "g@example.com")
+
+    assert cont.name == "user-gina"
+    assert cont.execs[-1][-2:] == ["gina", "g@example.com"]
+    assert pool.claim("hank", "") is None
+    assert (pool.stats()["claimed"], pool.stats()["available"]) == (1, 0)
+
+
+def test_container_taken_by_another_process_is_skipped(daemon):
+    pool = WarmPool(daemon, "user-app", target_size=2)
+    pool.refill()
+    listed_before = daemon.api.containers()
+    taken = WarmPool(daemon, "user-app", target_size=2).claim("ivan", "")
+    # This process listed the pool before the other one claimed from it
+    daemon.api.containers = lambda filters=None: listed_before
+
+    cont = pool.claim("gina", "")
+
+    assert cont is not None and cont is not taken
+    assert sorted(daemon.by_name) == ["user-gina", "user-ivan"]
+
+
+def test_failed_reconfigure_discards_the_container(daemon):
+    pool = WarmPool(daemon, "user-app", target_size=1)
+    pool.refill()
+    daemon.reconfigure_exit = 1
+
+    assert pool.claim("gina", "") is None
+    assert daemon.by_name == {}
+    assert pool.stats()["claim_failures"] == 1
+
+
+def test_provisioning_falls_back_to_a_cold_start(daemon):
+    pool = WarmPool(daemon, "user-app", target_size=1)
+    pool.refill()
+
+    assert start_user_container(daemon, "gina", "", pool)[1] == "warm"
+    assert start_user_container(daemon, "gina", "", pool)[1] == "existing"
+    cont, path = start_user_container(daemon, "hank", "h@example.com", pool)
+    assert (path, cont.options["environment"]) == ("cold", {"USERNAME": "hank", "EMAIL": "h@example.com"})
@@ -1,13 +1,22 @@
 from flask import Flask, render_template, redirect, request, session
 from datetime import datetime, timedelta
+import hmac
 import os
 import json
 
+import tenant_data
+from metric_store import parse_duration, series_window
+from instrumentation import instrument_app
+from tokens import TokenVerifier, InvalidToken, request_token, register_metrics, USER_AUDIENCE
+
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
 
+# Per-route latency, tenant data timers and GET /metrics (Prometheus)
+instrument_app(app, "user-app")
+
 # ============================================
-# MOCK DATA - Replace with database calls later
+# USER DATA
 # ============================================
 
 USER_DATA = {
@@ -15,33 +24,105 @@ USER_DATA = {
     "email": os.getenv("EMAIL", "user@example.com"),
     "container_id": os.getenv("CONTAINER_ID", "abc123def456"),
     "port": os.getenv("PORT", "8080"),
+    # Defaults until the container row is found in the shared database
     "status": "running",
-    "uptime_days": 7,
-    "created_date": "2024-01-10",
-    "last_started": "Today at 09:00",
+    "uptime_days": 0,
+    "created_date": "-",
+    "last_started": "-",
 }
 
-ACTIVITY_LOG = [
-    {"time": "Today 14:32", "action": "Service restarted"},
-    {"time": "Yesterday 09:15", "action": "Container created successfully"},
-    {"time": "Yesterday 09:10", "action": "User account registered"},
-]
-
-METRICS = {
-    "cpu_avg": 49,
-    "cpu_max": 61,
-    "memory_avg": 39,
-    "memory_max": 51,
-    "uptime_avg": 99.0,
-    "uptime_max": 100,
-}
+def container_info():
+    """USER_DATA overlaid with this container's row from the shared database"""
+    info = dict(USER_DATA)
+    row = tenant_data.get_container(info["username"])
+    if row:
+        created = datetime.strptime(row["created_at"], "%Y-%m-%d %H:%M:%S")
+        info.update(
+            container_id=row["container_id"],
+            port=str(row["port"] or info["port"]),
+            status=row["status"] or info["status"],
+            uptime_days=(datetime.utcnow() - created).days,
+            created_date=created.strftime("%Y-%m-%d"),
+            last_started=row["last_started"] or "-",
+        )
+    return info
 
-HEALTH_STATUS = {
-    "service": {"label": "Service Status", "status": "healthy", "text": "✓ Healthy"},
-    "cpu": {"label": "CPU Load", "status": "warning", "text": "⚠ Normal"},
-    "memory": {"label": "Memory Usage", "status": "healthy", "text": "✓ Good"},
-    "connectivity": {"label": "Connectivity", "status": "healthy", "text": "✓ Connected"},
-}
+def health_status(info, metrics):
+    """Health cards derived from the container status and last week's metrics"""
+    def level(value, warn, text_ok, text_warn):
+        if value >= warn:
+            return "warning", f"⚠ {text_warn}"
+        return "healthy", f"✓ {text_ok}"
+
+    running = info["status"] == "running"
+    cpu_status, cpu_text = level(metrics["cpu_avg"], 80, "Normal", "High")
+    memory_status, memory_text = level(metrics["memory_avg"], 85, "Good", "High")
+    return {
+        "service": {"label": "Service Status", "status": "healthy" if running else "warning",
+                    "text": "✓ Healthy" if running else f"⚠ {info['status'].capitalize()}"},
+        "cpu": {"label": "CPU Load", "status": cpu_status, "text": cpu_text},
+        "memory": {"label": "Memory Usage", "status": memory_status, "text": memory_text},
+        "connectivity": {"label": "Connectivity", "status": "healthy", "text": "✓ Connected"},
+    }
+
+# ============================================
+# IDENTITY (WARM-POOL CONTAINERS)
+# ============================================
+
+# Warm-pool containers start without a user and are bound to one later
+# through /internal/reconfigure; the identity is kept on disk so it
+# survives restarts and is seen by every worker process.
+IDENTITY_FILE = os.getenv("IDENTITY_FILE", "/app/identity.json")
+_identity_mtime = None
+
+def load_identity():
+    """Apply the identity file to USER_DATA if it changed"""
+    global _identity_mtime
+    try:
+        mtime = os.stat(IDENTITY_FILE).st_mtime
+    except FileNotFoundError:
+        return
+    if mtime == _identity_mtime:
+        return
+    with open(IDENTITY_FILE) as f:
+        identity = json.load(f)
+    USER_DATA["username"] = identity.get("username", USER_DATA["username"])
+    USER_DATA["email"] = identity.get("email", USER_DATA["email"])
+    _identity_mtime = mtime
+
+@app.before_request
+def refresh_identity():
+    load_identity()
+
+# ============================================
+# AUTHENTICATION
+# ============================================
+
+# Pages need the token auth-service sets at login, for this container's
+# user; it is checked locally against the public keys and deny list
+# polled from the shared database (TOKEN_AUTH=0 disables the check)
+TOKEN_AUTH = os.getenv("TOKEN_AUTH", "1") == "1"
+AUTH_URL = os.getenv("AUTH_URL", "http://localhost:5000")
+# Readiness probe, localhost-only reconfiguration and scraping stay open
+PUBLIC_PATHS = ("/api/status", "/internal/", "/metrics", "/static/")
+
+token_verifier = TokenVerifier(tenant_data.get_token_keys, tenant_data.get_token_denylist,
+                               poll_interval=float(os.getenv("TOKEN_POLL_INTERVAL", "5")))
+register_metrics(token_verifier)
+
+@app.before_request
+def require_token():
+    if not TOKEN_AUTH or request.path.startswith(PUBLIC_PATHS):
+        return None
+    try:
+        claims = token_verifier.verify(request_token(request), USER_AUDIENCE)
+    except InvalidToken:
+        claims = None
+    if claims is not None and claims["sub"] == USER_DATA["username"]:
+        return None
+    if request.path.startswith("/api/"):
+        return {"error": "authentication required"}, 401
+    return redirect(f"{AUTH_URL}/user/login")
 
 # ============================================
 # ROUTES
@@ -50,34 +131,37 @@ HEALTH_STATUS = {
 @app.route("/")
 def dashboard():
     """Main dashboard page with comprehensive user data"""
-    
+    info = container_info()
+    metrics = tenant_data.get_metrics(info["username"])
+
     context = {
         # User information
-        "username": USER_DATA["username"],
-        "email": USER_DATA["email"],
-        "container_id": USER_DATA["container_id"],
-        "port": USER_DATA["port"],
+        "username": info["username"],
+        "email": info["email"],
+        "container_id": info["container_id"],
+        "port": info["port"],
         
         # Status information
-        "container_status": USER_DATA["status"].capitalize(),
-        "uptime_days": USER_DATA["uptime_days"],
-        "created_date": USER_DATA["created_date"],
-        "last_started": USER_DATA["last_started"],
+        "container_status": info["status"].capitalize(),
+        "uptime_days": info["uptime_days"],
+        "created_date": info["created_date"],
+        "last_started": info["last_started"],
         "last_update": "Now",
         
         # Metrics
-        "cpu_avg": METRICS["cpu_avg"],
-        "cpu_max": METRICS["cpu_max"],
-        "memory_avg": METRICS["memory_avg"],
-        "memory_max": METRICS["memory_max"],
-        "uptime_avg": METRICS["uptime_avg"],
-        "uptime_max": METRICS["uptime_max"],
+        "metrics_days": metrics["days"],
+        "cpu_avg": metrics["cpu_avg"],
+        "cpu_max": metrics["cpu_max"],
+        "memory_avg": metrics["memory_avg"],
+        "memory_max": metrics["memory_max"],
+        "uptime_avg": metrics["uptime_avg"],
+        "uptime_max": metrics["uptime_max"],
         
         # Activity log
-        "activity_log": ACTIVITY_LOG,
+        "activity_log": tenant_data.get_activity(info["username"], limit=10),
         
         # Health status
-        "health_status": HEALTH_STATUS,
+        "health_status": health_status(info, metrics),
     }
     
     return render_template("index.html", **context)
@@ -85,7 +169,7 @@ def dashboard():
 @app.route("/logs")
 def logs():
     """View service logs (redirect placeholder)"""
-    return render_template("logs.html", logs=ACTIVITY_LOG)
+    return render_template("logs.html", logs=tenant_data.get_activity(USER_DATA["username"]))
 
 @app.route("/settings")
 def settings():
@@ -95,7 +179,7 @@ def settings():
 @app.route("/activity")
 def activity():
     """Full activity history"""
-    return render_template("activity.html", activity_log=ACTIVITY_LOG)
+    return render_template("activity.html", activity_log=tenant_data.get_activity(USER_DATA["username"]))
 
 @app.route("/help")
 def help():
@@ -104,17 +188,18 @@ def help():
 
 @app.route("/logout")
 def logout():
-    """Logout user and redirect to auth service"""
+    """Logout user and redirect to auth service, which revokes the token"""
     session.clear()
-    return redirect("http://localhost:5000/user/login")
+    return redirect(f"{AUTH_URL}/user/logout")
 
 @app.route("/api/status")
 def api_status():
     """API endpoint for service status"""
+    info = container_info()
     return {
-        "status": USER_DATA["status"],
-        "uptime_days": USER_DATA["uptime_days"],
-        "port": USER_DATA["port"],
+        "status": info["status"],
+        "uptime_days": info["uptime_days"],
+        "port": info["port"],
         "timestamp": datetime.now().isoformat(),
     }
 
@@ -129,22 +214,62 @@ def api_restart():
 
 @app.route("/api/metrics")
 def api_metrics():
-    """API endpoint for metrics data"""
+    """API endpoint for metrics data (last 7 days, cached for DATA_CACHE_TTL seconds)"""
+    metrics = tenant_data.get_metrics(USER_DATA["username"])
     return {
         "cpu": {
-            "average": METRICS["cpu_avg"],
-            "max": METRICS["cpu_max"],
+            "average": metrics["cpu_avg"],
+            "max": metrics["cpu_max"],
         },
         "memory": {
-            "average": METRICS["memory_avg"],
-            "max": METRICS["memory_max"],
+            "average": metrics["memory_avg"],
+            "max": metrics["memory_max"],
         },
         "uptime": {
-            "average": METRICS["uptime_avg"],
-            "max": METRICS["uptime_max"],
+            "average": metrics["uptime_avg"],
+            "max": metrics["uptime_max"],
         },
+        "days": metrics["days"],
     }
 
+@app.route("/api/metrics/series")
+def api_metrics_series():
+    """Bucketed CPU/memory series as columns (?range=24h&step=10m&aggregates=avg,max,p95)"""
+    try:
+        window = parse_duration(request.args.get("range", "24h"))
+        step = request.args.get("step")
+        since, until, step = series_window(window, parse_duration(step) if step else None)
+    except ValueError:
+        return {"error": "range and step must be durations like 90, 15m, 24h or 7d"}, 400
+    aggregates = tuple(a for a in request.args.get("aggregates", "avg,max").split(",") if a)
+    try:
+        series = tenant_data.get_series(USER_DATA["username"], since, until, step, aggregates)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if series is None:
+        return {"error": "no metrics for this container yet"}, 404
+    return series
+
+@app.route("/internal/reconfigure", methods=["POST"])
+def internal_reconfigure():
+    """Bind a warm-pool container to a user (called from inside the container)"""
+    token = os.getenv("RECONFIGURE_TOKEN", "")
+    supplied = request.headers.get("X-Reconfigure-Token", "")
+    if not token or request.remote_addr not in ("127.0.0.1", "::1") \
+            or not hmac.compare_digest(supplied, token):
+        return {"error": "forbidden"}, 403
+
+    data = request.get_json(silent=True) or {}
+    if not data.get("username"):
+        return {"error": "username is required"}, 400
+
+    tmp_path = IDENTITY_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"username": data["username"], "email": data.get("email", "")}, f)
+    os.replace(tmp_path, IDENTITY_FILE)
+    load_identity()
+    return {"success": True, "username": USER_DATA["username"]}
+
 # ============================================
 # ERROR HANDLERS
 # ============================================
@@ -180,6 +305,13 @@ def inject_user():
 # STARTUP
 # ============================================
 
+def create_app():
+    """App factory for gunicorn ("app:create_app()"), run in each worker"""
+    load_identity()
+    if TOKEN_AUTH:
+        token_verifier.start()
+    return app
+
 if __name__ == "__main__":
     print("=" * 50)
     print("🚀 User Dashboard Service Starting")
@@ -191,4 +323,4 @@ if __name__ == "__main__":
     
     # Development mode - change to False for production
     debug_mode = os.getenv("FLASK_ENV", "production") == "development"
-    app.run(host="0.0.0.0", port=80, debug=debug_mode)
+    create_app().run(host="0.0.0.0", port=80, debug=debug_mode)
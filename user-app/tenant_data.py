@@ -0,0 +1,258 @@
+"""
+User Dashboard - Tenant Data
+This container's own container row, metrics and activity, read from the
+shared database over a read-only connection and cached for a few seconds
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+from db_pool import ConnectionPool
+from instrumentation import instrument_functions, register_pool
+from metric_store import pick_metric_resolution, metric_source, metric_series, rollup_watermarks, utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("DB_PATH", os.path.join("/data", "saas_control_panel.db"))
+
+# immutable=1 skips all locking and change detection: only for a database
+# file that cannot change while it is open (e.g. a snapshot), never for the
+# live shared file
+DB_IMMUTABLE = os.getenv("DB_IMMUTABLE", "0") == "1"
+
+# Seconds between database reads per (kind, user), with +/-10% jitter so
+# containers started together do not refresh in lockstep
+CACHE_TTL = float(os.getenv("DATA_CACHE_TTL", "10"))
+
+# Must match the control panel's collector interval (uptime = sampled share)
+COLLECTOR_INTERVAL = float(os.getenv("COLLECTOR_INTERVAL", "10"))
+
+METRICS_DAYS = 7
+
+pool = ConnectionPool(
+    f"file:{quote(DB_PATH)}?mode=ro" + ("&immutable=1" if DB_IMMUTABLE else ""),
+    pragmas={
+        # Read-only: never try to switch the journal mode or sync settings
+        "journal_mode": None,
+        "synchronous": None,
+        "query_only": "ON",
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-2048")),
+    },
+    uri=True
+)
+
+
+# ============================================
+# CACHE
+# ============================================
+
+class TTLCache:
+    """Tiny per-process cache; one loader call per key at a time"""
+
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        item = self._values.get(key)
+        if item and item[0] > now:
+            self.hits += 1
+            return item[1]
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have loaded it while we waited
+            item = self._values.get(key)
+            if item and item[0] > time.monotonic():
+                self.hits += 1
+                return item[1]
+            value = loader()
+            self.loads += 1
+            ttl = self.ttl * random.uniform(0.9, 1.1)
+            self._values[key] = (time.monotonic() + ttl, value)
+            if len(self._values) > self.max_entries:
+                self._prune()
+            return value
+
+    def _prune(self):
+        """Drop expired entries (series keys vary with range and step)"""
+        now = time.monotonic()
+        with self._lock:
+            for key, item in list(self._values.items()):
+                if item[0] <= now:
+                    self._values.pop(key, None)
+                    self._locks.pop(key, None)
+
+
+cache = TTLCache(CACHE_TTL)
+
+
+def _cached(kind, username, loader, default):
+    def load():
+        try:
+            return loader(pool.acquire())
+        except sqlite3.Error:
+            # Database not mounted or not created yet: show empty data
+            logger.warning("Could not read %s for %s", kind, username, exc_info=True)
+            return default
+    return cache.get((kind, username), load)
+
+
+# ============================================
+# QUERIES
+# ============================================
+
+def _container_row(conn, username):
+    row = conn.execute('''
+        SELECT id, container_id, port, status, created_at, last_started
+        FROM containers
+        WHERE container_name = ?
+        ORDER BY id DESC
+        LIMIT 1
+    ''', (f"user-{username}",)).fetchone()
+    return dict(row) if row else None
+
+
+def get_container(username):
+    """The user's containers row, or None"""
+    return _cached("container", username, lambda conn: _container_row(conn, username), None)
+
+
+def _metrics(conn, username):
+    container = _container_row(conn, username)
+    if not container:
+        return None
+    window = METRICS_DAYS * 86400
+    source, params = metric_source(
+        pick_metric_resolution(window, min_points=24),
+        container["id"], utc_timestamp(window), rollup_watermarks(conn)
+    )
+    rows = conn.execute(f'''
+        SELECT
+            substr(ts, 1, 10) AS day,
+            SUM(cpu_avg * samples) / SUM(CASE WHEN cpu_avg IS NOT NULL THEN samples END) AS cpu_avg,
+            MAX(cpu_max) AS cpu_max,
+            SUM(memory_avg * samples) / SUM(CASE WHEN memory_avg IS NOT NULL THEN samples END) AS memory_avg,
+            MAX(memory_max) AS memory_max,
+            SUM(samples) AS samples
+        FROM ({source})
+        GROUP BY day
+        ORDER BY day
+    ''', params).fetchall()
+
+    # The first and last day of the window are partial
+    now = time.time()
+    first_day = utc_timestamp(window)[:10]
+    today = utc_timestamp()[:10]
+    days = []
+    for row in rows:
+        if row["day"] == today:
+            span = now % 86400 or 1
+        elif row["day"] == first_day:
+            span = 86400 - (now - window) % 86400
+        else:
+            span = 86400
+        days.append({
+            "day": row["day"],
+            "cpu_avg": round(row["cpu_avg"] or 0, 1),
+            "cpu_max": round(row["cpu_max"] or 0, 1),
+            "memory_avg": round(row["memory_avg"] or 0, 1),
+            "memory_max": round(row["memory_max"] or 0, 1),
+            # Share of collector intervals in which the container was running
+            "uptime": round(min(row["samples"] * COLLECTOR_INTERVAL / span * 100, 100.0), 1),
+        })
+    return days
+
+
+def get_metrics(username):
+    """Per-day metrics over the last week plus their summary"""
+    days = _cached("metrics", username, lambda conn: _metrics(conn, username), None) or []
+
+    def avg(key):
+        return round(sum(d[key] for d in days) / len(days), 1) if days else 0
+
+    def peak(key):
+        return max((d[key] for d in days), default=0)
+
+    return {
+        "days": days,
+        "cpu_avg": avg("cpu_avg"),
+        "cpu_max": peak("cpu_max"),
+        "memory_avg": avg("memory_avg"),
+        "memory_max": peak("memory_max"),
+        "uptime_avg": avg("uptime"),
+        "uptime_max": peak("uptime"),
+    }
+
+
+def _series(conn, username, since, until, step, aggregates):
+    container = _container_row(conn, username)
+    if not container:
+        return None
+    return metric_series(conn, container["id"], since, until, step, aggregates)
+
+
+def get_series(username, since, until, step, aggregates):
+    """Bucketed CPU/memory columns for the user's container, or None"""
+    key = f"series:{since}:{until}:{step}:{','.join(aggregates)}"
+    return _cached(key, username, lambda conn: _series(conn, username, since, until, step, aggregates), None)
+
+
+def _activity(conn, username, limit):
+    rows = conn.execute('''
+        SELECT al.timestamp, al.action, al.details
+        FROM activity_logs al
+        JOIN users u ON al.user_id = u.id
+        WHERE u.username = ?
+        ORDER BY al.timestamp DESC, al.id DESC
+        LIMIT ?
+    ''', (username, limit)).fetchall()
+    return [
+        {"time": row["timestamp"], "action": row["details"] or row["action"].replace("_", " ").capitalize()}
+        for row in rows
+    ]
+
+
+def get_activity(username, limit=50):
+    """The user's most recent activity, newest first"""
+    return _cached(f"activity:{limit}", username, lambda conn: _activity(conn, username, limit), [])
+
+
+# ============================================
+# TOKEN KEYS AND DENY LIST
+# ============================================
+
+# Polled by the token verifier itself, so not cached here
+
+def get_token_keys():
+    """{kid: public key} of auth-service's token signing keys still in use"""
+    rows = pool.acquire().execute(
+        "SELECT kid, public_key FROM token_keys WHERE expires_at > ?", (time.time(),)).fetchall()
+    return {row["kid"]: row["public_key"] for row in rows}
+
+
+def get_token_denylist():
+    """Revoked tokens and subjects whose tokens may still be unexpired"""
+    rows = pool.acquire().execute(
+        "SELECT jti, subject, revoked_at FROM token_denylist WHERE expires_at > ?", (time.time(),)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def stats():
+    return {"cache_hits": cache.hits, "cache_loads": cache.loads, "ttl_seconds": cache.ttl}
+
+
+# Time the reads the routes make, cache hits included (db_call_duration_seconds)
+register_pool(pool, "user-app")
+instrument_functions(globals(), names=("get_container", "get_metrics", "get_series", "get_activity"))